@@ -1,26 +1,38 @@
 # Import the module containing functions for creating the database schema
-import os
-from dotenv import load_dotenv
+import database
 import datamodel
+import migrate
+import partition
+import rollup
 
-# Set the .env file path based on the environment
+# Choose the database server
 server = "aws" # aws or local
-if server == "aws":
-  env_file_path = "credentials/.env.aws"
-else:
-  env_file_path = "credentials/.env.local"
 
-# Load the environment variables from the path
-load_dotenv(env_file_path)
+# Get the shared engine of the server (credentials are read from credentials/.env.<server>)
+engine = database.get_engine(server)
+
+# Choose how to bring the database to the data model
+mode = "migrate" # migrate or recreate
+dry_run = False # only print the migration statements
+
+# Partition point_of_interest, cell_site and transmission_node by country
+# (drops the foreign keys on these tables, which MySQL does not support on partitioned tables;
+# refused while they have their spatial geom columns, which partitioned tables cannot hold either)
+partition_by_country = False
 
-# Get environment variables
-db_name = os.getenv("DB_NAME")
-db_user = os.getenv("DB_USER")
-db_password = os.getenv("DB_PASSWORD")
-db_host = os.getenv("DB_HOST")
-db_port = os.getenv("DB_PORT")
+# Fill the admin rollup tables from the data already loaded (ingest and delete keep them up to date afterwards)
+rebuild_rollups = False
+
+if mode == "migrate":
+  # Apply only the missing tables, columns and indexes, keeping the data in place
+  migrate.migrate_data_model(engine, dry_run=dry_run)
+else:
+  # Create the data model for the database.
+  # WARNING: This step will delete all the tables and data previously contained in the database
+  datamodel.create_data_model(engine)
 
-# Create the data model for the database.
-# WARNING: This step will delete all the tables and data previously contained in the database
+if partition_by_country and not dry_run:
+  partition.partition_by_country(engine)
 
-datamodel.create_data_model(db_name, db_user, db_password, db_host, db_port)
+if rebuild_rollups and not dry_run:
+  rollup.rebuild_rollups(engine)
@@ -1,47 +1,44 @@
 # Import packages
 import os
-import pandas as pd
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine, inspect
-from dotenv import load_dotenv
+import glob
+from sqlalchemy import inspect
+import database
+import pipeline
+import instrumentation
+import mobile_coverage
+import tiles
 
-# Set the .env file path based on the environment
+# Choose the database server (credentials are read from credentials/.env.<server>)
 server = "aws" # aws or local
-if server == "aws":
-  env_file_path = "credentials/.env.aws"
-else:
-  env_file_path = "credentials/.env.local"
-
-# Load the environment variables from the path
-load_dotenv(env_file_path)
-
-# Get environment variables
-db_name = os.getenv("DB_NAME")
-db_user = os.getenv("DB_USER")
-db_password = os.getenv("DB_PASSWORD")
-db_host = os.getenv("DB_HOST")
-db_port = os.getenv("DB_PORT")
-
-# Define the data types and filenames
-data_info = {
-    "pointofinterest": "ESP-1697915895-xs2u-pointofinterest.csv",
-    "cellsite": "ESP-1697916284-6wv8-cellsite.csv",
-    "transmissionnode": "ESP-1697916384-1icf-transmissionnode.csv"
-}
-
-# Create a dictionary to hold the data
-data_dict = {}
-
-# Loop through the data_info dictionary and read each CSV file
-for data_type, filename in data_info.items():
-    filepath = os.path.join(os.getcwd(), "data", "ESP", "processed", data_type, filename)
-    data_dict[data_type] = pd.read_csv(filepath)
-
-# Database URL
-db_url = f"mysql+mysqlconnector://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-
-# Create an engine to access the database
-engine = create_engine(db_url, echo=False)
+
+# Countries to load from data/<country>/processed and data/<country>/output (None loads every country found)
+countries = None
+
+# Number of rows streamed and committed per batch
+batch_size = 50000
+
+# Maximum number of datasets loaded concurrently (each load uses one database connection)
+max_connections = 4
+
+# Ingest mode: "full" appends every row, "incremental" only writes new and changed rows
+# (and deletes rows missing from the file if delete_missing is True)
+ingest_mode = "full" # full or incremental
+delete_missing = False
+
+# Load the coverage contours of data/<country>/processed/mobilecoverage/*.gpkg and flag the covered POIs
+load_coverage = False
+
+# Directory of the vector tile pyramids to update after the load (None to skip, see tiles.build_tiles)
+tiles_dir = None # e.g. "tiles"
+
+# Record statement and stage latencies, and write them to this file (None to disable)
+instrumentation_path = None # e.g. "ingest-metrics.json" (use a .prom extension for Prometheus text)
+
+# Database URL, used by the loader worker processes
+db_url = database.database_url(database.load_settings(server))
+
+# Get the shared engine to access the database
+engine = database.get_engine(server)
 
 # Show the tables in the database
 inspector = inspect(engine)
@@ -50,32 +47,40 @@ print("Tables in the database:")
 for table in tables:
     print(table)
 
-# Create a session
-Session = sessionmaker(bind=engine)
-session = Session()
-
-# Use pandas.to_sql for bulk insertion
-
-    # POI data
-try:
-    data_dict["pointofinterest"].to_sql("point_of_interest", engine, index=False, if_exists='append')
-    print("POI data added to the database.")
-except Exception as e:
-    print("Error:", e)
-
-    # Cell site data
-try:
-    data_dict["cellsite"].to_sql("cell_site", engine, index=False, if_exists='append')
-    print("Cell site data added to the database.")
-except Exception as e:
-    print("Error:", e)
-
-    # Transmission node data
-try:
-    data_dict["transmissionnode"].to_sql("transmission_node", engine, index=False, if_exists='append')
-    print("Transmission node data added to the database.")
-except Exception as e:
-    print("Error:", e)
-
-# Commit the changes
-session.commit()
\ No newline at end of file
+# Load every dataset, the results of a country after its POIs and infrastructure, running independent loads in parallel
+if __name__ == "__main__":
+    if instrumentation_path is not None:
+        instrumentation.enable()
+
+    results = pipeline.run_pipeline(db_url, os.path.join(os.getcwd(), "data"), countries=countries,
+                                    max_connections=max_connections, mode=ingest_mode,
+                                    batch_size=batch_size, delete_missing=delete_missing)
+    for result in results:
+        if "error" in result:
+            print(f"Error: {result['filepath']} ({result['error']})")
+        else:
+            print(f"{result['filepath']} added to the database.")
+
+    # Coverage contours are loaded after the POIs they are tested against
+    if load_coverage:
+        for filepath in sorted(glob.glob(os.path.join(os.getcwd(), "data", "*", "processed", "mobilecoverage", "*.gpkg"))):
+            country_code = os.path.basename(os.path.dirname(os.path.dirname(os.path.dirname(filepath))))
+            if countries is not None and country_code not in countries:
+                continue
+            mobile_coverage.load_coverage_gpkg(engine, filepath)
+            mobile_coverage.classify_coverage(engine, country_code=country_code)
+            print(f"{filepath} added to the database.")
+
+    # Rewrite the map tiles touched by the load
+    if tiles_dir is not None:
+        tiles.update_tiles(engine, tiles_dir)
+
+    # Show where the time went and export the metrics
+    if instrumentation_path is not None:
+        instrumentation.print_report()
+        if instrumentation_path.endswith(".prom"):
+            with open(instrumentation_path, "w") as file:
+                file.write(instrumentation.to_prometheus())
+        else:
+            instrumentation.to_json(instrumentation_path, engine)
+        print(f"Instrumentation metrics written to {instrumentation_path}")
@@ -1,40 +1,30 @@
 # Import packages
-import os
-import pandas as pd
-from mysql import connector
-from dotenv import load_dotenv
+import database
+import delete
+import tiles
 
-# Set the .env file path based on the environment
+# Choose the database server (credentials are read from credentials/.env.<server>)
 server = "aws" # aws or local
-if server == "aws":
-  env_file_path = "credentials/.env.aws"
-else:
-  env_file_path = "credentials/.env.local"
 
-# Load the environment variables from the path
-load_dotenv(env_file_path)
+# Get the shared engine to access the database
+engine = database.get_engine(server)
 
-# Get environment variables
-db_name = os.getenv("DB_NAME")
-db_user = os.getenv("DB_USER")
-db_password = os.getenv("DB_PASSWORD")
-db_host = os.getenv("DB_HOST")
-db_port = os.getenv("DB_PORT")
+# Number of rows deleted per chunk and commit (smaller chunks hold locks for less time)
+batch_size = 1000
 
-# Create a connection to the database
-try: 
-    # Connect to existing database
-    with connector.connect(
-            host=db_host,
-            user=db_user,
-            password=db_password,
-            database=db_name
-    ) as existing_database:
-        # Write the SQL query to delete a record
-        # In this example, we are deleting all records from the point_of_interest table where the country_code is 'ESP'
-        drop_record = "DELETE FROM point_of_interest WHERE country_code = 'ESP'"
-        with existing_database.cursor() as cursor:
-            cursor.execute(drop_record)
-            existing_database.commit()
-except connector.Error as e: 
-    print(e)
\ No newline at end of file
+# Directory of the vector tile pyramids to update after the delete (None to skip, see tiles.build_tiles)
+tiles_dir = None # e.g. "tiles"
+
+# Delete a country, a dataset or an analysis together with every row referencing it
+# In this example, we are deleting all POIs, cell sites and transmission nodes where the country_code is 'ESP'
+deleted_rows = delete.delete_data(engine, country_code="ESP", batch_size=batch_size)
+# deleted_rows = delete.delete_data(engine, dataset_id="ESP-1697915895-xs2u", batch_size=batch_size)
+# deleted_rows = delete.delete_data(engine, analysis_id="ESP-1714391188-zq9z", batch_size=batch_size)
+
+# Print the number of rows deleted per table
+for table, rows in deleted_rows.items():
+    print(f"{table}: {rows} rows deleted")
+
+# Rewrite the map tiles touched by the delete
+if tiles_dir is not None:
+    tiles.update_tiles(engine, tiles_dir)
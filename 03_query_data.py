@@ -1,31 +1,14 @@
 # Import packages
-import os
-import pandas as pd
-from sqlalchemy import create_engine, inspect
-from dotenv import load_dotenv
+from sqlalchemy import inspect
+import database
+import query
+import rollup
 
-# Set the .env file path based on the environment
+# Choose the database server (credentials are read from credentials/.env.<server>)
 server = "aws" # aws or local
-if server == "aws":
-  env_file_path = "credentials/.env.aws"
-else:
-  env_file_path = "credentials/.env.local"
 
-# Load the environment variables from the path
-load_dotenv(env_file_path)
-
-# Get environment variables
-db_name = os.getenv("DB_NAME")
-db_user = os.getenv("DB_USER")
-db_password = os.getenv("DB_PASSWORD")
-db_host = os.getenv("DB_HOST")
-db_port = os.getenv("DB_PORT")
-
-# Database URL
-db_url = f"mysql+mysqlconnector://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-
-# Create an engine to access the database
-engine = create_engine(db_url, echo=False)
+# Get the shared engine to access the database
+engine = database.get_engine(server)
 
 # Show the tables in the database
 inspector = inspect(engine)
@@ -34,11 +17,25 @@ print("Tables in the database:")
 for table in tables:
     print(table)
 
-# Write your SQL query
-sql_query = "SELECT * FROM point_of_interest WHERE country_code = 'ESP'"
-
-# Read the query results into a pandas DataFrame
-query_output_df = pd.read_sql(sql_query, engine)
-
-# Print the DataFrame
-print(query_output_df.head)
\ No newline at end of file
+# Choose the columns and filters of the query
+# In this example, we are reading the location and connectivity of every POI where the country_code is 'ESP'
+columns = ["poi_id", "lat", "lon", "poi_type", "connectivity_type", "is_connected"]
+batch_size = 50000
+
+# Stream the query results in chunks of at most batch_size rows, so memory use stays flat
+query_output_df = None
+total_rows = 0
+for chunk in query.iter_query(engine, "point_of_interest", columns=columns, country_code="ESP",
+                              batch_size=batch_size):
+    if query_output_df is None:
+        query_output_df = chunk
+    total_rows += len(chunk)
+
+# Print the first chunk and the number of rows read
+print(f"{total_rows} rows read")
+if query_output_df is not None:
+    print(query_output_df.head())
+
+# Read the connected and unconnected POIs per admin1 region from the rollup tables instead of the POIs
+regions_df = rollup.read_rollup(engine, country_code="ESP", level="admin1")
+print(regions_df[["admin1", "number_poi", "number_connected", "number_unconnected", "mean_cell_site_dist"]])
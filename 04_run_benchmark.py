@@ -0,0 +1,44 @@
+# Import packages
+import os
+import sys
+import json
+import tempfile
+import database
+import benchmark
+
+# Choose the database server (credentials are read from credentials/.env.<server>)
+# Run the benchmark against a local database only: it loads and then deletes the synthetic country
+server = "local"
+
+# Numbers of POIs to benchmark (benchmark.BENCHMARK_SIZES goes from 10^4 to 10^7)
+sizes = [10 ** 4, 10 ** 5]
+
+# Number of point, bounding box and radius queries timed per size
+repeats = 50
+
+# File receiving the results, and results of an earlier run to compare with (None to skip the comparison)
+results_path = "benchmark-results.json"
+baseline_path = None
+
+# Allowed slowdown against the baseline before the run fails
+tolerance = 0.2
+
+# Get the shared engine to access the database
+engine = database.get_engine(server)
+
+# Generate, load, query and delete a synthetic country of each size
+if __name__ == "__main__":
+    profile = benchmark.load_profile()
+    with tempfile.TemporaryDirectory() as work_dir:
+        runs = [benchmark.run_benchmark(engine, n_pois, work_dir, repeats=repeats, profile=profile) for n_pois in sizes]
+    benchmark.write_results(runs, results_path)
+    print(f"Benchmark results written to {results_path}")
+
+    # Fail when a hot path is slower than in the baseline
+    if baseline_path is not None and os.path.exists(baseline_path):
+        with open(baseline_path) as file:
+            regressions = benchmark.compare_results(runs, json.load(file), tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression['benchmark']} with {regression['n_pois']} POIs is "
+                  f"{regression['ratio']:.2f}x slower than the baseline")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,225 @@
+# Import packages
+import asyncio
+from functools import lru_cache
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from datamodel import POINT_SRID
+import database
+import query
+import instrumentation
+from spatial import bbox_wkt
+
+
+# Connection pool settings of the async engines per server. The pool is the only bound on concurrent
+# queries: max_overflow is 0 so a burst of requests waits (at most pool_timeout) for a connection
+# instead of opening more than the server allows.
+ASYNC_POOL_SETTINGS = {
+    "aws": {"pool_size": 20, "max_overflow": 0, "pool_timeout": 5, "pool_recycle": 1800, "pool_pre_ping": True},
+    "local": {"pool_size": 10, "max_overflow": 0, "pool_timeout": 5, "pool_recycle": 3600, "pool_pre_ping": True},
+}
+
+# Seconds a request may take, including the wait for a pooled connection
+DEFAULT_REQUEST_TIMEOUT_S = 10.0
+
+# Maximum number of POIs returned by a map request
+DEFAULT_BBOX_LIMIT = 5000
+
+# Per-POI result tables returned by poi_results, and whether their rows belong to an analysis
+POI_RESULT_TABLES = {
+    "mapping_result": False,
+    "visibility_result": False,
+    "cost_result_poi": True,
+    "fiber_path_result_poi": True,
+}
+
+
+# Define functions to create the async engine used by the web application
+
+
+def async_database_url(settings):
+    """Builds the SQLAlchemy URL of a database for the aiomysql driver.
+
+    Args:
+        settings (dict): Credentials (see database.load_settings).
+
+    Returns:
+        str: mysql+aiomysql URL.
+    """
+    return (f"mysql+aiomysql://{settings['DB_USER']}:{settings['DB_PASSWORD']}"
+            f"@{settings['DB_HOST']}:{settings['DB_PORT']}/{settings['DB_NAME']}")
+
+
+def create_async_db_engine(db_url, server="local", **kwargs):
+    """Creates an async engine with the pool settings of a server.
+
+    Statements are recorded by the instrumentation module when it is enabled. Keyword arguments
+    override the pool settings.
+
+    Args:
+        db_url (str): SQLAlchemy database URL with an async driver (see async_database_url).
+        server (str, optional): Server whose ASYNC_POOL_SETTINGS apply. Defaults to "local".
+        **kwargs: Further arguments of sqlalchemy.ext.asyncio.create_async_engine.
+
+    Returns:
+        sqlalchemy.ext.asyncio.AsyncEngine: New engine.
+    """
+    settings = dict(ASYNC_POOL_SETTINGS[server])
+    settings.update(kwargs)
+    engine = create_async_engine(db_url, echo=False, **settings)
+    instrumentation.instrument_engine(engine.sync_engine)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def get_async_engine(server="aws"):
+    """Returns the shared async engine of a server, creating it on first use.
+
+    Pooled connections belong to the event loop that opened them, so a process should run one
+    event loop (as web workers do) and dispose the engine when it stops.
+
+    Args:
+        server (str, optional): "aws" or "local". Defaults to "aws".
+
+    Returns:
+        sqlalchemy.ext.asyncio.AsyncEngine: Cached engine.
+    """
+    return create_async_db_engine(async_database_url(database.load_settings(server)), server)
+
+
+# Define coroutines for the reads of the web application
+
+
+def _max_execution_hint(timeout_s):
+    # Optimizer hint making the server abort a SELECT that outlives the request
+    return f"/*+ MAX_EXECUTION_TIME({max(int(timeout_s * 1000), 1)}) */"
+
+
+async def fetch_all(engine, sql_query, params=None, timeout_s=DEFAULT_REQUEST_TIMEOUT_S):
+    """Runs a SELECT and returns its rows, within a request timeout.
+
+    The timeout covers the wait for a pooled connection and the query. When it expires the
+    coroutine is cancelled, which releases the connection, and the server also stops the statement
+    through a MAX_EXECUTION_TIME hint, so an abandoned query does not keep running.
+
+    Args:
+        engine (sqlalchemy.ext.asyncio.AsyncEngine): Async engine (see get_async_engine).
+        sql_query (str): SELECT statement with named parameters.
+        params (dict, optional): Query parameters. Defaults to None.
+        timeout_s (float, optional): Seconds allowed. Defaults to DEFAULT_REQUEST_TIMEOUT_S.
+
+    Returns:
+        list: One dict per row.
+
+    Raises:
+        asyncio.TimeoutError: The request took longer than timeout_s.
+    """
+    if sql_query.lstrip()[:6].upper() == "SELECT":
+        sql_query = f"SELECT {_max_execution_hint(timeout_s)}{sql_query.lstrip()[6:]}"
+
+    async def run():
+        async with engine.connect() as connection:
+            result = await connection.execute(text(sql_query), params or {})
+            return [dict(row) for row in result.mappings().all()]
+
+    return await asyncio.wait_for(run(), timeout_s)
+
+
+async def pois_in_bbox(engine, min_lon, min_lat, max_lon, max_lat, columns=None, country_code=None,
+                       limit=DEFAULT_BBOX_LIMIT, timeout_s=DEFAULT_REQUEST_TIMEOUT_S):
+    """Returns the POIs inside a bounding box, using the SPATIAL INDEX of point_of_interest.
+
+    Args:
+        engine (sqlalchemy.ext.asyncio.AsyncEngine): Async engine (see get_async_engine).
+        min_lon (float): Western longitude.
+        min_lat (float): Southern latitude.
+        max_lon (float): Eastern longitude.
+        max_lat (float): Northern latitude.
+        columns (list, optional): Columns to return. Defaults to every column except geom.
+        country_code (str, optional): Only return POIs of this country. Defaults to all countries.
+        limit (int, optional): Maximum number of POIs. Defaults to DEFAULT_BBOX_LIMIT.
+        timeout_s (float, optional): Seconds allowed. Defaults to DEFAULT_REQUEST_TIMEOUT_S.
+
+    Returns:
+        list: One dict per POI.
+    """
+    expressions = ", ".join(expression for _, expression in query.select_columns("point_of_interest", columns, "t"))
+    sql_query = (f"SELECT {expressions} FROM point_of_interest t "
+                 f"WHERE MBRContains(ST_GeomFromText(:bbox, {POINT_SRID}, 'axis-order=long-lat'), t.geom)")
+    params = {"bbox": bbox_wkt(min_lon, min_lat, max_lon, max_lat)}
+    if country_code is not None:
+        sql_query += " AND t.country_code = :country_code"
+        params["country_code"] = country_code
+    if limit is not None:
+        sql_query += f" LIMIT {int(limit)}"
+    return await fetch_all(engine, sql_query, params, timeout_s)
+
+
+async def analysis_summary(engine, analysis_id, timeout_s=DEFAULT_REQUEST_TIMEOUT_S):
+    """Returns an analysis with the sizes of its inputs and the totals of its per-POI results.
+
+    The counts are computed by one aggregate query per table, run concurrently on separate
+    pooled connections.
+
+    Args:
+        engine (sqlalchemy.ext.asyncio.AsyncEngine): Async engine (see get_async_engine).
+        analysis_id (str): Analysis identifier.
+        timeout_s (float, optional): Seconds allowed. Defaults to DEFAULT_REQUEST_TIMEOUT_S.
+
+    Returns:
+        dict: The analysis columns, the input counts and the cost_result_poi totals,
+            or None when the analysis does not exist.
+    """
+    params = {"analysis_id": analysis_id}
+    counts = {
+        f"number_{table_name}": f"SELECT COUNT(*) AS n FROM {table_name} WHERE analysis_id = :analysis_id"
+        for table_name in ("analysis_poi_association", "analysis_cellsite_association",
+                           "analysis_transmissionnode_association", "analysis_coverage_association")
+    }
+    totals = ("SELECT COUNT(*) AS number_poi, SUM(is_connected) AS number_connected, "
+              "SUM(_4G_coverage) AS number_4G_coverage, SUM(is_visible) AS number_visible, "
+              "AVG(cell_site_dist) AS mean_cell_site_dist FROM cost_result_poi WHERE analysis_id = :analysis_id")
+
+    analysis, total_rows, *count_rows = await asyncio.gather(
+        fetch_all(engine, "SELECT * FROM analysis WHERE analysis_id = :analysis_id", params, timeout_s),
+        fetch_all(engine, totals, params, timeout_s),
+        *[fetch_all(engine, sql_query, params, timeout_s) for sql_query in counts.values()])
+    if not analysis:
+        return None
+
+    summary = dict(analysis[0])
+    summary.update({name: rows[0]["n"] for name, rows in zip(counts, count_rows)})
+    summary["results"] = total_rows[0]
+    return summary
+
+
+async def poi_results(engine, poi_id, analysis_id=None, tables=POI_RESULT_TABLES, timeout_s=DEFAULT_REQUEST_TIMEOUT_S):
+    """Returns a POI and its mapping, visibility, cost and fiber path results.
+
+    Each table is read by its own query, run concurrently on separate pooled connections.
+
+    Args:
+        engine (sqlalchemy.ext.asyncio.AsyncEngine): Async engine (see get_async_engine).
+        poi_id (str): POI identifier.
+        analysis_id (str, optional): Only return the results of this analysis. Defaults to every analysis.
+        tables (dict, optional): Result tables to read (see POI_RESULT_TABLES). Defaults to POI_RESULT_TABLES.
+        timeout_s (float, optional): Seconds allowed. Defaults to DEFAULT_REQUEST_TIMEOUT_S.
+
+    Returns:
+        dict: The POI under "point_of_interest" (None when it does not exist) and a list of rows per
+            result table.
+    """
+    params = {"poi_id": poi_id, "analysis_id": analysis_id}
+    queries = {"point_of_interest": "SELECT {columns} FROM point_of_interest WHERE poi_id = :poi_id"}
+    for table_name, per_analysis in tables.items():
+        queries[table_name] = f"SELECT {{columns}} FROM {table_name} WHERE poi_id = :poi_id"
+        if per_analysis and analysis_id is not None:
+            queries[table_name] += " AND analysis_id = :analysis_id"
+
+    names = list(queries)
+    rows = await asyncio.gather(*[
+        fetch_all(engine, queries[name].format(
+            columns=", ".join(expression for _, expression in query.select_columns(name))), params, timeout_s)
+        for name in names])
+    results = dict(zip(names, rows))
+    results["point_of_interest"] = results["point_of_interest"][0] if results["point_of_interest"] else None
+    return results
@@ -0,0 +1,485 @@
+# Import packages
+import os
+import glob
+import json
+import time
+import uuid
+import platform
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+import loader
+import spatial
+import bundle
+import delete
+import partition
+import cost_results
+
+
+# Sample country the synthetic data is modelled on, and the sample file of every generated table
+SAMPLE_DIR = os.path.join("data", "ESP")
+SAMPLE_FILES = {
+    "point_of_interest": "processed/pointofinterest/*.csv",
+    "cell_site": "processed/cellsite/*.csv",
+    "transmission_node": "processed/transmissionnode/*.csv",
+    "mapping_result": "output/pcd/*-pcd.csv",
+    "cost_result_poi": "output/cost/*-cost-results-poi-info.csv",
+}
+
+# Infrastructure tables, generated with the number of rows per POI of the sample
+INFRASTRUCTURE_TABLES = ["cell_site", "transmission_node"]
+
+# Country code of the synthetic data; it must not exist in the database, since the benchmark deletes it
+SYNTHETIC_COUNTRY = "SYN"
+
+# Dataset sizes (number of POIs) of a full benchmark run
+BENCHMARK_SIZES = [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+
+# Query benchmark settings: repetitions, bounding box side (degrees) and radius (metres)
+DEFAULT_REPEATS = 50
+BBOX_SIZE_DEG = 0.05
+RADIUS_M = 1000.0
+
+# Allowed slowdown before a benchmark is reported as a regression
+DEFAULT_TOLERANCE = 0.2
+
+
+# Define functions to generate synthetic datasets modelled on the sample country
+
+
+def load_profile(sample_dir=SAMPLE_DIR):
+    """Reads the sample files the synthetic data is drawn from.
+
+    Generated rows are resampled from the sample rows, which keeps the joint distribution of their
+    attributes (types, radio technologies, distances, technology choices). Locations are spread
+    around the sample locations so that the point density of the sample is kept at any size.
+
+    Args:
+        sample_dir (str, optional): Country directory with processed and output files. Defaults to SAMPLE_DIR.
+
+    Returns:
+        dict: Sample rows per table, rows per POI of the infrastructure tables, and the centroid
+            and spread of the sample POIs.
+    """
+    samples = {}
+    for table_name, pattern in SAMPLE_FILES.items():
+        filepaths = sorted(glob.glob(os.path.join(sample_dir, pattern)))
+        if len(filepaths) == 0:
+            raise FileNotFoundError(f"No sample file for {table_name} in {os.path.join(sample_dir, pattern)}")
+        samples[table_name] = pd.concat([pd.read_csv(filepath) for filepath in filepaths], ignore_index=True)
+
+    pois = samples["point_of_interest"]
+    return {
+        "samples": samples,
+        "ratios": {table_name: len(samples[table_name]) / len(pois) for table_name in INFRASTRUCTURE_TABLES},
+        "centroid": (pois["lat"].mean(), pois["lon"].mean()),
+        "spread": (pois["lat"].std(), pois["lon"].std()),
+    }
+
+
+def _rng(seed, table_name, chunk_index):
+    # Independent, reproducible random stream per table and chunk
+    return np.random.default_rng([seed, sum(map(ord, table_name)), chunk_index])
+
+
+def _uuids(rng, n):
+    # Random version 4 UUID strings drawn from a seeded generator
+    return [str(uuid.UUID(bytes=bytes(row), version=4)) for row in rng.integers(0, 256, (n, 16), dtype=np.uint8)]
+
+
+def _resample(profile, table_name, rng, n, n_pois):
+    # Rows drawn from the sample, moved to locations with the sample's point density
+    sample = profile["samples"][table_name]
+    rows = sample.iloc[rng.integers(0, len(sample), n)].reset_index(drop=True)
+    if "lat" in rows.columns:
+        scale = np.sqrt(n_pois / len(profile["samples"]["point_of_interest"]))
+        (lat0, lon0), (lat_sd, lon_sd) = profile["centroid"], profile["spread"]
+        jitter = scale / np.sqrt(len(sample))
+        rows["lat"] = np.clip(lat0 + (rows["lat"] - lat0) * scale + rng.normal(0, lat_sd * jitter, n), -89.9, 89.9)
+        rows["lon"] = np.clip(lon0 + (rows["lon"] - lon0) * scale + rng.normal(0, lon_sd * jitter, n), -179.9, 179.9)
+    return rows
+
+
+def _chunk_bounds(n_rows, chunk_size):
+    return [(start, min(start + chunk_size, n_rows)) for start in range(0, n_rows, chunk_size)]
+
+
+def poi_chunks(profile, n_pois, country_code=SYNTHETIC_COUNTRY, seed=0, chunk_size=loader.DEFAULT_BATCH_SIZE):
+    """Generates synthetic POIs in chunks.
+
+    Chunks are reproducible from the seed, so the result tables can regenerate the POIs they refer to
+    instead of keeping them in memory.
+
+    Args:
+        profile (dict): Output of load_profile.
+        n_pois (int): Number of POIs.
+        country_code (str, optional): Country code of the rows. Defaults to SYNTHETIC_COUNTRY.
+        seed (int, optional): Random seed. Defaults to 0.
+        chunk_size (int, optional): Rows per chunk. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Yields:
+        pandas.DataFrame: point_of_interest rows.
+    """
+    for index, (start, end) in enumerate(_chunk_bounds(n_pois, chunk_size)):
+        rng = _rng(seed, "point_of_interest", index)
+        pois = _resample(profile, "point_of_interest", rng, end - start, n_pois)
+        pois["poi_id"] = _uuids(rng, end - start)
+        pois["source_poi_id"] = [f"POI{number}" for number in range(start + 1, end + 1)]
+        pois["dataset_id"] = dataset_id(country_code, "point_of_interest")
+        pois["country_code"] = country_code
+        yield pois
+
+
+def infrastructure_chunks(profile, table_name, n_pois, country_code=SYNTHETIC_COUNTRY, seed=0,
+                          chunk_size=loader.DEFAULT_BATCH_SIZE):
+    """Generates synthetic cell sites or transmission nodes in chunks.
+
+    Args:
+        profile (dict): Output of load_profile.
+        table_name (str): One of INFRASTRUCTURE_TABLES.
+        n_pois (int): Number of POIs; the number of rows follows the sample's rows per POI.
+        country_code (str, optional): Country code of the rows. Defaults to SYNTHETIC_COUNTRY.
+        seed (int, optional): Random seed. Defaults to 0.
+        chunk_size (int, optional): Rows per chunk. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Yields:
+        pandas.DataFrame: Rows of the table.
+    """
+    n_rows = int(round(n_pois * profile["ratios"][table_name]))
+    for index, (start, end) in enumerate(_chunk_bounds(n_rows, chunk_size)):
+        rng = _rng(seed, table_name, index)
+        rows = _resample(profile, table_name, rng, end - start, n_pois)
+        rows["ict_id"] = _uuids(rng, end - start)
+        rows["dataset_id"] = dataset_id(country_code, table_name)
+        rows["country_code"] = country_code
+        yield rows
+
+
+def result_chunks(profile, table_name, n_pois, analysis_id, country_code=SYNTHETIC_COUNTRY, seed=0,
+                  chunk_size=loader.DEFAULT_BATCH_SIZE):
+    """Generates per-POI results of the synthetic POIs in chunks.
+
+    Args:
+        profile (dict): Output of load_profile.
+        table_name (str): "mapping_result", "cost_result_poi" (rows of a *-cost-results-poi-info.csv
+            file) or "analysis_poi_association".
+        n_pois (int): Number of POIs.
+        analysis_id (str): Analysis the results belong to.
+        country_code (str, optional): Country code of the POIs. Defaults to SYNTHETIC_COUNTRY.
+        seed (int, optional): Random seed. Defaults to 0.
+        chunk_size (int, optional): Rows per chunk. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Yields:
+        pandas.DataFrame: One row per POI.
+    """
+    for index, pois in enumerate(poi_chunks(profile, n_pois, country_code, seed, chunk_size)):
+        if table_name == "analysis_poi_association":
+            yield pd.DataFrame({"analysis_id": analysis_id, "poi_id": pois["poi_id"]})
+            continue
+        rows = _resample(profile, table_name, _rng(seed, table_name, index), len(pois), n_pois)
+        rows["poi_id"] = pois["poi_id"].to_numpy()
+        rows["lat"] = pois["lat"].to_numpy()
+        rows["lon"] = pois["lon"].to_numpy()
+        if table_name == "mapping_result":
+            rows = rows.rename(columns=lambda column: f"_{column}" if column[0].isdigit() else column)
+            rows.insert(0, "id", rows["poi_id"])
+        yield rows
+
+
+def dataset_id(country_code, table_name):
+    """Returns the dataset identifier of a synthetic table.
+
+    Args:
+        country_code (str): Country code.
+        table_name (str): Table name.
+
+    Returns:
+        str: Dataset identifier, e.g. SYN-bench-cell_site.
+    """
+    return f"{country_code}-bench-{table_name}"
+
+
+def write_dataset(profile, output_dir, n_pois, country_code=SYNTHETIC_COUNTRY, seed=0,
+                  chunk_size=loader.DEFAULT_BATCH_SIZE):
+    """Writes a synthetic country to CSV files, chunk by chunk, for the ingest benchmark.
+
+    Args:
+        profile (dict): Output of load_profile.
+        output_dir (str): Directory receiving the files.
+        n_pois (int): Number of POIs.
+        country_code (str, optional): Country code of the rows. Defaults to SYNTHETIC_COUNTRY.
+        seed (int, optional): Random seed. Defaults to 0.
+        chunk_size (int, optional): Rows per chunk. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: The analysis identifier, and the file of every table in load order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    start_time = time.perf_counter()
+    analysis_id = f"{country_code}-{seed:010d}-bnch"
+    generators = {
+        "point_of_interest": poi_chunks(profile, n_pois, country_code, seed, chunk_size),
+        "cell_site": infrastructure_chunks(profile, "cell_site", n_pois, country_code, seed, chunk_size),
+        "transmission_node": infrastructure_chunks(profile, "transmission_node", n_pois, country_code, seed,
+                                                   chunk_size),
+        "analysis_poi_association": result_chunks(profile, "analysis_poi_association", n_pois, analysis_id,
+                                                  country_code, seed, chunk_size),
+        "mapping_result": result_chunks(profile, "mapping_result", n_pois, analysis_id, country_code, seed,
+                                        chunk_size),
+        "cost_result_poi": result_chunks(profile, "cost_result_poi", n_pois, analysis_id, country_code, seed,
+                                         chunk_size),
+    }
+
+    files = {}
+    for table_name, chunks in generators.items():
+        name = f"{analysis_id}-cost-results-poi-info.csv" if table_name == "cost_result_poi" else f"{table_name}.csv"
+        files[table_name] = os.path.join(output_dir, name)
+        for index, chunk in enumerate(chunks):
+            chunk.to_csv(files[table_name], mode="w" if index == 0 else "a", header=index == 0, index=False)
+    print(f"Synthetic country {country_code} with {n_pois} POIs written to {output_dir} "
+          f"in {time.perf_counter() - start_time:.1f}s")
+    return {"analysis_id": analysis_id, "files": files}
+
+
+# Define functions to time the hot paths against a database
+
+
+def _summary(name, latencies, **fields):
+    # Latency statistics of repeated calls, in seconds
+    latencies = np.asarray(latencies)
+    return {"benchmark": name, "repeats": len(latencies), "p50_s": float(np.percentile(latencies, 50)),
+            "p95_s": float(np.percentile(latencies, 95)), "max_s": float(latencies.max()),
+            "mean_s": float(latencies.mean()), **fields}
+
+
+def _timed(function, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start_time, result
+
+
+def bench_ingest(engine, dataset, batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Times the load of every file of a synthetic dataset, in foreign key order.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        dataset (dict): Output of write_dataset.
+        batch_size (int, optional): Rows per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        list: One result per table, with rows, seconds and rows per second.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("INSERT IGNORE INTO analysis (analysis_id) VALUES (:analysis_id)"),
+                           {"analysis_id": dataset["analysis_id"]})
+
+    results = []
+    for table_name, filepath in dataset["files"].items():
+        if table_name == "cost_result_poi":
+            seconds, stats = _timed(cost_results.load_cost_results_poi, engine, filepath, dataset["analysis_id"],
+                                    batch_size)
+            rows = stats["poi_rows"] + stats["distance_rows"]
+        else:
+            seconds, stats = _timed(loader.load_csv, engine, table_name, filepath, batch_size)
+            rows = stats["rows"]
+        results.append({"benchmark": f"ingest.{table_name}", "rows": rows, "seconds": seconds,
+                        "rows_per_second": rows / max(seconds, 1e-9)})
+    return results
+
+
+def bench_queries(engine, country_code=SYNTHETIC_COUNTRY, repeats=DEFAULT_REPEATS, seed=0,
+                  bbox_size_deg=BBOX_SIZE_DEG, radius_m=RADIUS_M):
+    """Times primary key lookups, bounding box queries and radius queries on the POIs of a country.
+
+    Queries are centred on POIs picked at random, so they hit populated areas.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        country_code (str, optional): Country of the POIs. Defaults to SYNTHETIC_COUNTRY.
+        repeats (int, optional): Number of queries of each kind. Defaults to DEFAULT_REPEATS.
+        seed (int, optional): Random seed. Defaults to 0.
+        bbox_size_deg (float, optional): Side of the bounding boxes in degrees. Defaults to BBOX_SIZE_DEG.
+        radius_m (float, optional): Radius of the radius queries in metres. Defaults to RADIUS_M.
+
+    Returns:
+        list: Latency statistics of each kind of query, with the mean number of rows returned.
+    """
+    # Random sample of POIs: the first key after random UUIDs, found by primary key seeks
+    rng = np.random.default_rng(seed)
+    with engine.connect() as connection:
+        targets = [connection.execute(
+            text("SELECT poi_id, lat, lon FROM point_of_interest WHERE poi_id >= :start "
+                 "AND country_code = :country_code ORDER BY poi_id LIMIT 1"),
+            {"start": start, "country_code": country_code}).first() for start in _uuids(rng, repeats)]
+    targets = [target for target in targets if target is not None]
+    if len(targets) == 0:
+        raise ValueError(f"No POIs of {country_code} in the database")
+
+    results = []
+    latencies, rows = [], []
+    for target in targets:
+        with engine.connect() as connection:
+            seconds, result = _timed(lambda: connection.execute(
+                text("SELECT * FROM point_of_interest WHERE poi_id = :poi_id"), {"poi_id": target.poi_id}).all())
+        latencies.append(seconds)
+        rows.append(len(result))
+    results.append(_summary("query.point", latencies, mean_rows=float(np.mean(rows))))
+
+    latencies, rows = [], []
+    half = bbox_size_deg / 2
+    for target in targets:
+        seconds, result = _timed(spatial.query_bbox, engine, "point_of_interest", target.lon - half,
+                                 target.lat - half, target.lon + half, target.lat + half, ["poi_id", "lat", "lon"])
+        latencies.append(seconds)
+        rows.append(len(result))
+    results.append(_summary("query.bbox", latencies, mean_rows=float(np.mean(rows))))
+
+    latencies, rows = [], []
+    for target in targets:
+        seconds, result = _timed(spatial.query_radius, engine, "point_of_interest", target.lon, target.lat,
+                                 radius_m, ["poi_id", "lat", "lon"])
+        latencies.append(seconds)
+        rows.append(len(result))
+    results.append(_summary("query.radius", latencies, mean_rows=float(np.mean(rows))))
+    return results
+
+
+def bench_bundle(engine, analysis_id, repeats=3):
+    """Times the load of an analysis bundle (see bundle.load_analysis_bundle).
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_id (str): Analysis identifier.
+        repeats (int, optional): Number of loads. Defaults to 3.
+
+    Returns:
+        list: Latency statistics with the number of rows of the bundle.
+    """
+    latencies = []
+    for _ in range(repeats):
+        seconds, result = _timed(bundle.load_analysis_bundle, engine, analysis_id)
+        latencies.append(seconds)
+    rows = sum(len(frame) for frame in result.values() if isinstance(frame, pd.DataFrame))
+    return [_summary("bundle.load", latencies, rows=rows)]
+
+
+def bench_delete(engine, analysis_id, country_code=SYNTHETIC_COUNTRY, batch_size=delete.DEFAULT_DELETE_BATCH_SIZE):
+    """Times the deletion of a country and of its analysis.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_id (str): Analysis of the country.
+        country_code (str, optional): Country to delete. Defaults to SYNTHETIC_COUNTRY.
+        batch_size (int, optional): Rows per chunk and commit. Defaults to delete.DEFAULT_DELETE_BATCH_SIZE.
+
+    Returns:
+        list: One result per delete, with the number of rows deleted and rows per second.
+    """
+    results = []
+    for name, scope in [("delete.country", {"country_code": country_code}),
+                        ("delete.analysis", {"analysis_id": analysis_id})]:
+        seconds, stats = _timed(delete.delete_data, engine, batch_size=batch_size, **scope)
+        rows = sum(stats.values())
+        results.append({"benchmark": name, "rows": rows, "seconds": seconds,
+                        "rows_per_second": rows / max(seconds, 1e-9)})
+    return results
+
+
+def _environment(engine):
+    # Versions and host the results were measured with
+    with engine.connect() as connection:
+        server_version = connection.execute(text("SELECT VERSION()")).scalar()
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"created_at": datetime.now(timezone.utc).isoformat(), "git_commit": commit, "server_version": server_version,
+            "python": platform.python_version(), "host": platform.node(), "cpus": os.cpu_count()}
+
+
+def run_benchmark(engine, n_pois, work_dir, country_code=SYNTHETIC_COUNTRY, repeats=DEFAULT_REPEATS, seed=0,
+                  batch_size=loader.DEFAULT_BATCH_SIZE, profile=None):
+    """Generates a synthetic country, then times its ingest, queries, bundle load and deletion.
+
+    Leftover rows of the synthetic country are deleted first, and the country is deleted again at
+    the end as the delete benchmark, so the database is left as it was.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        n_pois (int): Number of POIs (one of BENCHMARK_SIZES, or any other size).
+        work_dir (str): Directory for the generated CSV files.
+        country_code (str, optional): Synthetic country code. Defaults to SYNTHETIC_COUNTRY.
+        repeats (int, optional): Number of queries of each kind. Defaults to DEFAULT_REPEATS.
+        seed (int, optional): Random seed. Defaults to 0.
+        batch_size (int, optional): Rows per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+        profile (dict, optional): Output of load_profile. Defaults to the sample country.
+
+    Returns:
+        dict: Size, environment and the list of benchmark results.
+    """
+    profile = profile or load_profile()
+    dataset = write_dataset(profile, os.path.join(work_dir, f"{country_code}_{n_pois}"), n_pois, country_code,
+                            seed, batch_size)
+
+    delete.delete_data(engine, country_code=country_code)
+    delete.delete_data(engine, analysis_id=dataset["analysis_id"])
+    partition.ensure_country_partitions(engine, [country_code])
+
+    results = bench_ingest(engine, dataset, batch_size)
+    results += bench_queries(engine, country_code, repeats, seed)
+    results += bench_bundle(engine, dataset["analysis_id"])
+    results += bench_delete(engine, dataset["analysis_id"], country_code)
+    for result in results:
+        print(f"{n_pois} POIs {result['benchmark']}: " +
+              (f"p50 {result['p50_s'] * 1000:.1f} ms, p95 {result['p95_s'] * 1000:.1f} ms" if "p50_s" in result
+               else f"{result['rows']} rows in {result['seconds']:.1f}s ({result['rows_per_second']:,.0f} rows/s)"))
+    return {"n_pois": n_pois, "seed": seed, "environment": _environment(engine), "results": results}
+
+
+def write_results(runs, filepath):
+    """Writes benchmark runs to a JSON file.
+
+    Args:
+        runs (list): Outputs of run_benchmark.
+        filepath (str): Path of the JSON file.
+
+    Returns:
+        None
+    """
+    with open(filepath, "w") as file:
+        json.dump(runs, file, indent=2)
+
+
+def _metric(result):
+    # Lower-is-better time of a benchmark result
+    return result["p50_s"] if "p50_s" in result else result["seconds"] / max(result["rows"], 1)
+
+
+def compare_results(runs, baseline_runs, tolerance=DEFAULT_TOLERANCE):
+    """Compares benchmark runs with a baseline of the same sizes.
+
+    Query and bundle benchmarks are compared on their median latency, ingest and delete benchmarks
+    on their time per row.
+
+    Args:
+        runs (list): Outputs of run_benchmark.
+        baseline_runs (list): Earlier outputs of run_benchmark (e.g. read from a write_results file).
+        tolerance (float, optional): Allowed relative slowdown. Defaults to DEFAULT_TOLERANCE.
+
+    Returns:
+        list: Regressions, with size, benchmark, baseline and current values and their ratio.
+    """
+    baseline = {(run["n_pois"], result["benchmark"]): result for run in baseline_runs for result in run["results"]}
+    regressions = []
+    for run in runs:
+        for result in run["results"]:
+            reference = baseline.get((run["n_pois"], result["benchmark"]))
+            if reference is None or _metric(reference) <= 0:
+                continue
+            ratio = _metric(result) / _metric(reference)
+            if ratio > 1 + tolerance:
+                regressions.append({"n_pois": run["n_pois"], "benchmark": result["benchmark"],
+                                    "baseline": _metric(reference), "current": _metric(result), "ratio": ratio})
+    return regressions
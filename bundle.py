@@ -0,0 +1,111 @@
+# Import packages
+import time
+import pandas as pd
+from sqlalchemy import select, text
+from sqlalchemy.orm import selectinload
+import query
+from datamodel import Analysis, PointOfInterest, CostResultPOI, FiberPathResultPOI
+
+
+# POIs of an analysis: those associated with it and those it has results for
+ANALYSIS_POIS = (
+    "SELECT poi_id FROM analysis_poi_association WHERE analysis_id = :analysis_id "
+    "UNION SELECT poi_id FROM cost_result_poi WHERE analysis_id = :analysis_id "
+    "UNION SELECT poi_id FROM fiber_path_result_poi WHERE analysis_id = :analysis_id")
+
+# Parts of an analysis bundle: table and the join/filter tying its rows to the analysis (alias t)
+BUNDLE_PARTS = {
+    "cost_parameter": ("cost_parameter", "JOIN analysis a ON a.cost_parameter_id = t.cost_id "
+                                         "WHERE a.analysis_id = :analysis_id"),
+    "pointsofinterest": ("point_of_interest", f"JOIN ({ANALYSIS_POIS}) s ON s.poi_id = t.poi_id"),
+    "cellsites": ("cell_site", "JOIN analysis_cellsite_association s ON s.ict_id = t.ict_id "
+                               "WHERE s.analysis_id = :analysis_id"),
+    "transmissionnodes": ("transmission_node", "JOIN analysis_transmissionnode_association s ON s.ict_id = t.ict_id "
+                                               "WHERE s.analysis_id = :analysis_id"),
+    "coveragecontours": ("cell_coverage", "JOIN analysis_coverage_association s ON s.contour_id = t.contour_id "
+                                          "WHERE s.analysis_id = :analysis_id"),
+    "mapping_result": ("mapping_result", f"JOIN ({ANALYSIS_POIS}) s ON s.poi_id = t.poi_id"),
+    "visibility_result": ("visibility_result", f"JOIN ({ANALYSIS_POIS}) s ON s.poi_id = t.poi_id"),
+    "cost_result_poi": ("cost_result_poi", "WHERE t.analysis_id = :analysis_id"),
+    "fiber_path_result_poi": ("fiber_path_result_poi", "WHERE t.analysis_id = :analysis_id"),
+}
+
+
+# Define functions to load an analysis and its related rows without per-row queries
+
+
+def load_analysis_bundle(engine, analysis_id, parts=BUNDLE_PARTS):
+    """Loads an analysis and every related table as DataFrames, with one set-based query per table.
+
+    Each part is read by joining its table with the association or result rows of the analysis,
+    so the number of queries depends on the number of tables and not on the number of POIs. All
+    parts are read in one transaction and therefore reflect the same snapshot of the database.
+    Geometry columns are left out.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_id (str): Analysis identifier.
+        parts (dict, optional): Parts to load (see BUNDLE_PARTS). Defaults to BUNDLE_PARTS.
+
+    Returns:
+        dict: The analysis row under "analysis" (None when it does not exist) and one DataFrame per part.
+            Per-POI results can be joined on poi_id.
+    """
+    start_time = time.perf_counter()
+    params = {"analysis_id": analysis_id}
+    with engine.connect() as connection:
+        analysis = connection.execute(text("SELECT * FROM analysis WHERE analysis_id = :analysis_id"), params).first()
+        bundle = {"analysis": None if analysis is None else dict(analysis._mapping)}
+        for part, (table_name, join) in parts.items():
+            columns = ", ".join(expression for _, expression in query.select_columns(table_name, alias="t"))
+            bundle[part] = pd.read_sql(text(f"SELECT {columns} FROM `{table_name}` t {join}"), connection,
+                                       params=params)
+
+    rows = sum(len(frame) for frame in bundle.values() if isinstance(frame, pd.DataFrame))
+    print(f"Analysis {analysis_id}: {rows} rows in {len(parts) + 1} queries "
+          f"({time.perf_counter() - start_time:.2f}s)")
+    return bundle
+
+
+def analysis_loader_options(analysis_id):
+    """Returns ORM loader options that load the relationship graph of an analysis eagerly.
+
+    Every relationship is loaded with selectinload, which issues one SELECT ... WHERE key IN (...)
+    per relationship (chunked for large key lists) instead of one query per parent object. The cost
+    and fiber path results of the POIs are restricted to the analysis, as in load_analysis_bundle.
+
+    Args:
+        analysis_id (str): Analysis whose results are loaded.
+
+    Returns:
+        list: Options for Session.execute(select(...).options(...)).
+    """
+    pois = selectinload(Analysis.pointsofinterest)
+    return [
+        selectinload(Analysis.cost_parameter),
+        selectinload(Analysis.cellsites),
+        selectinload(Analysis.transmissionnodes),
+        selectinload(Analysis.coveragecontours),
+        pois.selectinload(PointOfInterest.mapping_result),
+        pois.selectinload(PointOfInterest.visibility_result),
+        pois.selectinload(PointOfInterest.cost_result_poi.and_(CostResultPOI.analysis_id == analysis_id)),
+        pois.selectinload(PointOfInterest.fiber_path_result_poi.and_(FiberPathResultPOI.analysis_id == analysis_id)),
+    ]
+
+
+def load_analysis(session, analysis_id):
+    """Loads an Analysis object with its whole relationship graph in a constant number of queries.
+
+    Walking analysis.pointsofinterest and their mapping, visibility and cost results afterwards
+    does not emit further queries. The cost_result_poi and fiber_path_result_poi collections of the
+    POIs only hold the rows of this analysis.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session (see database.get_session).
+        analysis_id (str): Analysis identifier.
+
+    Returns:
+        datamodel.Analysis: The analysis, or None when it does not exist.
+    """
+    statement = select(Analysis).where(Analysis.analysis_id == analysis_id).options(*analysis_loader_options(analysis_id))
+    return session.execute(statement).scalars().first()
@@ -0,0 +1,223 @@
+# Import packages
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+import query
+import versions
+
+
+# Default size limits of the memory and disk tiers (bytes)
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+DEFAULT_MAX_DISK_BYTES = 4 * 1024 ** 3
+
+# Seconds between two reads of the version counters; bumps made by this process are seen at once
+DEFAULT_VERSION_TTL_S = 5.0
+
+# Decimals kept when normalizing bounding boxes (about 0.1 m)
+BBOX_DECIMALS = 6
+
+
+# Define a versioned read-through cache over the query API
+
+
+def normalize_query(table_name, columns=None, country_code=None, dataset_id=None, analysis_id=None, bbox=None,
+                    limit=None):
+    """Builds the canonical form of a query, so that equivalent calls share one cache entry.
+
+    Args:
+        table_name (str): Table name.
+        columns (list, optional): Columns to return. Defaults to every column except the geometries.
+        country_code (str, optional): Country filter.
+        dataset_id (str, optional): Dataset filter.
+        analysis_id (str, optional): Analysis filter.
+        bbox (tuple, optional): (min_lon, min_lat, max_lon, max_lat) bounding box.
+        limit (int, optional): Maximum number of rows.
+
+    Returns:
+        dict: Query with resolved columns, string filters and a rounded bounding box.
+    """
+    return {
+        "table": table_name,
+        "columns": [name for name, _ in query.select_columns(table_name, columns)],
+        "country_code": None if country_code is None else str(country_code),
+        "dataset_id": None if dataset_id is None else str(dataset_id),
+        "analysis_id": None if analysis_id is None else str(analysis_id),
+        "bbox": None if bbox is None else [round(float(value), BBOX_DECIMALS) for value in bbox],
+        "limit": None if limit is None else int(limit),
+    }
+
+
+def query_scopes(normalized):
+    """Returns the version scopes a query depends on.
+
+    A query filtered by dataset, analysis or country depends on those scopes only; any other query
+    depends on the global scope, which every write bumps.
+
+    Args:
+        normalized (dict): Normalized query (see normalize_query).
+
+    Returns:
+        list: (scope, scope id) pairs.
+    """
+    scopes = [(scope, normalized[column]) for column, scope in versions.SCOPE_COLUMNS.items()
+              if normalized[column] is not None]
+    return scopes or [versions.GLOBAL_SCOPE]
+
+
+class QueryCache:
+    """Read-through cache of query results, keyed by the normalized query and the data versions.
+
+    Results live in an in-memory LRU tier bounded by size and, optionally, in a Parquet tier on
+    disk. Ingest and delete bump the version counters of the scopes they change (see
+    versions.bump_versions), which changes the keys of the affected queries. Stale entries are
+    therefore never read and age out of the LRU, and unchanged data is served without querying
+    the tables.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        max_bytes (int, optional): Size limit of the memory tier. Defaults to DEFAULT_MAX_BYTES.
+        disk_dir (str, optional): Directory of the Parquet tier. Defaults to no disk tier.
+        max_disk_bytes (int, optional): Size limit of the disk tier. Defaults to DEFAULT_MAX_DISK_BYTES.
+        version_ttl_s (float, optional): Seconds between reads of the version counters.
+            Defaults to DEFAULT_VERSION_TTL_S.
+    """
+
+    def __init__(self, engine, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None, max_disk_bytes=DEFAULT_MAX_DISK_BYTES,
+                 version_ttl_s=DEFAULT_VERSION_TTL_S):
+        self.engine = engine
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.version_ttl_s = version_ttl_s
+        self.metrics = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0,
+                        "bytes": 0, "entries": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._versions_read_at = None
+        self._versions_generation = None
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _current_versions(self):
+        # Version counters, re-read after the TTL or after a bump made by this process
+        now = time.monotonic()
+        if (self._versions_read_at is None or now - self._versions_read_at > self.version_ttl_s
+                or self._versions_generation != versions.local_generation()):
+            self._versions_generation = versions.local_generation()
+            self._versions = versions.read_versions(self.engine)
+            self._versions_read_at = now
+        return self._versions
+
+    def key(self, normalized):
+        """Returns the cache key of a normalized query at the current data versions.
+
+        Args:
+            normalized (dict): Normalized query (see normalize_query).
+
+        Returns:
+            str: SHA-256 hex digest.
+        """
+        current = self._current_versions()
+        scope_versions = [[scope, scope_id, current.get((scope, scope_id), 0)]
+                          for scope, scope_id in query_scopes(normalized)]
+        payload = json.dumps({"query": normalized, "versions": scope_versions}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _store(self, key, result):
+        # Adds a result to the memory tier and evicts the least recently used entries over the limit
+        size = int(result.memory_usage(deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self.metrics["bytes"] -= self._entries.pop(key)[1]
+            self._entries[key] = (result, size)
+            self.metrics["bytes"] += size
+            while self.metrics["bytes"] > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.metrics["bytes"] -= evicted_size
+                self.metrics["evictions"] += 1
+            self.metrics["entries"] = len(self._entries)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.parquet")
+
+    def _store_disk(self, key, result):
+        # Writes a result to the disk tier and removes the oldest files over the limit
+        path = self._disk_path(key)
+        result.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        files = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith(".parquet")]
+        files = sorted(files, key=os.path.getmtime)
+        total = sum(os.path.getsize(file) for file in files)
+        while total > self.max_disk_bytes and len(files) > 1:
+            oldest = files.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            self.metrics["disk_evictions"] += 1
+
+    def get(self, table_name, columns=None, country_code=None, dataset_id=None, analysis_id=None, bbox=None,
+            limit=None, batch_size=query.DEFAULT_QUERY_BATCH_SIZE):
+        """Returns the result of a query, from the cache when the data has not changed.
+
+        The returned DataFrame is shared with the cache and must not be modified in place.
+
+        Args:
+            table_name (str): Table name.
+            columns (list, optional): Columns to return. Defaults to every column except the geometries.
+            country_code (str, optional): Country filter.
+            dataset_id (str, optional): Dataset filter.
+            analysis_id (str, optional): Analysis filter.
+            bbox (tuple, optional): (min_lon, min_lat, max_lon, max_lat) bounding box.
+            limit (int, optional): Maximum number of rows.
+            batch_size (int, optional): Rows per chunk when reading from the database.
+                Defaults to query.DEFAULT_QUERY_BATCH_SIZE.
+
+        Returns:
+            pandas.DataFrame: Query result.
+        """
+        normalized = normalize_query(table_name, columns, country_code, dataset_id, analysis_id, bbox, limit)
+        key = self.key(normalized)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.metrics["hits"] += 1
+                return self._entries[key][0]
+
+        if self.disk_dir is not None and os.path.exists(self._disk_path(key)):
+            result = pd.read_parquet(self._disk_path(key))
+            self.metrics["disk_hits"] += 1
+            self._store(key, result)
+            return result
+
+        self.metrics["misses"] += 1
+        chunks = list(query.iter_query(self.engine, table_name, normalized["columns"], country_code, dataset_id,
+                                       analysis_id, bbox, limit, batch_size))
+        result = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=normalized["columns"])
+        self._store(key, result)
+        if self.disk_dir is not None:
+            self._store_disk(key, result)
+        return result
+
+    def clear(self):
+        """Empties the memory tier (the disk tier is keyed by version and needs no clearing)."""
+        with self._lock:
+            self._entries.clear()
+            self.metrics["bytes"] = 0
+            self.metrics["entries"] = 0
+
+    def stats(self):
+        """Returns the cache metrics.
+
+        Returns:
+            dict: Hits, disk hits, misses, evictions, hit rate, and the size of the memory tier.
+        """
+        with self._lock:
+            stats = dict(self.metrics)
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,417 @@
+# Import packages
+import os
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+import loader
+import incremental
+import versions
+import rollup
+from datamodel import CostParameter
+
+
+# Technologies of cost_result and the technology of their POIs in cost_result_poi_distance
+TECHNOLOGIES = {
+    "fiber": "Fiber",
+    "p2mp": "Existing cellular",
+    "p2p": "Additional P2P microwave",
+    "satellite": "Satellite",
+}
+
+# Cost parameters, in the column order of the parameter matrix
+PARAMETER_COLUMNS = [column.name for column in CostParameter.__table__.columns if column.name != "cost_id"]
+PARAMETER_INDEX = {name: index for index, name in enumerate(PARAMETER_COLUMNS)}
+
+# Aggregates of cost_result computed by the engine
+COST_METRICS = ["pp_coo", "pp_coo_per_poi", "pp_capex", "init_capex", "an_opex", "init_capex_per_poi",
+                "an_opex_per_poi"]
+
+# Overhead added to the fiber construction cost of the route, as in the cost results of the analyses
+FIBER_ROUTE_OVERHEAD = 0.1
+
+# Approach used to assign a technology to every POI (the technology column of cost_result_poi_distance)
+SELECTION_APPROACH = "ranking"
+
+# Number of scenarios computed per worker task
+DEFAULT_SWEEP_CHUNK_SIZE = 500
+
+
+# Define functions to compute the cost_result aggregates from POI results and cost parameters
+
+
+def load_poi_inputs(engine, analysis_ids):
+    """Loads the number of POIs and the fiber length per analysis, distance and technology.
+
+    The aggregation runs in the database, so the engine works on one row per analysis and distance
+    whatever the number of POIs.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_ids (list): Analysis identifiers.
+
+    Returns:
+        dict: "keys" (DataFrame of analysis_id and max_dist_km, one row per input row), "counts"
+            (array of POIs per row and technology, in TECHNOLOGIES order) and "fiber_length"
+            (array of fiber km per row).
+    """
+    query = text(
+        "SELECT analysis_id, max_dist_km, technology, COUNT(*) AS number_poi, "
+        "COALESCE(SUM(fiber_length), 0) AS fiber_length FROM cost_result_poi_distance "
+        "WHERE analysis_id IN :analysis_ids GROUP BY analysis_id, max_dist_km, technology"
+    ).bindparams(bindparam("analysis_ids", expanding=True))
+    with engine.connect() as connection:
+        totals = pd.read_sql(query, connection, params={"analysis_ids": list(analysis_ids)})
+    return poi_inputs(totals)
+
+
+def poi_inputs(totals, index=("analysis_id", "max_dist_km")):
+    """Arranges per-technology POI totals into the arrays used by compute_costs.
+
+    Args:
+        totals (pandas.DataFrame): Columns of index, technology, number_poi and fiber_length.
+        index (tuple, optional): Columns identifying an input row. Defaults to analysis and distance.
+
+    Returns:
+        dict: Inputs as returned by load_poi_inputs.
+    """
+    index = list(index)
+    labels = {label: technology for technology, label in TECHNOLOGIES.items()}
+    totals = totals.assign(technology=totals["technology"].map(labels)).dropna(subset=["technology"])
+    counts = totals.pivot_table(index=index, columns="technology", values="number_poi",
+                                aggfunc="sum", fill_value=0).reindex(columns=list(TECHNOLOGIES), fill_value=0)
+    fiber = totals[totals["technology"] == "fiber"].groupby(index)["fiber_length"].sum()
+    return {
+        "keys": counts.index.to_frame(index=False),
+        "counts": counts.to_numpy(dtype=float),
+        "fiber_length": fiber.reindex(counts.index, fill_value=0.0).to_numpy(dtype=float),
+    }
+
+
+def parameter_matrix(parameters):
+    """Converts cost_parameter rows into a float matrix with one row per scenario.
+
+    Args:
+        parameters (pandas.DataFrame): cost_parameter rows; missing columns become NaN.
+
+    Returns:
+        numpy.ndarray: Array of shape (scenarios, len(PARAMETER_COLUMNS)).
+    """
+    return parameters.reindex(columns=PARAMETER_COLUMNS).to_numpy(dtype=float)
+
+
+def _reinvestments(params, technology):
+    # Number of hardware replacements within the payback period (at every full reinvestment period)
+    return np.floor(params[f"pp_{technology}"] / params[f"reinv_period_{technology}"])
+
+
+def compute_costs(counts, fiber_length, matrix):
+    """Computes the cost_result aggregates of every scenario and input row at once.
+
+    All arithmetic is broadcast over arrays of shape (scenarios, rows), so the cost of a sweep grows
+    with the number of scenarios times the number of analysis/distance rows, not with the number of POIs.
+    For each technology, with n POIs:
+
+    - fiber: init_capex = n * hw_setup + fiber km * focl_constr * (1 + FIBER_ROUTE_OVERHEAD),
+      an_opex = init_capex * an_hw_maint_and_repl + n * traffic fees * channel throughput;
+    - p2mp and satellite: init_capex = n * hw_setup, an_opex = init_capex * an_hw_maint_and_repl;
+    - p2p: init_capex = n * (equipment + towers + one-time licence fees), where equipment is the
+      radio hardware and access/backhaul links, an_opex = equipment * an_hw_maint_and_repl
+      + n * (annual licence fees + traffic fees * channel throughput);
+
+    with pp_capex = init_capex + hardware * floor(pp / reinv_period) and pp_coo = pp_capex + pp * an_opex.
+    Scenarios with missing parameters (e.g. NULL P2P reinvestment settings) give NaN for that technology.
+
+    Args:
+        counts (numpy.ndarray): POIs per row and technology, shape (rows, len(TECHNOLOGIES)).
+        fiber_length (numpy.ndarray): Fiber km per row, shape (rows,).
+        matrix (numpy.ndarray): Parameters, shape (scenarios, len(PARAMETER_COLUMNS)) (see parameter_matrix).
+
+    Returns:
+        dict: Mapping of metric (COST_METRICS) to an array of shape (scenarios, rows, len(TECHNOLOGIES)).
+    """
+    params = {name: matrix[:, index][:, None] for name, index in PARAMETER_INDEX.items()}
+    n = {technology: counts[:, index][None, :] for index, technology in enumerate(TECHNOLOGIES)}
+    length = fiber_length[None, :]
+    init_capex, hardware, an_opex = {}, {}, {}
+
+    # Fiber: POI equipment plus the fiber route
+    hardware["fiber"] = n["fiber"] * params["hw_setup_cost_fiber"]
+    init_capex["fiber"] = hardware["fiber"] + length * params["focl_constr_cost_fiber"] * (1 + FIBER_ROUTE_OVERHEAD)
+    an_opex["fiber"] = (init_capex["fiber"] * params["an_hw_maint_and_repl_fiber"]
+                        + n["fiber"] * params["an_traffic_fees_one_mbps_fiber"] * params["ch_throughput_fiber"])
+
+    # P2MP and satellite: POI equipment only
+    for technology, suffix in [("p2mp", "p2mp"), ("satellite", "sat")]:
+        hardware[technology] = n[technology] * params[f"hw_setup_cost_{suffix}"]
+        init_capex[technology] = hardware[technology]
+        an_opex[technology] = init_capex[technology] * params[f"an_hw_maint_and_repl_{suffix}"]
+
+    # P2P microwave: radio equipment, relay towers and spectrum licences
+    bandwidth = params["access_link_bandwidth_p2p"] + params["backhaul_link_num_p2p"] * params[
+        "backhaul_link_bandwidth_p2p"]
+    equipment = (params["hw_setup_cost_p2p"] + params["access_link_setup_p2p"]
+                 + params["backhaul_link_num_p2p"] * params["backhaul_link_setup_p2p"])
+    towers = params["retr_tower_num_p2p"] * params["retr_tower_inst_p2p"]
+    hardware["p2p"] = n["p2p"] * equipment
+    init_capex["p2p"] = hardware["p2p"] + n["p2p"] * (towers + params["one_time_license_fee_1mhz_p2p"] * bandwidth)
+    an_opex["p2p"] = hardware["p2p"] * params["an_hw_maint_and_repl_p2p"] + n["p2p"] * (
+        params["an_license_fee_1mhz_p2p"] * bandwidth
+        + params["an_traffic_fees_one_mbps_p2p"] * params["ch_throughput_p2p"])
+
+    results = {metric: [] for metric in COST_METRICS}
+    for technology, suffix in [("fiber", "fiber"), ("p2mp", "p2mp"), ("p2p", "p2p"), ("satellite", "sat")]:
+        pp = params[f"pp_{suffix}"]
+        pp_capex = init_capex[technology] + hardware[technology] * _reinvestments(params, suffix)
+        per_poi = np.divide(1.0, n[technology], out=np.zeros_like(n[technology]), where=n[technology] > 0)
+        values = {
+            "pp_capex": pp_capex,
+            "init_capex": init_capex[technology],
+            "an_opex": an_opex[technology],
+            "pp_coo": pp_capex + pp * an_opex[technology],
+        }
+        values["pp_coo_per_poi"] = values["pp_coo"] * per_poi
+        values["init_capex_per_poi"] = values["init_capex"] * per_poi
+        values["an_opex_per_poi"] = values["an_opex"] * per_poi
+        for metric in COST_METRICS:
+            results[metric].append(values[metric])
+    return {metric: np.stack(arrays, axis=-1) for metric, arrays in results.items()}
+
+
+def _compute_chunk(counts, fiber_length, matrix):
+    # Worker task of sweep_costs
+    return compute_costs(counts, fiber_length, matrix)
+
+
+def results_frame(inputs, scenario_ids, results):
+    """Converts engine output into cost_result rows.
+
+    Args:
+        inputs (dict): Inputs of the computation (see load_poi_inputs).
+        scenario_ids (list): Identifier of every scenario (stored in the estimate column).
+        results (dict): Output of compute_costs.
+
+    Returns:
+        pandas.DataFrame: One row per scenario, analysis, distance and technology, with the columns of
+            cost_result except id.
+    """
+    scenarios, rows, technologies = len(scenario_ids), len(inputs["keys"]), len(TECHNOLOGIES)
+    shape = (scenarios, rows, technologies)
+    keys = inputs["keys"]
+    max_dist_km = np.broadcast_to(keys["max_dist_km"].to_numpy()[None, :, None], shape).ravel()
+    technology = np.broadcast_to(np.array(list(TECHNOLOGIES))[None, None, :], shape).ravel()
+    fiber_length = np.where(technology == "fiber",
+                            np.broadcast_to(inputs["fiber_length"][None, :, None], shape).ravel(), np.nan)
+    frame = pd.DataFrame({
+        "analysis_id": np.broadcast_to(keys["analysis_id"].to_numpy()[None, :, None], shape).ravel(),
+        "technology_selection_approach": SELECTION_APPROACH,
+        "basket_name": pd.Series(max_dist_km).map(lambda km: f"technology_{km}km").to_numpy(),
+        "technology": technology,
+        "number_poi": np.broadcast_to(inputs["counts"][None, :, :], shape).ravel().astype(int),
+        "fiber_length": fiber_length,
+    })
+    for metric in COST_METRICS:
+        frame[metric] = results[metric].ravel()
+    frame["estimate"] = np.broadcast_to(np.asarray(scenario_ids, dtype=object)[:, None, None], shape).ravel()
+    frame["max_dist_km"] = max_dist_km
+    return frame
+
+
+def read_cost_parameters(engine, cost_ids=None):
+    """Reads cost_parameter rows.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        cost_ids (list, optional): Rows to read. Defaults to all rows.
+
+    Returns:
+        pandas.DataFrame: cost_parameter rows.
+    """
+    query = text("SELECT * FROM cost_parameter")
+    params = {}
+    if cost_ids is not None:
+        query = text("SELECT * FROM cost_parameter WHERE cost_id IN :cost_ids").bindparams(
+            bindparam("cost_ids", expanding=True))
+        params["cost_ids"] = list(cost_ids)
+    with engine.connect() as connection:
+        return pd.read_sql(query, connection, params=params)
+
+
+def scenario_grid(base, ranges):
+    """Builds the scenarios of a sensitivity sweep as the cartesian product of parameter values.
+
+    Args:
+        base (pandas.Series or dict): cost_parameter row the scenarios start from.
+        ranges (dict): Mapping of parameter name to the values to sweep, e.g.
+            {"focl_constr_cost_fiber": np.linspace(6000, 10000, 41)}.
+
+    Returns:
+        pandas.DataFrame: One cost_parameter row per scenario, with cost_id <base cost_id>-<n>.
+    """
+    unknown = set(ranges) - set(PARAMETER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown cost parameters: {', '.join(sorted(unknown))}")
+    base = dict(base)
+    names = list(ranges)
+    combinations = list(itertools.product(*(ranges[name] for name in names)))
+    scenarios = pd.DataFrame([base] * len(combinations))
+    if combinations:
+        scenarios[names] = np.array(combinations, dtype=float)
+    scenarios["cost_id"] = [f"{base.get('cost_id', 'scenario')}-{index}" for index in range(len(combinations))]
+    return scenarios
+
+
+def sweep_costs(engine, analysis_ids, parameters, workers=None, chunk_size=DEFAULT_SWEEP_CHUNK_SIZE, inputs=None,
+                as_frame=True):
+    """Computes the cost_result aggregates of analyses for many cost parameter scenarios.
+
+    POI results are aggregated once in the database (see load_poi_inputs); the scenarios are then
+    split into chunks computed by compute_costs in a process pool. Small sweeps run in the calling
+    process, where starting workers would cost more than the computation.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_ids (list): Analysis identifiers, e.g. every analysis of a country.
+        parameters (pandas.DataFrame): One cost_parameter row per scenario (see read_cost_parameters
+            and scenario_grid).
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs; 1 disables the pool.
+        chunk_size (int, optional): Number of scenarios per worker task. Defaults to DEFAULT_SWEEP_CHUNK_SIZE.
+        inputs (dict, optional): Inputs already loaded with load_poi_inputs, to run several sweeps
+            without reading the POI results again.
+        as_frame (bool, optional): Return cost_result rows; False returns the arrays of compute_costs,
+            which large sweeps need since the rows grow with scenarios x distances x technologies.
+            Defaults to True.
+
+    Returns:
+        pandas.DataFrame or dict: cost_result rows of every scenario (see results_frame), or the
+            metric arrays with the scenario axis in the order of parameters.
+    """
+    start_time = time.perf_counter()
+    if inputs is None:
+        inputs = load_poi_inputs(engine, analysis_ids)
+    matrix = parameter_matrix(parameters)
+    chunks = [matrix[start:start + chunk_size] for start in range(0, len(matrix), chunk_size)]
+
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(chunks) <= 1:
+        parts = [compute_costs(inputs["counts"], inputs["fiber_length"], chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            parts = list(executor.map(_compute_chunk, itertools.repeat(inputs["counts"]),
+                                      itertools.repeat(inputs["fiber_length"]), chunks))
+
+    shape = (0, len(inputs["keys"]), len(TECHNOLOGIES))
+    results = {metric: np.concatenate([part[metric] for part in parts]) if parts else np.empty(shape)
+               for metric in COST_METRICS}
+    print(f"{len(matrix)} cost scenarios x {len(inputs['keys'])} analysis distances computed "
+          f"in {time.perf_counter() - start_time:.2f}s")
+    if not as_frame:
+        return results
+    return results_frame(inputs, list(parameters["cost_id"]), results)
+
+
+def store_cost_results(engine, results, batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Upserts computed aggregates into cost_result.
+
+    Row ids are derived from the analysis, scenario, distance and technology, so storing the same
+    results again updates them in place. The rows keep their analysis_id and their scenario id in
+    estimate, so they can be read back with read_cost_results.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        results (pandas.DataFrame): Output of sweep_costs.
+        batch_size (int, optional): Number of rows per statement and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        int: Number of rows written.
+    """
+    rows = results.copy()
+    rows.insert(0, "id", [loader.result_id(analysis_id, f"{estimate}/{basket}/{technology}")
+                          for analysis_id, estimate, basket, technology
+                          in zip(results["analysis_id"], results["estimate"], results["basket_name"],
+                                 results["technology"])])
+    statement = incremental.upsert_statement("cost_result", list(rows.columns), ["id"])
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(statement, loader.to_rows(rows.iloc[start:start + batch_size]))
+            connection.commit()
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    versions.bump_versions(engine, analysis_ids=results["analysis_id"].unique())
+    print(f"cost_result: {len(rows)} rows written")
+    return len(rows)
+
+
+def read_cost_results(engine, analysis_id, estimates=None):
+    """Reads the cost_result rows of an analysis.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_id (str): Analysis identifier.
+        estimates (list, optional): Only read these estimates or scenario ids. Defaults to every scenario.
+
+    Returns:
+        pandas.DataFrame: cost_result rows ordered by scenario, distance and technology.
+    """
+    query = "SELECT * FROM cost_result WHERE analysis_id = :analysis_id"
+    params = {"analysis_id": analysis_id}
+    if estimates is not None:
+        query += " AND estimate IN :estimates"
+        params["estimates"] = list(estimates)
+    query = text(query + " ORDER BY estimate, max_dist_km, technology")
+    if estimates is not None:
+        query = query.bindparams(bindparam("estimates", expanding=True))
+    with engine.connect() as connection:
+        return pd.read_sql(query, connection, params=params)
+
+
+def region_costs(engine, analysis_id, max_dist_km, country_code=None, level="admin1", parameters=None):
+    """Computes the costs of an analysis per region and technology from the admin rollups.
+
+    The POI counts and fiber lengths per region are read from admin_technology_rollup (see
+    rollup.read_technology_rollup), so the computation reads one row per region and technology
+    instead of the POIs.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_id (str): Analysis identifier.
+        max_dist_km (int): Maximum connection distance of the technology assignment.
+        country_code (str, optional): Only compute this country. Defaults to all countries.
+        level (str, optional): "country", "admin1" or "admin2" (see rollup.REGION_LEVELS). Defaults to "admin1".
+        parameters (pandas.DataFrame, optional): One cost_parameter row. Defaults to the cost
+            parameters of the analysis.
+
+    Returns:
+        pandas.DataFrame: One row per region and technology with number_poi, fiber_length and COST_METRICS.
+    """
+    regions = rollup.REGION_LEVELS[level]
+    totals = rollup.read_technology_rollup(engine, analysis_id, max_dist_km, country_code, level)
+    if parameters is None:
+        with engine.connect() as connection:
+            cost_id = connection.execute(text("SELECT cost_parameter_id FROM analysis WHERE analysis_id = :analysis_id"),
+                                         {"analysis_id": analysis_id}).scalar()
+        parameters = read_cost_parameters(engine, [cost_id])
+    if len(parameters) == 0:
+        raise ValueError(f"No cost parameters for analysis {analysis_id}")
+
+    inputs = poi_inputs(totals, index=regions)
+    results = compute_costs(inputs["counts"], inputs["fiber_length"], parameter_matrix(parameters.iloc[:1]))
+    rows, technologies = len(inputs["keys"]), len(TECHNOLOGIES)
+    frame = inputs["keys"].loc[np.repeat(np.arange(rows), technologies)].reset_index(drop=True)
+    frame["technology"] = np.tile(list(TECHNOLOGIES), rows)
+    frame["number_poi"] = inputs["counts"].ravel().astype(int)
+    frame["fiber_length"] = np.where(frame["technology"] == "fiber", np.repeat(inputs["fiber_length"], technologies),
+                                     np.nan)
+    for metric in COST_METRICS:
+        frame[metric] = results[metric][0].ravel()
+    return frame
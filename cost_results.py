@@ -0,0 +1,170 @@
+# Import packages
+import re
+import time
+import pandas as pd
+from sqlalchemy import text
+import loader
+import incremental
+import versions
+import rollup
+from datamodel import COST_MAX_DIST_KM
+
+
+# Per-distance columns of the *-cost-results-poi-info.csv files, e.g. fiber_length_7km
+WIDE_COLUMN = re.compile(r"^(fiber_length|mst_solution|technology)_(\d+)km$")
+
+# Per-distance values stored in cost_result_poi_distance
+DISTANCE_VALUES = ["fiber_length", "mst_solution", "technology"]
+
+# Per-POI columns of cost_result_poi
+POI_COLUMNS = ["id", "poi_id", "analysis_id", "lat", "lon", "cell_site_dist", "_4G_coverage",
+               "is_connected", "is_visible", "num_visible"]
+
+
+# Define functions to load and read POI cost results in long format
+
+
+def melt_distances(chunk):
+    """Converts the wide per-distance columns of a chunk into one row per POI and distance.
+
+    Args:
+        chunk (pandas.DataFrame): Rows of a *-cost-results-poi-info.csv file.
+
+    Returns:
+        pandas.DataFrame: Columns poi_id, max_dist_km, fiber_length, mst_solution and technology,
+            without distances where all three values are missing.
+    """
+    distances = sorted({int(match.group(2)) for match in map(WIDE_COLUMN.match, chunk.columns) if match})
+    parts = []
+    for km in distances:
+        part = pd.DataFrame({"poi_id": chunk["poi_id"].to_numpy(), "max_dist_km": km})
+        for value in DISTANCE_VALUES:
+            column = f"{value}_{km}km"
+            part[value] = chunk[column].to_numpy() if column in chunk.columns else None
+        parts.append(part)
+    if len(parts) == 0:
+        return pd.DataFrame(columns=["poi_id", "max_dist_km"] + DISTANCE_VALUES)
+
+    long = pd.concat(parts, ignore_index=True)
+    long = long[long[DISTANCE_VALUES].notna().any(axis=1)].copy()
+    long["mst_solution"] = pd.to_numeric(long["mst_solution"]).round().astype("Int64")
+    return long
+
+
+def load_cost_results_poi(engine, filepath, analysis_id=None, batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Loads a *-cost-results-poi-info.csv file into cost_result_poi and cost_result_poi_distance.
+
+    The file is streamed in chunks; the per-POI columns go to cost_result_poi and the per-distance
+    columns are melted into cost_result_poi_distance. Rows are upserted, so reloading a file is safe.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        filepath (str): Path to the CSV file.
+        analysis_id (str, optional): Analysis identifier. Defaults to the prefix of the file name.
+        batch_size (int, optional): Number of POIs per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: Number of POI rows and distance rows written.
+    """
+    if analysis_id is None:
+        analysis_id = loader.analysis_id_from_path(filepath)
+
+    start_time = time.perf_counter()
+    poi_types = loader.get_table_columns(engine, "cost_result_poi")
+    stats = {"analysis_id": analysis_id, "poi_rows": 0, "distance_rows": 0}
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+
+        # Make sure the analysis exists for the foreign keys
+        cursor.execute("INSERT IGNORE INTO analysis (analysis_id) VALUES (%s)", [analysis_id])
+
+        for chunk in loader.iter_csv_chunks(filepath, batch_size):
+            chunk = chunk.rename(columns={"4G_coverage": "_4G_coverage"})
+            chunk["analysis_id"] = analysis_id
+            chunk["id"] = [loader.result_id(analysis_id, poi_id) for poi_id in chunk["poi_id"]]
+
+            pois = loader.coerce_chunk(chunk, poi_types)
+            pois = pois[[column for column in POI_COLUMNS if column in pois.columns]]
+            distances = melt_distances(chunk)
+            distances.insert(0, "analysis_id", analysis_id)
+
+            with rollup.track(cursor, pois["poi_id"]):
+                cursor.executemany(incremental.upsert_statement("cost_result_poi", list(pois.columns), ["id"]),
+                                   loader.to_rows(pois))
+                cursor.executemany(
+                    incremental.upsert_statement("cost_result_poi_distance", list(distances.columns),
+                                                 ["analysis_id", "max_dist_km", "poi_id"]),
+                    loader.to_rows(distances))
+            connection.commit()
+
+            stats["poi_rows"] += len(pois)
+            stats["distance_rows"] += len(distances)
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    versions.bump_versions(engine, analysis_ids=[analysis_id])
+    print(f"cost_result_poi ({analysis_id}): {stats['poi_rows']} POIs, {stats['distance_rows']} distance rows "
+          f"in {time.perf_counter() - start_time:.1f}s")
+    return stats
+
+
+def read_cost_results_at(engine, analysis_id, max_dist_km):
+    """Reads the POI cost results of an analysis at one maximum distance (primary key range scan).
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_id (str): Analysis identifier.
+        max_dist_km (int): Maximum connection distance in km.
+
+    Returns:
+        pandas.DataFrame: Columns poi_id, fiber_length, mst_solution and technology.
+    """
+    query = text(
+        "SELECT poi_id, fiber_length, mst_solution, technology FROM cost_result_poi_distance "
+        "WHERE analysis_id = :analysis_id AND max_dist_km = :max_dist_km")
+    with engine.connect() as connection:
+        return pd.read_sql(query, connection, params={"analysis_id": analysis_id, "max_dist_km": max_dist_km})
+
+
+def pivot_wide(long, max_dist_km=COST_MAX_DIST_KM):
+    """Pivots long-format distance results into the wide fiber_length_{i}km / mst_solution_{i}km /
+    technology_{i}km shape, one row per POI.
+
+    Args:
+        long (pandas.DataFrame): Rows with poi_id, max_dist_km and the DISTANCE_VALUES columns.
+        max_dist_km (iterable, optional): Distances to include as columns. Defaults to COST_MAX_DIST_KM.
+
+    Returns:
+        pandas.DataFrame: Wide results indexed by poi_id.
+    """
+    wide = long.pivot(index="poi_id", columns="max_dist_km", values=DISTANCE_VALUES)
+    columns = [(value, km) for km in max_dist_km for value in DISTANCE_VALUES]
+    wide = wide.reindex(columns=pd.MultiIndex.from_tuples(columns))
+    wide.columns = [f"{value}_{km}km" for value, km in columns]
+    return wide
+
+
+def read_cost_results_wide(engine, analysis_id):
+    """Reads the POI cost results of an analysis in the former wide shape.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_id (str): Analysis identifier.
+
+    Returns:
+        pandas.DataFrame: One row per POI with the cost_result_poi columns and the wide per-distance columns.
+    """
+    with engine.connect() as connection:
+        pois = pd.read_sql(text("SELECT * FROM cost_result_poi WHERE analysis_id = :analysis_id"),
+                           connection, params={"analysis_id": analysis_id})
+        long = pd.read_sql(
+            text("SELECT poi_id, max_dist_km, fiber_length, mst_solution, technology "
+                 "FROM cost_result_poi_distance WHERE analysis_id = :analysis_id"),
+            connection, params={"analysis_id": analysis_id})
+    return pois.merge(pivot_wide(long), left_on="poi_id", right_index=True, how="left")
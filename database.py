@@ -0,0 +1,143 @@
+# Import packages
+import os
+import time
+from functools import lru_cache
+from dotenv import dotenv_values
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+import instrumentation
+
+
+# Credential files of the database servers, relative to the repository
+ENV_FILES = {
+    "aws": os.path.join("credentials", ".env.aws"),
+    "local": os.path.join("credentials", ".env.local"),
+}
+
+# Connection pool settings per server. Connections are recycled well before the MySQL
+# wait_timeout and the idle timeouts of AWS networking, and checked with a ping on checkout.
+POOL_SETTINGS = {
+    "aws": {"pool_size": 10, "max_overflow": 20, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": True},
+    "local": {"pool_size": 5, "max_overflow": 10, "pool_timeout": 30, "pool_recycle": 3600, "pool_pre_ping": True},
+}
+
+# Attempts and initial back-off (seconds, doubled per attempt) when opening a connection fails
+CONNECT_RETRIES = 5
+CONNECT_BACKOFF_S = 0.5
+
+
+# Define functions to create the shared database engine and sessions
+
+
+def load_settings(server="aws"):
+    """Reads the database credentials of a server from its .env file.
+
+    Values already set in the environment take precedence over the file.
+
+    Args:
+        server (str, optional): "aws" or "local". Defaults to "aws".
+
+    Returns:
+        dict: DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT.
+    """
+    env_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ENV_FILES[server])
+    values = dotenv_values(env_file_path)
+    keys = ["DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT"]
+    return {key: os.getenv(key, values.get(key)) for key in keys}
+
+
+def database_url(settings):
+    """Builds the SQLAlchemy URL of a database.
+
+    Args:
+        settings (dict): Credentials (see load_settings).
+
+    Returns:
+        str: mysql+mysqlconnector URL.
+    """
+    return (f"mysql+mysqlconnector://{settings['DB_USER']}:{settings['DB_PASSWORD']}"
+            f"@{settings['DB_HOST']}:{settings['DB_PORT']}/{settings['DB_NAME']}")
+
+
+def _add_connect_retries(engine, retries, backoff_s):
+    # Retries new DBAPI connections on transient errors (server restarting, network blips)
+    @event.listens_for(engine, "do_connect")
+    def connect(dialect, connection_record, cargs, cparams):
+        dbapi = dialect.loaded_dbapi
+        for attempt in range(retries):
+            try:
+                return dbapi.connect(*cargs, **cparams)
+            except (dbapi.OperationalError, dbapi.InterfaceError) as e:
+                if attempt == retries - 1:
+                    raise
+                wait_s = backoff_s * 2 ** attempt
+                print(f"Database connection failed ({e}), retrying in {wait_s:.1f}s")
+                time.sleep(wait_s)
+
+
+def create_db_engine(db_url, server="local", retries=CONNECT_RETRIES, backoff_s=CONNECT_BACKOFF_S, **kwargs):
+    """Creates an engine with the pool and retry settings of a server.
+
+    LOAD DATA LOCAL INFILE is enabled for the bulk loaders, and statements are recorded by the
+    instrumentation module when it is enabled. Keyword arguments override the pool settings;
+    passing poolclass (e.g. NullPool in worker processes) drops the sizing settings.
+
+    Args:
+        db_url (str): SQLAlchemy database URL.
+        server (str, optional): Server whose POOL_SETTINGS apply. Defaults to "local".
+        retries (int, optional): Connection attempts. Defaults to CONNECT_RETRIES.
+        backoff_s (float, optional): Initial wait between attempts. Defaults to CONNECT_BACKOFF_S.
+        **kwargs: Further arguments of sqlalchemy.create_engine.
+
+    Returns:
+        sqlalchemy.engine.Engine: New engine.
+    """
+    settings = dict(POOL_SETTINGS[server])
+    if "poolclass" in kwargs:
+        settings = {"pool_pre_ping": settings["pool_pre_ping"]}
+    settings.update(kwargs)
+    settings.setdefault("connect_args", {"allow_local_infile": True})
+    engine = create_engine(db_url, echo=False, **settings)
+    _add_connect_retries(engine, retries, backoff_s)
+    instrumentation.instrument_engine(engine)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def get_engine(server="aws"):
+    """Returns the shared engine of a server, creating it on first use.
+
+    Every script and service in a process reuses the same connection pool.
+
+    Args:
+        server (str, optional): "aws" or "local". Defaults to "aws".
+
+    Returns:
+        sqlalchemy.engine.Engine: Cached engine.
+    """
+    return create_db_engine(database_url(load_settings(server)), server)
+
+
+@lru_cache(maxsize=None)
+def get_sessionmaker(server="aws"):
+    """Returns the session factory bound to the shared engine of a server.
+
+    Args:
+        server (str, optional): "aws" or "local". Defaults to "aws".
+
+    Returns:
+        sqlalchemy.orm.sessionmaker: Cached session factory.
+    """
+    return sessionmaker(bind=get_engine(server), expire_on_commit=False)
+
+
+def get_session(server="aws"):
+    """Opens an ORM session on the shared engine of a server.
+
+    Args:
+        server (str, optional): "aws" or "local". Defaults to "aws".
+
+    Returns:
+        sqlalchemy.orm.Session: New session, to be closed by the caller (or used as a context manager).
+    """
+    return get_sessionmaker(server)()
@@ -1,14 +1,719 @@
 # Import necessary packages
-from sqlalchemy import Table, Column, Integer, Float, String, Boolean, Enum, create_engine, MetaData, inspect, ForeignKey
-from sqlalchemy.orm import relationship, sessionmaker, declarative_base
+from sqlalchemy import Table, Column, Integer, BigInteger, Float, String, Boolean, DateTime, Enum, Computed, MetaData, inspect, ForeignKey, Index, text
+from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy.types import UserDefinedType
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.ext.compiler import compiles
 from geoalchemy2 import Geometry
-from mysql import connector
+
+
+# Spatial reference system of the generated point columns (WGS 84)
+POINT_SRID = 4326
+
+# Maximum connection distances (km) of the cost model, one cost_result_poi_distance row each
+COST_MAX_DIST_KM = range(1, 26)
+
+
+# Define SRID-aware POINT type for generated location columns
+
+class SridPoint(UserDefinedType):
+    """MySQL POINT column restricted to one SRID, as required for a usable SPATIAL INDEX."""
+
+    cache_ok = True
+
+    def __init__(self, srid=POINT_SRID):
+        self.srid = srid
+
+    def get_col_spec(self, **kw):
+        return f"POINT SRID {self.srid}"
+
+
+def point_column():
+    """Returns a stored generated POINT column computed from the lon and lat columns.
+
+    The column is filled by MySQL on every insert and update, so loaders never write it. Its DDL is
+    emitted by generated_point_ddl, as the generic Computed DDL does not fit MySQL spatial columns.
+
+    Returns:
+        sqlalchemy.Column: Non-nullable generated geometry column.
+    """
+    return Column(SridPoint(POINT_SRID), Computed(f"ST_SRID(POINT(lon, lat), {POINT_SRID})", persisted=True),
+                  nullable=False)
+
+
+@compiles(CreateColumn, "mysql")
+def generated_point_ddl(element, compiler, **kw):
+    """Compiles the MySQL definition of a column, spelling out generated SridPoint columns.
+
+    geoalchemy2 compiles Computed for MySQL as "AS (SRID(...))" without STORED, which is not valid
+    for a POINT column under a SPATIAL INDEX. Generated SridPoint columns are written as
+    "GENERATED ALWAYS AS (expr) STORED NOT NULL SRID n" instead; other columns compile as usual.
+
+    Args:
+        element (sqlalchemy.schema.CreateColumn): Column being created.
+        compiler (sqlalchemy.sql.compiler.DDLCompiler): MySQL DDL compiler.
+        **kw: Further compiler arguments.
+
+    Returns:
+        str: Column definition.
+    """
+    column = element.element
+    if not isinstance(column.type, SridPoint) or column.computed is None:
+        return compiler.visit_create_column(element, **kw)
+    expression = compiler.sql_compiler.process(column.computed.sqltext, include_table=False, literal_binds=True)
+    return (f"{compiler.preparer.format_column(column)} POINT GENERATED ALWAYS AS ({expression}) STORED "
+            f"{'NULL' if column.nullable else 'NOT NULL'} SRID {column.type.srid}")
+
+
+def cost_result_poi_wide_view_sql():
+    """Returns the SQL of the cost_result_poi_wide view.
+
+    The view pivots cost_result_poi_distance back into the former wide shape, with
+    fiber_length_{i}km, mst_solution_{i}km and technology_{i}km columns for every distance. The
+    cost_result_poi columns are listed from the model rather than selected with c.*, so the former
+    wide columns, which migrated databases keep unless dropped, do not clash with the pivots.
+
+    Returns:
+        str: CREATE OR REPLACE VIEW statement.
+    """
+    columns = [f"c.`{column.name}`" for column in Base.metadata.tables["cost_result_poi"].columns]
+    pivots = []
+    for km in COST_MAX_DIST_KM:
+        for column in ("fiber_length", "mst_solution", "technology"):
+            pivots.append(f"MAX(CASE WHEN d.max_dist_km = {km} THEN d.{column} END) AS {column}_{km}km")
+    return ("CREATE OR REPLACE VIEW cost_result_poi_wide AS SELECT " + ", ".join(columns + pivots) +
+            " FROM cost_result_poi c LEFT JOIN cost_result_poi_distance d"
+            " ON d.poi_id = c.poi_id AND d.analysis_id = c.analysis_id GROUP BY c.id")
+
+
+# Define base class for all database models
+Base = declarative_base()
+
+# Define association tables for many-to-many relationships
+# POIs used in each analysis
+analysis_poi_association = Table('analysis_poi_association', Base.metadata,
+                                 Column(
+                                     'analysis_id', String(50), ForeignKey('analysis.analysis_id')),
+                                 Column(
+                                     'poi_id', String(50), ForeignKey('point_of_interest.poi_id'))
+                                 )
+
+# Cell sites used in each analysis
+analysis_cellsite_association = Table('analysis_cellsite_association', Base.metadata,
+                                      Column(
+                                          'analysis_id', String(50), ForeignKey('analysis.analysis_id')),
+                                      Column(
+                                          'ict_id', String(50), ForeignKey('cell_site.ict_id'))
+                                      )
+
+# Transmission nodes used in each analysis
+analysis_transmissionnode_association = Table('analysis_transmissionnode_association', Base.metadata,
+                                              Column(
+                                                  'analysis_id', String(50), ForeignKey('analysis.analysis_id')),
+                                              Column(
+                                                  'ict_id', String(50), ForeignKey('transmission_node.ict_id'))
+                                              )
+
+# Mobile coverage contours used in each analysis
+analysis_coverage_association = Table('analysis_coverage_association', Base.metadata,
+                                      Column(
+                                          'analysis_id', String(50), ForeignKey('analysis.analysis_id')),
+                                      Column(
+                                          'contour_id', Integer, ForeignKey('cell_coverage.contour_id'))
+                                      )
+
+# Define Analysis table
+class Analysis(Base):
+    # Table name
+    __tablename__ = 'analysis'
+
+    # Columns
+    analysis_id = Column(String(50), primary_key=True)
+    cost_parameter_id = Column(String(50), ForeignKey('cost_parameter.cost_id'))
+
+    # Define relationships with Costs, POIs, Cell Sites and Transmission Nodes
+    cost_parameter = relationship("CostParameter", back_populates="analyses")
+    pointsofinterest = relationship(
+        "PointOfInterest",
+        secondary=analysis_poi_association,
+        back_populates="analyses")
+    cellsites = relationship(
+        "CellSite",
+        secondary=analysis_cellsite_association,
+        back_populates="analyses")
+    transmissionnodes = relationship(
+        "TransmissionNode",
+        secondary=analysis_transmissionnode_association,
+        back_populates="analyses")
+    coveragecontours = relationship(
+        "CellCoverage",
+        secondary=analysis_coverage_association,
+        back_populates="analyses")
+
+# Define Point of interest table
+class PointOfInterest(Base):
+    # Table name
+    __tablename__ = 'point_of_interest'
+
+    # Define Enum for ConnectivityType
+    ConnectivityType = Enum(
+        "unknown", "mobile", "mobile_broadband", "metro", "fiber", "wireless", "satellite", "wired",
+        name="connectivity_type_enum"
+    )
+
+    # Columns
+    poi_id = Column(String(50), primary_key=True)
+    source_poi_id = Column(String(50))
+    dataset_id = Column(String(50), nullable=False, index=True)
+    lat = Column(Float, nullable=False, index=True)
+    lon = Column(Float, nullable=False, index=True)
+    connectivity_type = Column(ConnectivityType, index=True)  # Using Enum for connectivity type
+    poi_type = Column(String(50), nullable=False)
+    is_public = Column(Boolean)
+    poi_subtype = Column(String(50))
+    country_code = Column(String(3), nullable=False)
+    admin1 = Column(String(100))
+    admin2 = Column(String(100))
+    admin3 = Column(String(100))
+    is_connected = Column(Boolean, index=True)
+    has_electricity = Column(Boolean)
+    electricity_type = Column(String(50))
+    label = Column(String(50))
+    geom = point_column()
+
+    # Spatial index on the generated location column
+    __table_args__ = (Index('ix_point_of_interest_geom', 'geom', mysql_prefix='SPATIAL'),)
+
+    # Define the relationships with other tables
+    analyses = relationship(
+        "Analysis",
+        secondary=analysis_poi_association,
+        back_populates="pointsofinterest")
+    mapping_result = relationship("MappingResult", back_populates="point_of_interest")
+    visibility_result = relationship("VisibilityResult", back_populates="point_of_interest")
+    fiber_path_result_poi = relationship(
+        "FiberPathResultPOI", back_populates="point_of_interest")
+    cost_result_poi = relationship("CostResultPOI", back_populates="point_of_interest")
+
+# Define Cell site table
+class CellSite(Base):
+    # Table name
+    __tablename__ = 'cell_site'
+
+    # Define Enum for radio type
+    RadioType = Enum(
+        "2G", "3G", "4G", "5G",
+        name="radio_type_enum"
+    )
+
+    # Define Enum for backhaul type
+    BackhaulType = Enum(
+        "fiber", "microwave", "satellite",
+        name="backhaul_type_enum"
+    )
+
+    # Define Enum for power source
+    PowerSource = Enum(
+        "grid", "generator", "solar",
+        name="power_source_enum"
+    )
+
+    # Columns
+    ict_id = Column(String(50), primary_key=True)
+    source_ict_id = Column(String(50), index=True)
+    source_cell_id = Column(String(50))
+    dataset_id = Column(String(50), nullable=False, index=True)
+    country_code = Column(String(3), nullable=False)
+    lat = Column(Float, nullable=False, index=True)
+    lon = Column(Float, nullable=False, index=True)
+    admin1 = Column(String(100))
+    admin2 = Column(String(100))
+    admin3 = Column(String(100))
+    operator_name = Column(String(100))
+    radio_type = Column(RadioType, index=True)
+    downlink_frequency_mhz = Column(Float)
+    uplink_frequency_mhz = Column(Float)
+    max_channel_bandwidth_mhz = Column(Float)
+    eirp_dbm = Column(Float)
+    tower_height = Column(Float)
+    antenna_height = Column(Float)
+    mechanical_tilt_degrees = Column(Float)
+    electrical_tilt_degrees = Column(Float)
+    azimuth_degrees = Column(Float)
+    antenna_model = Column(String(100))
+    antenna_gain = Column(Float)
+    antenna_horizontal_beamwidth_degrees = Column(Float)
+    antenna_vertical_beamwidth_degrees = Column(Float)
+    backhaul_type = Column(BackhaulType, index=True)
+    backhaul_throuput_mbps = Column(Float)
+    power_source = Column(PowerSource, index=True)
+    geom = point_column()
+
+    # Spatial index on the generated location column
+    __table_args__ = (Index('ix_cell_site_geom', 'geom', mysql_prefix='SPATIAL'),)
+
+    # Define the relationships with other tables
+    analyses = relationship(
+        "Analysis",
+        secondary=analysis_cellsite_association,
+        back_populates="cellsites")
+
+# Define Transmission node table
+class TransmissionNode(Base):
+    # Table name
+    __tablename__ = 'transmission_node'
+
+    # Enum for transmission medium
+    TransmissionMedium = Enum(
+        "fiber", "microwave", "copper", "coaxial", "unknown",
+        name="transmission_medium_enum"
+    )
+
+    # Enum for backhaul technologies
+    BackhaulTechnologies = Enum(
+        "dwdm", "sdh", "tdm", "sonet",
+        name="backhaul_technologies_enum"
+    )
+
+    # Enum for node status
+    NodeStatus = Enum(
+        "proposed", "planned", "underconstruction", "operational", "decommissioned", "inactive",
+        name="node_status_enum"
+    )
+
+    # Enum for power source
+    PowerSource = Enum(
+        "grid", "generator", "solar",
+        name="power_source_enum"
+    )
+
+    # Columns
+    ict_id = Column(String(50), primary_key=True)
+    source_ict_id = Column(String(50))
+    dataset_id = Column(String(50), nullable=False, index=True)
+    country_code = Column(String(3), nullable=False, index=True)
+    lat = Column(Float, nullable=False, index=True)
+    lon = Column(Float, nullable=False, index=True)
+    admin1 = Column(String(100))
+    admin2 = Column(String(100))
+    admin3 = Column(String(100))
+    physical_infrastructure_provider = Column(String(100))
+    network_providers = Column(String(100))
+    transmission_medium = Column(TransmissionMedium, index=True)
+    access_technologies = Column(String(100))
+    backhaul_technologies = Column(BackhaulTechnologies, index=True)
+    is_actual = Column(Boolean, nullable=False)
+    node_status = Column(NodeStatus, index=True)
+    equipped_capacity_access_mbps = Column(Integer)
+    potential_capacity_access_mbps = Column(Integer)
+    equipped_capacity_backhaul_mbps = Column(Integer)
+    potential_capacity_backhaul_mbps = Column(Integer)
+    is_powered = Column(Boolean)
+    power_source = Column(PowerSource, index=True)
+    geom = point_column()
+
+    # Spatial index on the generated location column
+    __table_args__ = (Index('ix_transmission_node_geom', 'geom', mysql_prefix='SPATIAL'),)
+
+    # Define the relationships with other tables
+    analyses = relationship(
+        "Analysis",
+        secondary=analysis_transmissionnode_association,
+        back_populates="transmissionnodes")
+
+# Define Cell coverage table
+class CellCoverage(Base):
+    # Table name
+    __tablename__ = 'cell_coverage'
+
+    # Columns
+    contour_id = Column(Integer, primary_key=True)
+    fid = Column(Integer)
+    ID = Column(Integer)
+    layer = Column(Integer)
+    path = Column(String(255))
+    coverage = Column(Integer, nullable=False)
+    geom = Column(Geometry('MULTIPOLYGON', srid=POINT_SRID, spatial_index=False), nullable=False)
+
+    # Spatial index on the coverage contours
+    __table_args__ = (Index('ix_cell_coverage_geom', 'geom', mysql_prefix='SPATIAL'),)
+
+    # Define the relationships with other tables
+    analyses = relationship(
+        "Analysis",
+        secondary=analysis_coverage_association,
+        back_populates="coveragecontours")
+
+# Define Cost parameter table
+
+class CostParameter(Base):
+    # Table name
+    __tablename__ = 'cost_parameter'
+
+    # Columns
+    cost_id = Column(String(50), primary_key=True)
+    hw_setup_cost_fiber = Column(Float, nullable=False)
+    focl_constr_cost_fiber = Column(Float, nullable=False)
+    reinv_period_fiber = Column(Float, nullable=False)
+    an_hw_maint_and_repl_fiber = Column(Float, nullable=False)
+    pp_fiber = Column(Float, nullable=False)
+    an_traffic_fees_one_mbps_fiber = Column(Float, nullable=False)
+    an_isp_fees_one_mbps_fiber = Column(Float, nullable=False)
+    ch_throughput_fiber = Column(Float, nullable=False)
+    hw_setup_cost_p2mp = Column(Float, nullable=False)
+    reinv_period_p2mp = Column(Float, nullable=False)
+    an_hw_maint_and_repl_p2mp = Column(Float, nullable=False)
+    pp_p2mp = Column(Float, nullable=False)
+    an_traffic_fees_one_mbps_p2mp = Column(Float, nullable=False)
+    an_isp_fees_one_mbps_p2mp = Column(Float, nullable=False)
+    ch_throughput_p2mp = Column(Float, nullable=False)
+    hw_setup_cost_p2p = Column(Float, nullable=False)
+    access_link_setup_p2p = Column(Float, nullable=False)
+    backhaul_link_num_p2p = Column(Float, nullable=False)
+    backhaul_link_setup_p2p = Column(Float, nullable=False)
+    retr_tower_num_p2p = Column(Float, nullable=False)
+    retr_tower_inst_p2p = Column(Float, nullable=False)
+    access_link_bandwidth_p2p = Column(Float, nullable=False)
+    backhaul_link_bandwidth_p2p = Column(Float, nullable=False)
+    one_time_license_fee_1mhz_p2p = Column(Float, nullable=False)
+    an_license_fee_1mhz_p2p = Column(Float, nullable=False)
+    an_traffic_fees_one_mbps_p2p = Column(Float, nullable=False)
+    an_isp_fees_one_mbps_p2p = Column(Float, nullable=False)
+    ch_throughput_p2p = Column(Float, nullable=False)
+    # Reinvestment, maintenance and payback of the P2P equipment; nullable for rows created before they were added
+    reinv_period_p2p = Column(Float)
+    an_hw_maint_and_repl_p2p = Column(Float)
+    pp_p2p = Column(Float)
+    hw_setup_cost_sat = Column(Float, nullable=False)
+    reinv_period_sat = Column(Float, nullable=False)
+    an_hw_maint_and_repl_sat = Column(Float, nullable=False)
+    pp_sat = Column(Float, nullable=False)
+    an_traffic_fees_one_mbps_sat = Column(Float, nullable=False)
+    an_isp_fees_one_mbps_sat = Column(Float, nullable=False)
+    ch_throughput_sat = Column(Float, nullable=False)
+
+    # Define the relationships with other tables
+    analyses = relationship("Analysis", back_populates="cost_parameter")
+
+# Define Mapping results table
+
+class MappingResult(Base):
+    # Table name
+    __tablename__ = 'mapping_result'
+
+    # Columns
+    id = Column(String(50), primary_key=True)
+    poi_id = Column(
+        String(50),
+        ForeignKey('point_of_interest.poi_id'),
+        nullable=False)
+    lat = Column(Float, nullable=False)
+    lon = Column(Float, nullable=False)
+    cell_site_dist = Column(Float)
+    _4G_cell_site_dist = Column(Float)
+    _5G_cell_site_dist = Column(Float)
+    transmission_node_dist = Column(Float)
+    fiber_node_dist = Column(Float)
+    population_1km = Column(Integer)
+    poi_count_1km = Column(Integer)
+    population_3km = Column(Integer)
+    poi_count_3km = Column(Integer)
+    population_5km = Column(Integer)
+    poi_count_5km = Column(Integer)
+    _4G_coverage = Column(Boolean)
+
+    # Define the relationships with other tables
+    point_of_interest = relationship(
+        "PointOfInterest", back_populates="mapping_result")
+
+# Define Visibility results table
+
+class VisibilityResult(Base):
+    # Table name
+    __tablename__ = 'visibility_result'
+
+    # Columns
+    id = Column(String(50), primary_key=True)
+    poi_id = Column(
+        String(50),
+        ForeignKey('point_of_interest.poi_id'),
+        nullable=False)
+
+    # Visibility results (the visible cell sites are in visibility_link)
+    is_visible = Column(Boolean)
+    num_visible = Column(Integer)
+
+    # Define the relationships with other tables
+    point_of_interest = relationship(
+        "PointOfInterest", back_populates="visibility_result")
+
+# Define Visibility links table - one row per visible cell site of a POI
+
+class VisibilityLink(Base):
+    # Table name
+    __tablename__ = 'visibility_link'
+
+    # Columns (rank 1 is the first cell site listed for the POI)
+    poi_id = Column(
+        String(50),
+        ForeignKey('point_of_interest.poi_id'),
+        primary_key=True)
+    rank = Column(Integer, primary_key=True, autoincrement=False)
+    ict_id = Column(String(50), nullable=False)
+    lat = Column(Float)
+    lon = Column(Float)
+    radio_type = Column(String(50))
+    ground_distance = Column(Float)
+    antenna_los_distance = Column(Float)
+    azimuth_angle = Column(Float)
+    los_geometry = Column(Geometry('LINESTRING', srid=POINT_SRID, spatial_index=False))
+
+    # Reverse lookups from a cell site to the POIs that see it
+    __table_args__ = (Index('ix_visibility_link_ict', 'ict_id', 'poi_id'),)
+
+# Define Fiber path results tables - POI level
+
+class FiberPathResultPOI(Base):
+    # Table name
+    __tablename__ = 'fiber_path_result_poi'
+
+    # Columns
+    id = Column(String(50), primary_key=True)
+    poi_id = Column(
+        String(50),
+        ForeignKey('point_of_interest.poi_id'),
+        nullable=False)
+    analysis_id = Column(String(50), ForeignKey('analysis.analysis_id'), index=True)
+    closest_node_id = Column(String(50))
+    closest_node_distance = Column(Float)
+    connected_node_id = Column(String(50))
+    connected_node_distance = Column(Float)
+    upstream_node_id = Column(String(50))
+    upstream_node_distance = Column(Float)
+
+    # Define the relationships with other tables
+    point_of_interest = relationship(
+        "PointOfInterest",
+        back_populates="fiber_path_result_poi")
+
+# Define Fiber path results tables - ordered nodes of each POI's fiber path
+
+class FiberPathResultPath(Base):
+    # Table name
+    __tablename__ = 'fiber_path_result_path'
+
+    # Columns (the primary key order rebuilds every path of an analysis with one range scan)
+    analysis_id = Column(String(50), ForeignKey('analysis.analysis_id'), primary_key=True)
+    poi_id = Column(String(50), ForeignKey('point_of_interest.poi_id'), primary_key=True)
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    node_id = Column(String(50), nullable=False)
+
+    # "Which paths pass through node N" lookups
+    __table_args__ = (Index('ix_fiber_path_result_path_node', 'node_id', 'analysis_id', 'poi_id'),)
+
+# Define Fiber path results tables - edge level
+
+class FiberPathResultEdge(Base):
+    # Table name
+    __tablename__ = 'fiber_path_result_edge'
+
+    # Columns
+    edge_id = Column(Integer, primary_key=True)
+    analysis_id = Column(String(50), ForeignKey('analysis.analysis_id'), index=True)
+    u = Column(Integer, index=True)
+    v = Column(Integer, index=True)
+    key = Column(Integer)
+    length = Column(Integer)
+    geometry = Column(Geometry('LINESTRING', srid=POINT_SRID))
+    name = Column(String(50))
+    osmid = Column(Integer)
+    highway = Column(String(50))
+    oneway = Column(Integer)
+    reversed = Column(Integer)
+    lanes = Column(Integer)
+    service = Column(String(50))
+    ref = Column(String(50))
+    maxspeed = Column(Integer)
+    bridge = Column(String(50))
+    junction = Column(String(50))
+    access = Column(String(50))
+
+# Define Fiber path results tables - node level
+
+class FiberPathResultNode(Base):
+    # Table name
+    __tablename__ = 'fiber_path_result_node'
+
+    # Columns
+    node_id = Column(Integer, primary_key=True)
+    analysis_id = Column(String(50), ForeignKey('analysis.analysis_id'), index=True)
+    osmid = Column(String(50))
+    y = Column(Float)
+    x = Column(Float)
+    splitter = Column(String(50))
+    street_count = Column(Integer)
+    lon = Column(Float)
+    lat = Column(Float)
+    geometry = Column(Geometry('POINT', srid=POINT_SRID))
+    highway = Column(String(50))
+
+# Define Cost results tables - POI level
+
+class CostResultPOI(Base):
+    # Table name
+    __tablename__ = 'cost_result_poi'
+
+    # Columns
+    id = Column(String(50), primary_key=True)
+    poi_id = Column(
+        String(50),
+        ForeignKey('point_of_interest.poi_id'),
+        nullable=False)
+    analysis_id = Column(String(50), ForeignKey('analysis.analysis_id'), index=True)
+    lat = Column(Float)
+    lon = Column(Float)
+    cell_site_dist = Column(Float)
+    _4G_coverage = Column(Integer)
+    is_connected = Column(Integer)
+    is_visible = Column(Boolean)
+    num_visible = Column(Integer)
+
+    # Define the relationships with other tables
+    point_of_interest = relationship(
+        "PointOfInterest", back_populates="cost_result_poi")
+
+# Define Cost results tables - POI level, one row per maximum connection distance
+# (the wide fiber_length_{i}km / mst_solution_{i}km / technology_{i}km shape is the cost_result_poi_wide view)
+
+class CostResultPOIDistance(Base):
+    # Table name
+    __tablename__ = 'cost_result_poi_distance'
+
+    # Columns (the primary key order serves "all POIs of an analysis at one distance")
+    analysis_id = Column(String(50), ForeignKey('analysis.analysis_id'), primary_key=True)
+    max_dist_km = Column(Integer, primary_key=True)
+    poi_id = Column(String(50), ForeignKey('point_of_interest.poi_id'), primary_key=True)
+    fiber_length = Column(Float)
+    mst_solution = Column(Integer)
+    technology = Column(String(50))
+
+    # Per-POI lookups
+    __table_args__ = (Index('ix_cost_result_poi_distance_poi', 'poi_id', 'analysis_id'),)
+
+# Define Cost results tables - technology assignment solution level
+
+class CostResult(Base):
+    # Table name
+    __tablename__ = 'cost_result'
+
+    # Columns
+    id = Column(String(50), primary_key=True)
+    analysis_id = Column(String(50), ForeignKey('analysis.analysis_id'), index=True)
+    technology_selection_approach = Column(String(50))
+    basket_name = Column(String(50))
+    technology = Column(String(50))
+    number_poi = Column(Integer)
+    fiber_length = Column(Float)
+    pp_coo = Column(Float)
+    pp_coo_per_poi = Column(Float)
+    pp_capex = Column(Float)
+    init_capex = Column(Float)
+    an_opex = Column(Float)
+    init_capex_per_poi = Column(Float)
+    an_opex_per_poi = Column(Float)
+    p2p = Column(String(50))
+    estimate = Column(String(50))  # Cost estimate or scenario id, e.g. "central"
+    max_dist_km = Column(Integer)
+
+# Define Ingest fingerprint table - content hash of each ingested row
+
+class IngestFingerprint(Base):
+    # Table name
+    __tablename__ = 'ingest_fingerprint'
+
+    # Columns
+    table_name = Column(String(64), primary_key=True)
+    row_key = Column(String(50), primary_key=True)
+    dataset_id = Column(String(50), nullable=False)
+    row_hash = Column(BigInteger, nullable=False)
+
+    # Fingerprints are always read per table and dataset
+    __table_args__ = (Index('ix_ingest_fingerprint_dataset', 'table_name', 'dataset_id'),)
+
+
+# Define Schema version table - one row per applied schema migration
+
+class SchemaVersion(Base):
+    # Table name
+    __tablename__ = 'schema_version'
+
+    # Columns
+    version = Column(Integer, primary_key=True, autoincrement=True)
+    schema_hash = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, nullable=False)
+    statements = Column(Integer, nullable=False)
+
+
+# Define Data version table - change counter per dataset, analysis and country, used by the query cache
+
+class DataVersion(Base):
+    # Table name
+    __tablename__ = 'data_version'
+
+    # Columns
+    scope = Column(String(20), primary_key=True)
+    scope_id = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+# Define Admin rollup table - POI totals per region and analysis, maintained by rollup.py
+# (analysis_id and missing admin names are stored as empty strings, as primary key columns cannot be NULL)
+
+class AdminRollup(Base):
+    # Table name
+    __tablename__ = 'admin_rollup'
+
+    # Columns
+    country_code = Column(String(3), primary_key=True)
+    admin1 = Column(String(100), primary_key=True)
+    admin2 = Column(String(100), primary_key=True)
+    analysis_id = Column(String(50), primary_key=True)
+    number_poi = Column(BigInteger, nullable=False)
+    number_connected = Column(BigInteger, nullable=False)
+    number_unconnected = Column(BigInteger, nullable=False)
+    number_4G_coverage = Column(BigInteger, nullable=False)
+    number_cell_site_dist = Column(BigInteger, nullable=False)
+    sum_cell_site_dist = Column(Float, nullable=False)
+
+    # Dashboards read one analysis at a time
+    __table_args__ = (Index('ix_admin_rollup_analysis', 'analysis_id', 'country_code'),)
+
+
+# Define Admin technology rollup table - POIs and fiber length per region, analysis, distance and technology
+
+class AdminTechnologyRollup(Base):
+    # Table name
+    __tablename__ = 'admin_technology_rollup'
+
+    # Columns
+    country_code = Column(String(3), primary_key=True)
+    admin1 = Column(String(100), primary_key=True)
+    admin2 = Column(String(100), primary_key=True)
+    analysis_id = Column(String(50), primary_key=True)
+    max_dist_km = Column(Integer, primary_key=True, autoincrement=False)
+    technology = Column(String(50), primary_key=True)
+    number_poi = Column(BigInteger, nullable=False)
+    fiber_length = Column(Float, nullable=False)
+
+    # Dashboards read one analysis at a time
+    __table_args__ = (Index('ix_admin_technology_rollup_analysis', 'analysis_id', 'max_dist_km', 'country_code'),)
 
 
 # Define function to create data model
 
 
-def create_data_model(db_name, db_user, db_password, db_host, db_port):
+def create_data_model(engine):
     """Creates a data model for storing telecommunication infrastructure information.
 
     This function creates a data model for a database containing information about
@@ -16,6 +721,7 @@ def create_data_model(db_name, db_user, db_password, db_host, db_port):
     transmission nodes, and analyses performed on this infrastructure.
 
     Warning: This function will drop all tables and data in the database if they already exist, before creating new tables.
+    Use migrate.migrate_data_model to apply schema changes to a populated database instead.
 
     The data model consists of the following tables:
     - Analysis: Contains information about analyses performed on the infrastructure.
@@ -26,66 +732,44 @@ def create_data_model(db_name, db_user, db_password, db_host, db_port):
     - CostParameter: Contains cost parameters for the cost model.
     - MappingResult: Contains mapping results for POIs.
     - VisibilityResult: Contains visibility results for POIs.
+    - VisibilityLink: Contains the cell sites visible from each POI.
     - FiberPathResultPOI: Contains fiber path results for POIs.
+    - FiberPathResultPath: Contains the ordered nodes of each POI's fiber path.
     - FiberPathResultEdge: Contains fiber path results for edges.
     - FiberPathResultNode: Contains fiber path results for nodes.
     - CostResultPOI: Contains cost results for POIs.
+    - CostResultPOIDistance: Contains cost results for POIs per maximum connection distance.
     - CostResult: Contains cost results for technology assignment solutions.
+    - IngestFingerprint: Contains content hashes of ingested rows, used by incremental ingest.
+    - SchemaVersion: Contains the schema versions applied by migrations (see migrate.py).
+    - DataVersion: Contains the data version counters used to invalidate cached queries (see versions.py).
+    - AdminRollup: Contains POI totals per admin region and analysis (see rollup.py).
+    - AdminTechnologyRollup: Contains POI totals per admin region, analysis, distance and technology (see rollup.py).
 
     Args:
-        use_local (bool, optional): Flag to indicate using a local development database.
-            Defaults to True.
+        engine (sqlalchemy.engine.Engine): Engine connected to the database (see database.get_engine).
 
     Returns:
         None
     """
 
-    # Connect to existing database and drop tables
-    try:
-        # Connect to existing database
-        with connector.connect(
-            host=db_host,
-            user=db_user,
-            password=db_password,
-            database=db_name,
-        ) as existing_database:
-
-            # Create cursor object
-            with existing_database.cursor() as cursor:
-
-                # Set foreign key checks to 0
-                command = "SET FOREIGN_KEY_CHECKS=0"
-                cursor.execute(command)
-                existing_database.commit()
-
-                # List of tables to drop
-                tables_to_drop = ["analysis", "cell_site", "cost_parameter", "point_of_interest", "transmission_node", "cell_coverage",
-                                  "mapping_result", "visibility_result", "fiber_path_result_poi", "fiber_path_result_edge", "fiber_path_result_node",
-                                  "cost_result", "cost_result_poi",
-                                  "analysis_cellsite_association", "analysis_poi_association", "analysis_transmissionnode_association", "analysis_coverage_association"]
-
-                for table in tables_to_drop:
-                    # Drop table (if exists) for each table in the list
-                    command = f"DROP TABLE IF EXISTS {table}"
-                    cursor.execute(command)
-                    existing_database.commit()
-
-                # Set foreign key checks back to 1
-                command = "SET FOREIGN_KEY_CHECKS=1"
-                cursor.execute(command)
-                existing_database.commit()
-
-    except connector.Error as e:
-        print(e)
-
-    # Connect to database using SQLAlchemy
-    db_url = f"mysql+mysqlconnector://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-    engine = create_engine(db_url, echo=False)
-
-    # Define base class for all database models and reflect tables
-    Base = declarative_base()
-    Base.metadata.reflect(bind=engine)
-    table_names = Base.metadata.tables.keys()
+    # List of tables to drop
+    tables_to_drop = ["analysis", "cell_site", "cost_parameter", "point_of_interest", "transmission_node", "cell_coverage",
+                      "mapping_result", "visibility_result", "visibility_link", "fiber_path_result_poi", "fiber_path_result_path", "fiber_path_result_edge", "fiber_path_result_node",
+                      "cost_result", "cost_result_poi", "cost_result_poi_distance",
+                      "analysis_cellsite_association", "analysis_poi_association", "analysis_transmissionnode_association", "analysis_coverage_association",
+                      "ingest_fingerprint", "schema_version", "data_version", "admin_rollup", "admin_technology_rollup"]
+
+    # Drop the views and tables on one connection, with foreign key checks disabled
+    with engine.begin() as connection:
+        connection.execute(text("SET FOREIGN_KEY_CHECKS=0"))
+        connection.execute(text("DROP VIEW IF EXISTS cost_result_poi_wide"))
+        for table in tables_to_drop:
+            connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        connection.execute(text("SET FOREIGN_KEY_CHECKS=1"))
+
+    # List the tables left in the database
+    table_names = inspect(engine).get_table_names()
 
     # Check if there are any tables in the database
     if len(table_names) == 0:
@@ -96,529 +780,16 @@ def create_data_model(db_name, db_user, db_password, db_host, db_port):
         for table_name in table_names:
             print(table_name)
 
-    # Define association tables for many-to-many relationships
-    # POIs used in each analysis
-    analysis_poi_association = Table('analysis_poi_association', Base.metadata,
-                                     Column(
-                                         'analysis_id', String(50), ForeignKey('analysis.analysis_id')),
-                                     Column(
-                                         'poi_id', String(50), ForeignKey('point_of_interest.poi_id'))
-                                     )
-
-    # Cell sites used in each analysis
-    analysis_cellsite_association = Table('analysis_cellsite_association', Base.metadata,
-                                          Column(
-                                              'analysis_id', String(50), ForeignKey('analysis.analysis_id')),
-                                          Column(
-                                              'ict_id', String(50), ForeignKey('cell_site.ict_id'))
-                                          )
-
-    # Transmission nodes used in each analysis
-    analysis_transmissionnode_association = Table('analysis_transmissionnode_association', Base.metadata,
-                                                  Column(
-                                                      'analysis_id', String(50), ForeignKey('analysis.analysis_id')),
-                                                  Column(
-                                                      'ict_id', String(50), ForeignKey('transmission_node.ict_id'))
-                                                  )
-
-    # Mobile coverage contours used in each analysis
-    analysis_coverage_association = Table('analysis_coverage_association', Base.metadata,
-                                          Column(
-                                              'analysis_id', String(50), ForeignKey('analysis.analysis_id')),
-                                          Column(
-                                              'contour_id', Integer, ForeignKey('cell_coverage.contour_id'))
-                                          )
-
-    # Define Analysis table
-    class Analysis(Base):
-        # Table name
-        __tablename__ = 'analysis'
-
-        # Columns
-        analysis_id = Column(String(50), primary_key=True)
-        cost_parameter_id = Column(String(50), ForeignKey('cost_parameter.cost_id'))
-
-        # Define relationships with Costs, POIs, Cell Sites and Transmission Nodes
-        cost_parameter = relationship("CostParameter", back_populates="analyses")
-        pointsofinterest = relationship(
-            "PointOfInterest",
-            secondary=analysis_poi_association,
-            back_populates="analyses")
-        cellsites = relationship(
-            "CellSite",
-            secondary=analysis_cellsite_association,
-            back_populates="analyses")
-        transmissionnodes = relationship(
-            "TransmissionNode",
-            secondary=analysis_transmissionnode_association,
-            back_populates="analyses")
-        coveragecontours = relationship(
-            "CellCoverage",
-            secondary=analysis_coverage_association,
-            back_populates="analyses")
-
-    # Define Point of interest table
-    class PointOfInterest(Base):
-        # Table name
-        __tablename__ = 'point_of_interest'
-
-        # Define Enum for ConnectivityType
-        ConnectivityType = Enum(
-            "unknown", "mobile", "mobile_broadband", "metro", "fiber", "wireless", "satellite", "wired",
-            name="connectivity_type_enum"
-        )
-
-        # Columns
-        poi_id = Column(String(50), primary_key=True)
-        source_poi_id = Column(String(50))
-        dataset_id = Column(String(50), nullable=False, index=True)
-        lat = Column(Float, nullable=False, index=True)
-        lon = Column(Float, nullable=False, index=True)
-        connectivity_type = Column(ConnectivityType, index=True)  # Using Enum for connectivity type
-        poi_type = Column(String(50), nullable=False)
-        is_public = Column(Boolean)
-        poi_subtype = Column(String(50))
-        country_code = Column(String(3), nullable=False)
-        admin1 = Column(String(100))
-        admin2 = Column(String(100))
-        admin3 = Column(String(100))
-        is_connected = Column(Boolean, index=True)
-        has_electricity = Column(Boolean)
-        electricity_type = Column(String(50))
-        label = Column(String(50))
-
-        # Define the relationships with other tables
-        analyses = relationship(
-            "Analysis",
-            secondary=analysis_poi_association,
-            back_populates="pointsofinterest")
-        mapping_result = relationship("MappingResult", back_populates="point_of_interest")
-        visibility_result = relationship("VisibilityResult", back_populates="point_of_interest")
-        fiber_path_result_poi = relationship(
-            "FiberPathResultPOI", back_populates="point_of_interest")
-        cost_result_poi = relationship("CostResultPOI", back_populates="point_of_interest")
-
-    # Define Cell site table
-    class CellSite(Base):
-        # Table name
-        __tablename__ = 'cell_site'
-
-        # Define Enum for radio type
-        RadioType = Enum(
-            "2G", "3G", "4G", "5G",
-            name="radio_type_enum"
-        )
-
-        # Define Enum for backhaul type
-        BackhaulType = Enum(
-            "fiber", "microwave", "satellite",
-            name="backhaul_type_enum"
-        )
-
-        # Define Enum for power source
-        PowerSource = Enum(
-            "grid", "generator", "solar",
-            name="power_source_enum"
-        )
-
-        # Columns
-        ict_id = Column(String(50), primary_key=True)
-        source_ict_id = Column(String(50), index=True)
-        source_cell_id = Column(String(50))
-        dataset_id = Column(String(50), nullable=False, index=True)
-        country_code = Column(String(3), nullable=False)
-        lat = Column(Float, nullable=False, index=True)
-        lon = Column(Float, nullable=False, index=True)
-        admin1 = Column(String(100))
-        admin2 = Column(String(100))
-        admin3 = Column(String(100))
-        operator_name = Column(String(100))
-        radio_type = Column(RadioType, index=True)
-        downlink_frequency_mhz = Column(Float)
-        uplink_frequency_mhz = Column(Float)
-        max_channel_bandwidth_mhz = Column(Float)
-        eirp_dbm = Column(Float)
-        tower_height = Column(Float)
-        antenna_height = Column(Float)
-        mechanical_tilt_degrees = Column(Float)
-        electrical_tilt_degrees = Column(Float)
-        azimuth_degrees = Column(Float)
-        antenna_model = Column(String(100))
-        antenna_gain = Column(Float)
-        antenna_horizontal_beamwidth_degrees = Column(Float)
-        antenna_vertical_beamwidth_degrees = Column(Float)
-        backhaul_type = Column(BackhaulType, index=True)
-        backhaul_throuput_mbps = Column(Float)
-        power_source = Column(PowerSource, index=True)
-
-        # Define the relationships with other tables
-        analyses = relationship(
-            "Analysis",
-            secondary=analysis_cellsite_association,
-            back_populates="cellsites")
-
-    # Define Transmission node table
-    class TransmissionNode(Base):
-        # Table name
-        __tablename__ = 'transmission_node'
-
-        # Enum for transmission medium
-        TransmissionMedium = Enum(
-            "fiber", "microwave", "copper", "coaxial", "unknown",
-            name="transmission_medium_enum"
-        )
-
-        # Enum for backhaul technologies
-        BackhaulTechnologies = Enum(
-            "dwdm", "sdh", "tdm", "sonet",
-            name="backhaul_technologies_enum"
-        )
-
-        # Enum for node status
-        NodeStatus = Enum(
-            "proposed", "planned", "underconstruction", "operational", "decommissioned", "inactive",
-            name="node_status_enum"
-        )
-
-        # Enum for power source
-        PowerSource = Enum(
-            "grid", "generator", "solar",
-            name="power_source_enum"
-        )
-
-        # Columns
-        ict_id = Column(String(50), primary_key=True)
-        source_ict_id = Column(String(50))
-        dataset_id = Column(String(50), nullable=False, index=True)
-        country_code = Column(String(3), nullable=False, index=True)
-        lat = Column(Float, nullable=False, index=True)
-        lon = Column(Float, nullable=False, index=True)
-        admin1 = Column(String(100))
-        admin2 = Column(String(100))
-        admin3 = Column(String(100))
-        physical_infrastructure_provider = Column(String(100))
-        network_providers = Column(String(100))
-        transmission_medium = Column(TransmissionMedium, index=True)
-        access_technologies = Column(String(100))
-        backhaul_technologies = Column(BackhaulTechnologies, index=True)
-        is_actual = Column(Boolean, nullable=False)
-        node_status = Column(NodeStatus, index=True)
-        equipped_capacity_access_mbps = Column(Integer)
-        potential_capacity_access_mbps = Column(Integer)
-        equipped_capacity_backhaul_mbps = Column(Integer)
-        potential_capacity_backhaul_mbps = Column(Integer)
-        is_powered = Column(Boolean)
-        power_source = Column(PowerSource, index=True)
-
-        # Define the relationships with other tables
-        analyses = relationship(
-            "Analysis",
-            secondary=analysis_transmissionnode_association,
-            back_populates="transmissionnodes")
-
-    # Define Cell coverage table
-    class CellCoverage(Base):
-        # Table name
-        __tablename__ = 'cell_coverage'
-
-        # Columns
-        contour_id = Column(Integer, primary_key=True)
-        fid = Column(Integer)
-        ID = Column(Integer)
-        layer = Column(Integer)
-        path = Column(String(50))
-        coverage = Column(Integer, nullable=False)
-
-        # Define the relationships with other tables
-        analyses = relationship(
-            "Analysis",
-            secondary=analysis_transmissionnode_association,
-            back_populates="coveragecontours")
-
-    # Define Cost parameter table
-
-    class CostParameter(Base):
-        # Table name
-        __tablename__ = 'cost_parameter'
-
-        # Columns
-        cost_id = Column(String(50), primary_key=True)
-        hw_setup_cost_fiber = Column(Float, nullable=False)
-        focl_constr_cost_fiber = Column(Float, nullable=False)
-        reinv_period_fiber = Column(Float, nullable=False)
-        an_hw_maint_and_repl_fiber = Column(Float, nullable=False)
-        pp_fiber = Column(Float, nullable=False)
-        an_traffic_fees_one_mbps_fiber = Column(Float, nullable=False)
-        an_isp_fees_one_mbps_fiber = Column(Float, nullable=False)
-        ch_throughput_fiber = Column(Float, nullable=False)
-        hw_setup_cost_p2mp = Column(Float, nullable=False)
-        reinv_period_p2mp = Column(Float, nullable=False)
-        an_hw_maint_and_repl_p2mp = Column(Float, nullable=False)
-        pp_p2mp = Column(Float, nullable=False)
-        an_traffic_fees_one_mbps_p2mp = Column(Float, nullable=False)
-        an_isp_fees_one_mbps_p2mp = Column(Float, nullable=False)
-        ch_throughput_p2mp = Column(Float, nullable=False)
-        hw_setup_cost_p2p = Column(Float, nullable=False)
-        access_link_setup_p2p = Column(Float, nullable=False)
-        backhaul_link_num_p2p = Column(Float, nullable=False)
-        backhaul_link_setup_p2p = Column(Float, nullable=False)
-        retr_tower_num_p2p = Column(Float, nullable=False)
-        retr_tower_inst_p2p = Column(Float, nullable=False)
-        access_link_bandwidth_p2p = Column(Float, nullable=False)
-        backhaul_link_bandwidth_p2p = Column(Float, nullable=False)
-        one_time_license_fee_1mhz_p2p = Column(Float, nullable=False)
-        an_license_fee_1mhz_p2p = Column(Float, nullable=False)
-        an_traffic_fees_one_mbps_p2p = Column(Float, nullable=False)
-        an_isp_fees_one_mbps_p2p = Column(Float, nullable=False)
-        ch_throughput_p2p = Column(Float, nullable=False)
-        hw_setup_cost_sat = Column(Float, nullable=False)
-        reinv_period_sat = Column(Float, nullable=False)
-        an_hw_maint_and_repl_sat = Column(Float, nullable=False)
-        pp_sat = Column(Float, nullable=False)
-        an_traffic_fees_one_mbps_sat = Column(Float, nullable=False)
-        an_isp_fees_one_mbps_sat = Column(Float, nullable=False)
-        ch_throughput_sat = Column(Float, nullable=False)
-
-        # Define the relationships with other tables
-        analyses = relationship("Analysis", back_populates="cost_parameter")
-
-    # Define Mapping results table
-
-    class MappingResult(Base):
-        # Table name
-        __tablename__ = 'mapping_result'
-
-        # Columns
-        id = Column(String(50), primary_key=True)
-        poi_id = Column(
-            String(50),
-            ForeignKey('point_of_interest.poi_id'),
-            nullable=False)
-        lat = Column(Float, nullable=False)
-        lon = Column(Float, nullable=False)
-        cell_site_dist = Column(Float)
-        _4G_cell_site_dist = Column(Float)
-        _5G_cell_site_dist = Column(Float)
-        transmission_node_dist = Column(Float)
-        fiber_node_dist = Column(Float)
-        population_1km = Column(Integer)
-        poi_count_1km = Column(Integer)
-        population_3km = Column(Integer)
-        poi_count_3km = Column(Integer)
-        population_5km = Column(Integer)
-        poi_count_5km = Column(Integer)
-        _4G_coverage = Column(Boolean)
-
-        # Define the relationships with other tables
-        point_of_interest = relationship(
-            "PointOfInterest", back_populates="mapping_result")
-
-    # Define Visibility results table
-
-    class VisibilityResult(Base):
-        # Table name
-        __tablename__ = 'visibility_result'
-
-        # Columns
-        id = Column(String(50), primary_key=True)
-        poi_id = Column(
-            String(50),
-            ForeignKey('point_of_interest.poi_id'),
-            nullable=False)
-
-        # Visibility results
-        is_visible = Column(Boolean)
-        num_visible = Column(Integer)
-
-        # First cell site
-        cellsite_1 = Column(String(50))
-        lat_1 = Column(Float)
-        lon_1 = Column(Float)
-        radio_type_1 = Column(String(50))
-        ground_distance_1 = Column(Float)
-        antenna_los_distance_1 = Column(Float)
-        azimuth_angle_1 = Column(Float)
-        los_geometry_1 = Column(String(50))
-
-        # Second cell site
-        cellsite_2 = Column(String(50))
-        lat_2 = Column(Float)
-        lon_2 = Column(Float)
-        radio_type_2 = Column(String(50))
-        ground_distance_2 = Column(Float)
-        antenna_los_distance_2 = Column(Float)
-        azimuth_angle_2 = Column(Float)
-        los_geometry_2 = Column(String(50))
-
-        # Third cell site
-        cellsite_3 = Column(String(50))
-        lat_3 = Column(Float)
-        lon_3 = Column(Float)
-        radio_type_3 = Column(String(50))
-        ground_distance_3 = Column(Float)
-        antenna_los_distance_3 = Column(Float)
-        azimuth_angle_3 = Column(Float)
-        los_geometry_3 = Column(String(50))
-
-        # Define the relationships with other tables
-        point_of_interest = relationship(
-            "PointOfInterest", back_populates="visibility_result")
-
-    # Define Fiber path results tables - POI level
-
-    class FiberPathResultPOI(Base):
-        # Table name
-        __tablename__ = 'fiber_path_result_poi'
-
-        # Columns
-        id = Column(String(50), primary_key=True)
-        poi_id = Column(
-            String(50),
-            ForeignKey('point_of_interest.poi_id'),
-            nullable=False)
-        closest_node_id = Column(String(50))
-        closest_node_distance = Column(Float)
-        connected_node_id = Column(String(50))
-        connected_node_distance = Column(Float)
-        fiber_path = Column(String(50))
-        upstream_node_id = Column(String(50))
-        upstream_node_distance = Column(Float)
-
-        # Define the relationships with other tables
-        point_of_interest = relationship(
-            "PointOfInterest",
-            back_populates="fiber_path_result_poi")
-
-    # Define Fiber path results tables - edge level
-
-    class FiberPathResultEdge(Base):
-        # Table name
-        __tablename__ = 'fiber_path_result_edge'
-
-        # Columns
-        edge_id = Column(Integer, primary_key=True)
-        u = Column(Integer)
-        v = Column(Integer)
-        key = Column(Integer)
-        length = Column(Integer)
-        geometry = Column(Geometry('LINESTRING'))
-        name = Column(String(50))
-        osmid = Column(Integer)
-        highway = Column(String(50))
-        oneway = Column(Integer)
-        reversed = Column(Integer)
-        lanes = Column(Integer)
-        service = Column(String(50))
-        ref = Column(String(50))
-        maxspeed = Column(Integer)
-        bridge = Column(String(50))
-        junction = Column(String(50))
-        access = Column(String(50))
-
-    # Define Fiber path results tables - node level
-
-    class FiberPathResultNode(Base):
-        # Table name
-        __tablename__ = 'fiber_path_result_node'
-
-        # Columns
-        node_id = Column(Integer, primary_key=True)
-        osmid = Column(String(50))
-        y = Column(Float)
-        x = Column(Float)
-        splitter = Column(String(50))
-        street_count = Column(Integer)
-        lon = Column(Float)
-        lat = Column(Float)
-        geometry = Column(Geometry('POINT'))
-        highway = Column(String(50))
-
-    # Define Cost results tables - POI level
-
-    class CostResultPOI(Base):
-        # Table name
-        __tablename__ = 'cost_result_poi'
-
-        # Columns
-        id = Column(String(50), primary_key=True)
-        poi_id = Column(
-            String(50),
-            ForeignKey('point_of_interest.poi_id'),
-            nullable=False)
-        lat = Column(Float)
-        lon = Column(Float)
-        cell_site_dist = Column(Float)
-        _4G_coverage = Column(Integer)
-        is_connected = Column(Integer)
-        is_visible = Column(Boolean)
-        num_visible = Column(Integer)
-
-        # Define fiber length and MST solution columns for each kilometer
-        for i in range(1, 26):
-            locals()[f'fiber_length_{i}km'] = Column(Float)
-            locals()[f'mst_solution_{i}km'] = Column(Integer)
-            locals()[f'technology_{i}km'] = Column(String(50))
-
-        # Define the relationships with other tables
-        point_of_interest = relationship(
-            "PointOfInterest", back_populates="cost_result_poi")
-
-    # Define Cost results tables - technology assignment solution level
-
-    class CostResult(Base):
-        # Table name
-        __tablename__ = 'cost_result'
-
-        # Columns
-        id = Column(String(50), primary_key=True)
-        technology_selection_approach = Column(String(50))
-        basket_name = Column(String(50))
-        technology = Column(String(50))
-        number_poi = Column(Integer)
-        fiber_length = Column(Float)
-        pp_coo = Column(Float)
-        pp_coo_per_poi = Column(Float)
-        pp_capex = Column(Float)
-        init_capex = Column(Float)
-        an_opex = Column(Float)
-        init_capex_per_poi = Column(Float)
-        an_opex_per_poi = Column(Float)
-        p2p = Column(String(50))
-        estimate = Column(Float)
-        max_dist_km = Column(Integer)
-
     # Create all tables defined in Base
     Base.metadata.create_all(engine)
 
-    # Commit changes
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    session.commit()
+    # Create the wide compatibility view of the POI cost results
+    with engine.begin() as connection:
+        connection.execute(text(cost_result_poi_wide_view_sql()))
 
     # Check created tables
+    print("The following tables were added:")
+    for table_name in inspect(engine).get_table_names():
+        print(table_name)
 
-    try:
-        # Connect to existing database
-        with connector.connect(
-            host=db_host,
-            user=db_user,
-            password=db_password,
-            database=db_name
-        ) as existing_database:
-
-            # Create cursor object
-            with existing_database.cursor() as cursor:
-
-                # Show tables
-                command = "SHOW TABLES"
-                cursor.execute(command)
-
-                # Fetch and print table names (assuming table name is the first element)
-                print("The following tables were added:")
-                for table in cursor:
-                    print(table[0])
-
-    except connector.Error as e:
-        print(e)
-
-    print("Database model created and committed.")
\ No newline at end of file
+    print("Database model created and committed.")
@@ -0,0 +1,225 @@
+# Import packages
+import time
+from sqlalchemy import text
+import incremental
+import versions
+import rollup
+from datamodel import Base
+
+
+# Number of rows deleted per statement and commit, small enough to keep row locks short
+DEFAULT_DELETE_BATCH_SIZE = 1000
+
+# Columns that scope a delete, in the order they are checked
+SCOPE_COLUMNS = ["country_code", "dataset_id", "analysis_id"]
+
+
+# Define functions to delete data in chunks, children before parents
+
+
+def child_tables(table, metadata=Base.metadata):
+    """Lists the tables whose foreign keys reference a table.
+
+    Args:
+        table (sqlalchemy.Table): Referenced table.
+        metadata (sqlalchemy.MetaData, optional): Table definitions. Defaults to the datamodel models.
+
+    Returns:
+        list: (child table, child column name, referenced column name) tuples.
+    """
+    children = []
+    for child in metadata.sorted_tables:
+        for fk in child.foreign_keys:
+            if fk.column.table is table and child is not table:
+                children.append((child, fk.parent.name, fk.column.name))
+    return children
+
+
+def _order_columns(table):
+    # Primary key columns, or every column of tables without a primary key (association tables)
+    columns = list(table.primary_key.columns) or list(table.columns)
+    return ", ".join(f"`{column.name}`" for column in columns)
+
+
+def _in_condition(column, values, prefix):
+    # Named-parameter IN condition over a bounded list of values
+    params = {f"{prefix}_{i}": value for i, value in enumerate(values)}
+    return f"`{column}` IN ({', '.join(':' + name for name in params)})", params
+
+
+def _delete_chunked(connection, table, condition, params, batch_size, stats):
+    # Deletes matching rows in primary key order, one short transaction per chunk
+    statement = text(f"DELETE FROM {table.name} WHERE {condition} ORDER BY {_order_columns(table)} LIMIT {batch_size}")
+    while True:
+        deleted = connection.execute(statement, params).rowcount
+        connection.commit()
+        stats[table.name] = stats.get(table.name, 0) + deleted
+        if deleted < batch_size:
+            return
+
+
+def _delete_cascade(connection, table, condition, params, batch_size, stats, metadata, visiting=(),
+                    include_self=True):
+    # Deletes the rows referencing the matching rows first (depth first), then the rows themselves
+    for child, child_column, parent_column in child_tables(table, metadata):
+        if child.name in visiting:
+            continue
+        values = connection.execute(
+            text(f"SELECT DISTINCT `{parent_column}` FROM {table.name} WHERE {condition}"), params).scalars().all()
+        for start in range(0, len(values), batch_size):
+            child_condition, child_params = _in_condition(child_column, values[start:start + batch_size],
+                                                          f"{child.name}_{child_column}")
+            _delete_cascade(connection, child, child_condition, child_params, batch_size, stats, metadata,
+                            visiting + (table.name,))
+    if include_self:
+        _delete_chunked(connection, table, condition, params, batch_size, stats)
+
+
+def _delete_fingerprints(connection, table_name, keys):
+    # Forgets the content hashes of deleted rows, so incremental ingest writes them again
+    condition, params = _in_condition("row_key", [str(key) for key in keys], "row_key")
+    params["table_name"] = table_name
+    connection.execute(
+        text(f"DELETE FROM {incremental.FINGERPRINT_TABLE} WHERE table_name = :table_name AND {condition}"), params)
+
+
+def _delete_scoped(connection, table, scope_column, scope_value, batch_size, stats, metadata, start_time,
+                   include_root=True):
+    # Walks the scoped rows of a table in primary key order (keyset pagination), deleting their
+    # dependents and, if include_root is set, the rows themselves
+    primary_key = list(table.primary_key.columns)
+    if len(primary_key) != 1:
+        # Composite or missing keys: delete the scoped rows directly
+        _delete_cascade(connection, table, f"`{scope_column}` = :scope", {"scope": scope_value},
+                        batch_size, stats, metadata, include_self=include_root)
+        return
+
+    key = primary_key[0].name
+    select_keys = text(f"SELECT `{key}` FROM {table.name} WHERE `{scope_column}` = :scope AND `{key}` > :last "
+                       f"ORDER BY `{key}` LIMIT {batch_size}")
+    select_first = text(f"SELECT `{key}` FROM {table.name} WHERE `{scope_column}` = :scope "
+                        f"ORDER BY `{key}` LIMIT {batch_size}")
+    last_key = None
+    while True:
+        if last_key is None:
+            keys = connection.execute(select_first, {"scope": scope_value}).scalars().all()
+        else:
+            keys = connection.execute(select_keys, {"scope": scope_value, "last": last_key}).scalars().all()
+        connection.commit()
+        if len(keys) == 0:
+            return
+        last_key = keys[-1]
+
+        condition, params = _in_condition(key, keys, "key")
+        if table.name == "point_of_interest":
+            # The cascade commits chunk by chunk, so the rollup changes of the batch are merged and
+            # committed on the underlying DBAPI connection once it is done
+            cursor = connection.connection.cursor()
+            before = rollup.capture(cursor, keys)
+            _delete_cascade(connection, table, condition, params, batch_size, stats, metadata,
+                            include_self=include_root)
+            rollup.merge_deltas(cursor, rollup.deltas(before, rollup.capture(cursor, keys)))
+            connection.connection.commit()
+            cursor.close()
+        else:
+            _delete_cascade(connection, table, condition, params, batch_size, stats, metadata,
+                            include_self=include_root)
+        if include_root and table.name != incremental.FINGERPRINT_TABLE:
+            _delete_fingerprints(connection, table.name, keys)
+            connection.commit()
+
+        elapsed = time.perf_counter() - start_time
+        label = table.name if include_root else f"dependents of {table.name}"
+        rows = stats.get(table.name, 0) if include_root else sum(stats.values())
+        print(f"{label}: {rows} rows deleted ({sum(stats.values()) / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+def delete_dependents(engine, table_name, scope_column, scope_value, batch_size=DEFAULT_DELETE_BATCH_SIZE,
+                      metadata=Base.metadata):
+    """Deletes the rows referencing the scoped rows of a table, leaving the rows themselves in place.
+
+    Used before a table's rows are removed in bulk (e.g. a partition drop), so that no dependent
+    rows are left behind.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Referenced table.
+        scope_column (str): Column selecting the rows, e.g. country_code.
+        scope_value (str): Value of the scope column.
+        batch_size (int, optional): Number of rows per chunk and commit. Defaults to DEFAULT_DELETE_BATCH_SIZE.
+        metadata (sqlalchemy.MetaData, optional): Table definitions. Defaults to the datamodel models.
+
+    Returns:
+        dict: Number of rows deleted per table.
+    """
+    stats = {}
+    with engine.connect() as connection:
+        _delete_scoped(connection, metadata.tables[table_name], scope_column, scope_value, batch_size, stats,
+                       metadata, time.perf_counter(), include_root=False)
+    return stats
+
+
+def _affected_scopes(connection, scope_column, scope_value, roots):
+    # Datasets, analyses and countries whose data a delete changes, for versions.bump_versions
+    if scope_column == "analysis_id":
+        return {"analysis_ids": [scope_value]}
+    country_codes = {scope_value} if scope_column == "country_code" else set()
+    if scope_column == "dataset_id":
+        for table in roots:
+            if "country_code" in table.columns:
+                country_codes.update(connection.execute(
+                    text(f"SELECT DISTINCT country_code FROM {table.name} WHERE dataset_id = :scope"),
+                    {"scope": scope_value}).scalars().all())
+    dataset_ids, analysis_ids = versions.country_scopes(connection, country_codes)
+    connection.commit()
+    return {"dataset_ids": dataset_ids | ({scope_value} if scope_column == "dataset_id" else set()),
+            "analysis_ids": analysis_ids, "country_codes": country_codes}
+
+
+def delete_data(engine, country_code=None, dataset_id=None, analysis_id=None,
+                batch_size=DEFAULT_DELETE_BATCH_SIZE, metadata=Base.metadata):
+    """Deletes all data of a country, dataset or analysis, children before parents.
+
+    Every table holding the scope column is processed, dependent tables first. Rows are taken in
+    primary key order, batch_size at a time. For each batch, the rows referencing it are removed by
+    walking the foreign key graph of the data model, and every statement is committed on its own.
+    Locks are therefore held for one small chunk at a time. An interrupted delete can simply be run
+    again.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        country_code (str, optional): Delete the POIs, cell sites and transmission nodes of this
+            country and everything referencing them.
+        dataset_id (str, optional): Delete the rows of this dataset and everything referencing them.
+        analysis_id (str, optional): Delete this analysis and all of its results.
+        batch_size (int, optional): Number of rows per chunk and commit. Defaults to DEFAULT_DELETE_BATCH_SIZE.
+        metadata (sqlalchemy.MetaData, optional): Table definitions. Defaults to the datamodel models.
+
+    Returns:
+        dict: Number of rows deleted per table.
+    """
+    values = {"country_code": country_code, "dataset_id": dataset_id, "analysis_id": analysis_id}
+    scopes = {column: values[column] for column in SCOPE_COLUMNS if values[column] is not None}
+    if len(scopes) != 1:
+        raise ValueError("Exactly one of country_code, dataset_id or analysis_id must be given")
+    (scope_column, scope_value), = scopes.items()
+
+    start_time = time.perf_counter()
+    stats = {}
+    roots = [table for table in reversed(metadata.sorted_tables) if scope_column in table.columns]
+
+    with engine.connect() as connection:
+        scopes = _affected_scopes(connection, scope_column, scope_value, roots)
+        try:
+            for table in roots:
+                _delete_scoped(connection, table, scope_column, scope_value, batch_size, stats, metadata, start_time)
+            # Result tables keyed by analysis and distance are deleted without walking POIs
+            if scope_column == "analysis_id":
+                rollup.delete_analysis_rollups(connection, scope_value)
+        finally:
+            # Invalidate cached queries, also when the delete stopped part way
+            versions.bump_versions(engine, **scopes)
+
+    print(f"Deleted {sum(stats.values())} rows where {scope_column} = {scope_value} "
+          f"in {time.perf_counter() - start_time:.1f}s")
+    return stats
@@ -0,0 +1,309 @@
+# Import packages
+import time
+import numpy as np
+import pandas as pd
+import shapely
+from sqlalchemy import text
+import loader
+import incremental
+import versions
+from datamodel import POINT_SRID
+
+
+# Columns of fiber_path_result_path, in insert order
+PATH_COLUMNS = ["analysis_id", "poi_id", "seq", "node_id"]
+
+# Decimal places used to match edge end points to nodes
+COORDINATE_DECIMALS = 7
+
+
+# Define functions to load and query fiber paths
+
+
+def explode_paths(poi_ids, paths):
+    """Parses stringified Python lists of node ids into one row per path node.
+
+    The lists are split with vectorized string operations instead of evaluating every row.
+
+    Args:
+        poi_ids (pandas.Series): POI identifiers.
+        paths (pandas.Series): Paths such as "['a', 'b', 'c']".
+
+    Returns:
+        pandas.DataFrame: Columns poi_id, seq (starting at 0) and node_id.
+    """
+    nodes = (paths.fillna("[]").astype(str)
+             .str.strip().str.strip("[]")
+             .str.replace("'", "", regex=False).str.replace('"', "", regex=False)
+             .str.split(","))
+    exploded = pd.DataFrame({"poi_id": poi_ids.to_numpy(), "node_id": nodes.to_numpy()}).explode("node_id")
+    exploded["node_id"] = exploded["node_id"].str.strip()
+    exploded = exploded[exploded["node_id"].notna() & (exploded["node_id"] != "")]
+    exploded["seq"] = exploded.groupby("poi_id", sort=False).cumcount()
+    return exploded[["poi_id", "seq", "node_id"]].reset_index(drop=True)
+
+
+def _delete_paths(cursor, analysis_id, poi_ids, batch_size=1000):
+    # Remove the existing paths of POIs in bounded IN lists
+    for start in range(0, len(poi_ids), batch_size):
+        batch = poi_ids[start:start + batch_size]
+        cursor.execute(
+            f"DELETE FROM fiber_path_result_path WHERE analysis_id = %s "
+            f"AND poi_id IN ({', '.join(['%s'] * len(batch))})", [analysis_id] + batch)
+
+
+def load_fiber_path_results(engine, filepath, analysis_id=None, batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Loads a fiberpath *-results.csv file into fiber_path_result_poi and fiber_path_result_path.
+
+    The per-POI columns are upserted into fiber_path_result_poi, and the fiber_path column is
+    exploded into one (poi_id, seq, node_id) row per node, replacing the previous path of each POI.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        filepath (str): Path to the CSV file.
+        analysis_id (str, optional): Analysis identifier. Defaults to the prefix of the file name.
+        batch_size (int, optional): Number of POIs per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: Number of POI rows and path node rows written.
+    """
+    if analysis_id is None:
+        analysis_id = loader.analysis_id_from_path(filepath)
+
+    start_time = time.perf_counter()
+    result_types = loader.get_table_columns(engine, "fiber_path_result_poi")
+    path_statement = f"INSERT INTO fiber_path_result_path ({loader.quote_columns(PATH_COLUMNS)}) VALUES (%s, %s, %s, %s)"
+    stats = {"analysis_id": analysis_id, "poi_rows": 0, "path_rows": 0}
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+
+        # Make sure the analysis exists for the foreign keys
+        cursor.execute("INSERT IGNORE INTO analysis (analysis_id) VALUES (%s)", [analysis_id])
+
+        for chunk in loader.iter_csv_chunks(filepath, batch_size):
+            chunk["analysis_id"] = analysis_id
+            chunk["id"] = [loader.result_id(analysis_id, poi_id) for poi_id in chunk["poi_id"]]
+            results = loader.coerce_chunk(chunk, result_types)
+            paths = explode_paths(chunk["poi_id"], chunk["fiber_path"])
+            paths.insert(0, "analysis_id", analysis_id)
+
+            cursor.executemany(
+                incremental.upsert_statement("fiber_path_result_poi", list(results.columns), ["id"]),
+                loader.to_rows(results))
+            _delete_paths(cursor, analysis_id, chunk["poi_id"].tolist())
+            if len(paths) > 0:
+                cursor.executemany(path_statement, loader.to_rows(paths[PATH_COLUMNS]))
+            connection.commit()
+
+            stats["poi_rows"] += len(results)
+            stats["path_rows"] += len(paths)
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    versions.bump_versions(engine, analysis_ids=[analysis_id])
+    print(f"fiber_path_result ({analysis_id}): {stats['poi_rows']} POIs, {stats['path_rows']} path nodes "
+          f"in {time.perf_counter() - start_time:.1f}s")
+    return stats
+
+
+def read_paths(engine, analysis_id):
+    """Rebuilds every fiber path of an analysis with one primary key range scan.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_id (str): Analysis identifier.
+
+    Returns:
+        pandas.Series: Ordered lists of node ids indexed by POI id.
+    """
+    query = text(
+        "SELECT poi_id, node_id FROM fiber_path_result_path WHERE analysis_id = :analysis_id ORDER BY poi_id, seq")
+    with engine.connect() as connection:
+        nodes = pd.read_sql(query, connection, params={"analysis_id": analysis_id})
+    return nodes.groupby("poi_id", sort=False)["node_id"].agg(list)
+
+
+def pois_through_node(engine, node_id, analysis_id=None):
+    """Returns the POIs whose fiber path passes through a node (ix_fiber_path_result_path_node lookup).
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        node_id (str): Node identifier.
+        analysis_id (str, optional): Only search paths of this analysis. Defaults to all analyses.
+
+    Returns:
+        pandas.DataFrame: Columns analysis_id, poi_id and seq (position of the node in the path).
+    """
+    sql_query = "SELECT analysis_id, poi_id, seq FROM fiber_path_result_path WHERE node_id = :node_id"
+    params = {"node_id": node_id}
+    if analysis_id is not None:
+        sql_query += " AND analysis_id = :analysis_id"
+        params["analysis_id"] = analysis_id
+    with engine.connect() as connection:
+        return pd.read_sql(text(sql_query), connection, params=params)
+
+
+# Define functions to load fiber network graphs with WKB geometries
+
+
+def parse_wkt(wkt):
+    """Parses WKT strings into shapely geometries in one vectorized call.
+
+    Args:
+        wkt (pandas.Series): WKT strings.
+
+    Returns:
+        numpy.ndarray: Shapely geometries (None for missing values).
+    """
+    return shapely.from_wkt(wkt.where(wkt.notna(), None).to_numpy(), on_invalid="warn")
+
+
+def endpoints(geometries):
+    """Returns the first and last coordinates of every line.
+
+    Args:
+        geometries (numpy.ndarray): Shapely LineStrings.
+
+    Returns:
+        tuple: Arrays (start, end), each of shape (n, 2) in lon/lat order.
+    """
+    coordinates = shapely.get_coordinates(geometries)
+    counts = shapely.get_num_coordinates(geometries)
+    stops = np.cumsum(counts)
+    starts = stops - counts
+    valid = counts > 0
+    start = np.full((len(geometries), 2), np.nan)
+    end = np.full((len(geometries), 2), np.nan)
+    start[valid] = coordinates[starts[valid]]
+    end[valid] = coordinates[stops[valid] - 1]
+    return start, end
+
+
+def _coordinate_keys(xy):
+    # Rounded coordinates used as hash join keys
+    return pd.DataFrame({"x_key": np.round(xy[:, 0], COORDINATE_DECIMALS),
+                         "y_key": np.round(xy[:, 1], COORDINATE_DECIMALS)})
+
+
+def _geometry_statement(table_name, columns):
+    # Multi-row insert with the geometry sent as WKB
+    values = ", ".join(
+        f"ST_GeomFromWKB(%s, {POINT_SRID}, 'axis-order=long-lat')" if column == "geometry" else "%s"
+        for column in columns)
+    return f"INSERT INTO {table_name} ({loader.quote_columns(columns)}) VALUES ({values})"
+
+
+def _next_id(cursor, table_name, id_column):
+    # First free surrogate id of a table
+    cursor.execute(f"SELECT COALESCE(MAX({id_column}), 0) + 1 FROM {table_name}")
+    return int(cursor.fetchone()[0])
+
+
+def load_fiber_path_graph(engine, nodes_filepath, edges_filepath, analysis_id=None,
+                          batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Loads fiberpath *-nodes.csv and *-edges.csv files with WKB geometries.
+
+    WKT is parsed in vectorized batches with shapely and sent as WKB with SRID 4326 in multi-row
+    inserts. The nodes and edges already loaded for the analysis are deleted first, so loading a
+    graph again replaces it. Surrogate node_id and edge_id values are assigned from the current maximum,
+    and the u/v node ids of every edge are back-filled by hash-joining its end points with the node
+    coordinates. Surrogate ids are assigned client-side, so graphs must not be loaded concurrently into
+    the same tables.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        nodes_filepath (str): Path to the nodes CSV file.
+        edges_filepath (str): Path to the edges CSV file.
+        analysis_id (str, optional): Analysis identifier. Defaults to the prefix of the nodes file name.
+        batch_size (int, optional): Number of rows per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: Number of nodes and edges written, and the number of edge ends without a matching node.
+    """
+    if analysis_id is None:
+        analysis_id = loader.analysis_id_from_path(nodes_filepath)
+
+    start_time = time.perf_counter()
+    node_types = loader.get_table_columns(engine, "fiber_path_result_node")
+    edge_types = loader.get_table_columns(engine, "fiber_path_result_edge")
+    stats = {"analysis_id": analysis_id, "nodes": 0, "edges": 0, "unmatched_ends": 0}
+    node_keys = []
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+
+        # Make sure the analysis exists for the foreign keys
+        cursor.execute("INSERT IGNORE INTO analysis (analysis_id) VALUES (%s)", [analysis_id])
+
+        # Replace the graph of a previous load of the analysis
+        cursor.execute("DELETE FROM fiber_path_result_edge WHERE analysis_id = %s", [analysis_id])
+        cursor.execute("DELETE FROM fiber_path_result_node WHERE analysis_id = %s", [analysis_id])
+
+        # Nodes: parse points, assign ids and keep their coordinates for the edge join
+        next_node_id = _next_id(cursor, "fiber_path_result_node", "node_id")
+        for chunk in loader.iter_csv_chunks(nodes_filepath, batch_size):
+            geometries = parse_wkt(chunk["geometry"])
+            xy = np.column_stack([shapely.get_x(geometries), shapely.get_y(geometries)])
+            chunk = chunk.drop(columns=["geometry"])
+            chunk["node_id"] = np.arange(next_node_id, next_node_id + len(chunk))
+            chunk["analysis_id"] = analysis_id
+            chunk["lon"], chunk["lat"] = xy[:, 0], xy[:, 1]
+            next_node_id += len(chunk)
+
+            nodes = loader.coerce_chunk(chunk, node_types)
+            nodes["geometry"] = shapely.to_wkb(geometries)
+            cursor.executemany(_geometry_statement("fiber_path_result_node", list(nodes.columns)),
+                               loader.to_rows(nodes))
+            connection.commit()
+
+            keys = _coordinate_keys(xy)
+            keys["node_id"] = chunk["node_id"].to_numpy()
+            node_keys.append(keys)
+            stats["nodes"] += len(nodes)
+
+        node_lookup = (pd.concat(node_keys, ignore_index=True) if node_keys
+                       else pd.DataFrame(columns=["x_key", "y_key", "node_id"]))
+        node_lookup = node_lookup.drop_duplicates(["x_key", "y_key"])
+
+        # Edges: parse lines, hash-join their end points to the nodes to fill u and v
+        next_edge_id = _next_id(cursor, "fiber_path_result_edge", "edge_id")
+        for chunk in loader.iter_csv_chunks(edges_filepath, batch_size):
+            geometries = parse_wkt(chunk["geometry"])
+            start, end = endpoints(geometries)
+            chunk = chunk.drop(columns=["geometry"])
+            chunk["edge_id"] = np.arange(next_edge_id, next_edge_id + len(chunk))
+            chunk["analysis_id"] = analysis_id
+            next_edge_id += len(chunk)
+
+            for column, xy in (("u", start), ("v", end)):
+                if column in chunk.columns and chunk[column].notna().all():
+                    continue
+                matched = _coordinate_keys(xy).merge(node_lookup, on=["x_key", "y_key"], how="left")
+                chunk[column] = matched["node_id"].to_numpy()
+                stats["unmatched_ends"] += int(matched["node_id"].isna().sum())
+
+            edges = loader.coerce_chunk(chunk, edge_types)
+            edges["geometry"] = shapely.to_wkb(geometries)
+            cursor.executemany(_geometry_statement("fiber_path_result_edge", list(edges.columns)),
+                               loader.to_rows(edges))
+            connection.commit()
+            stats["edges"] += len(edges)
+
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    versions.bump_versions(engine, analysis_ids=[analysis_id])
+    print(f"fiber_path_result graph ({analysis_id}): {stats['nodes']} nodes, {stats['edges']} edges, "
+          f"{stats['unmatched_ends']} unmatched edge ends in {time.perf_counter() - start_time:.1f}s")
+    return stats
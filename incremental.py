@@ -0,0 +1,210 @@
+# Import packages
+import time
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+import loader
+import versions
+import rollup
+import delete
+from datamodel import Base
+
+
+# Table holding the content hash of every ingested row (see datamodel.IngestFingerprint)
+FINGERPRINT_TABLE = "ingest_fingerprint"
+
+
+# Define functions for incremental, idempotent ingest
+
+
+def get_primary_key(engine, table_name):
+    """Returns the single primary key column of a table.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Name of the table.
+
+    Returns:
+        str: Name of the primary key column.
+    """
+    key_columns = inspect(engine).get_pk_constraint(table_name)["constrained_columns"]
+    if len(key_columns) != 1:
+        raise ValueError(f"Incremental ingest needs a single-column primary key, {table_name} has {key_columns}")
+    return key_columns[0]
+
+
+def fingerprint_rows(chunk, key_column):
+    """Computes a 64-bit content hash of the non-key columns of every row.
+
+    Values are normalised to strings before hashing so that the same row hashes
+    identically whatever dtype pandas inferred for its chunk.
+
+    Args:
+        chunk (pandas.DataFrame): Coerced chunk of rows (see loader.coerce_chunk).
+        key_column (str): Primary key column, excluded from the hash.
+
+    Returns:
+        numpy.ndarray: Signed 64-bit hashes, one per row.
+    """
+    values = chunk.drop(columns=[key_column])
+    values = values.astype(object).where(values.notna(), None).astype(str)
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    return hashes.view(np.int64)
+
+
+def read_fingerprints(engine, table_name, dataset_id):
+    """Reads the stored fingerprints of a dataset.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Name of the ingested table.
+        dataset_id (str): Dataset identifier.
+
+    Returns:
+        pandas.Series: Stored row hashes indexed by row key.
+    """
+    query = text(
+        f"SELECT row_key, row_hash FROM {FINGERPRINT_TABLE} "
+        "WHERE table_name = :table_name AND dataset_id = :dataset_id")
+    with engine.connect() as connection:
+        fingerprints = pd.read_sql(query, connection, params={"table_name": table_name, "dataset_id": dataset_id})
+    # Nullable integers keep the 64-bit hashes exact when reindexed against new keys
+    return fingerprints.set_index("row_key")["row_hash"].astype("Int64")
+
+
+def upsert_statement(table_name, columns, key_columns):
+    """Builds an INSERT ... ON DUPLICATE KEY UPDATE statement for cursor.executemany.
+
+    Args:
+        table_name (str): Name of the target table.
+        columns (list): Columns being written.
+        key_columns (list): Primary key columns, which are not updated.
+
+    Returns:
+        str: SQL statement with %s placeholders.
+    """
+    placeholders = ", ".join(["%s"] * len(columns))
+    updates = ", ".join(f"`{column}` = VALUES(`{column}`)" for column in columns if column not in key_columns)
+    return (f"INSERT INTO `{table_name}` ({loader.quote_columns(columns)}) VALUES ({placeholders}) "
+            f"ON DUPLICATE KEY UPDATE {updates}")
+
+
+def _delete_keys(connection, table_name, key_column, keys, batch_size):
+    # Delete rows in bounded IN lists, with the rows referencing them (see delete._delete_cascade)
+    # and their fingerprints
+    table = Base.metadata.tables[table_name]
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        condition, params = delete._in_condition(key_column, batch, "key")
+        # The cascade commits chunk by chunk, so the rollup changes of the batch are merged and
+        # committed on the underlying DBAPI connection once it is done
+        cursor = connection.connection.cursor()
+        poi_ids = rollup.poi_ids_of(cursor, table_name, key_column, batch) if table_name in rollup.ROLLUP_TABLES else None
+        before = rollup.capture(cursor, poi_ids) if poi_ids is not None else None
+        delete._delete_cascade(connection, table, condition, params, batch_size, {}, Base.metadata)
+        if poi_ids is not None:
+            rollup.merge_deltas(cursor, rollup.deltas(before, rollup.capture(cursor, poi_ids)))
+            connection.connection.commit()
+        cursor.close()
+        delete._delete_fingerprints(connection, table_name, batch)
+        connection.commit()
+        yield len(batch)
+
+
+def upsert_csv(engine, table_name, filepath, dataset_id=None, delete_missing=False,
+               batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Incrementally ingests a CSV file, writing only rows that are new or have changed.
+
+    Each incoming row is fingerprinted with a hash of its non-key columns and compared with
+    the fingerprint stored for the dataset in the ingest_fingerprint table. New and changed rows
+    are written with INSERT ... ON DUPLICATE KEY UPDATE, unchanged rows are skipped, and rows that
+    are no longer present in the file can optionally be deleted. Re-running the same file is a no-op.
+
+    Note: rows loaded by a full load (see loader.load_csv) have no fingerprint yet, so the first
+    incremental run over them rewrites every row once.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Name of the target table.
+        filepath (str): Path to the CSV file.
+        dataset_id (str, optional): Dataset identifier. Defaults to the dataset_id of the first row.
+        delete_missing (bool, optional): Delete rows of the dataset that are absent from the file,
+            and the rows referencing them. Defaults to False.
+        batch_size (int, optional): Number of rows per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: Ingest statistics with the number of inserted, updated, unchanged and deleted rows.
+    """
+    if dataset_id is None:
+        dataset_id = pd.read_csv(filepath, usecols=["dataset_id"], nrows=1)["dataset_id"].iloc[0]
+
+    key_column = get_primary_key(engine, table_name)
+    column_types = loader.get_table_columns(engine, table_name)
+    stored = read_fingerprints(engine, table_name, dataset_id)
+    seen_keys = set()
+    scopes = {}
+    stats = {"table": table_name, "dataset_id": dataset_id, "inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+    start_time = time.perf_counter()
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for chunk in loader.iter_csv_chunks(filepath, batch_size):
+            chunk = loader.coerce_chunk(chunk, column_types)
+            versions.collect_scopes(chunk, scopes)
+            keys = chunk[key_column].astype(str)
+            seen_keys.update(keys)
+
+            # Compare incoming hashes with the stored ones
+            hashes = fingerprint_rows(chunk, key_column)
+            previous = stored.reindex(keys)
+            is_new = previous.isna().to_numpy()
+            is_changed = ~is_new & (previous.to_numpy(dtype=np.int64, na_value=0) != hashes)
+            to_write = is_new | is_changed
+
+            stats["inserted"] += int(is_new.sum())
+            stats["updated"] += int(is_changed.sum())
+            stats["unchanged"] += int((~to_write).sum())
+            if not to_write.any():
+                continue
+
+            # Write the new and changed rows and their fingerprints in the same transaction
+            changed_rows = chunk[to_write]
+            fingerprints = pd.DataFrame({
+                "table_name": table_name,
+                "row_key": keys[to_write].to_numpy(),
+                "dataset_id": dataset_id,
+                "row_hash": hashes[to_write],
+            })
+            tracked = table_name in rollup.ROLLUP_TABLES and "poi_id" in changed_rows.columns
+            try:
+                with rollup.track(cursor, changed_rows["poi_id"]) if tracked else nullcontext():
+                    cursor.executemany(
+                        upsert_statement(table_name, list(changed_rows.columns), [key_column]),
+                        loader.to_rows(changed_rows))
+                cursor.executemany(
+                    upsert_statement(FINGERPRINT_TABLE, list(fingerprints.columns), ["table_name", "row_key"]),
+                    loader.to_rows(fingerprints))
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        cursor.close()
+    finally:
+        connection.close()
+
+    # Remove rows of the dataset that disappeared from the file, and the rows referencing them
+    if delete_missing:
+        missing_keys = [key for key in stored.index if key not in seen_keys]
+        with engine.connect() as connection:
+            for deleted in _delete_keys(connection, table_name, key_column, missing_keys, batch_size):
+                stats["deleted"] += deleted
+
+    if stats["inserted"] + stats["updated"] + stats["deleted"] > 0:
+        versions.bump_versions(engine, dataset_ids=[dataset_id], country_codes=scopes.get("country_code", ()))
+
+    stats["seconds"] = time.perf_counter() - start_time
+    print(f"{table_name} ({dataset_id}): {stats['inserted']} inserted, {stats['updated']} updated, "
+          f"{stats['unchanged']} unchanged, {stats['deleted']} deleted in {stats['seconds']:.1f}s")
+    return stats
@@ -0,0 +1,395 @@
+# Import packages
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS_S = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Statements slower than this are kept with their parameters and EXPLAIN plan
+DEFAULT_SLOW_STATEMENT_S = 1.0
+
+# Number of slow statements kept (the slowest ones)
+MAX_SLOW_STATEMENTS = 50
+
+# Environment variable enabling instrumentation at import, e.g. in the pipeline worker processes
+ENABLE_ENV = "INFRAMAP_INSTRUMENTATION"
+
+# Prefix of the exported Prometheus metrics
+METRIC_PREFIX = "inframap"
+
+# Statements EXPLAIN accepts
+EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|REPLACE|UPDATE|DELETE)\b", re.IGNORECASE)
+
+# Recorded metrics: (kind, name, table) -> histogram, and the slowest statements
+_histograms = {}
+_slow_statements = []
+_lock = threading.Lock()
+_settings = {"enabled": os.environ.get(ENABLE_ENV, "") not in ("", "0"), "slow_statement_s": DEFAULT_SLOW_STATEMENT_S}
+
+
+# Define functions to record statement and stage latencies and export them
+
+
+def enable(slow_statement_s=DEFAULT_SLOW_STATEMENT_S):
+    """Starts recording statement and stage metrics in this process.
+
+    Args:
+        slow_statement_s (float, optional): Latency above which a statement is kept as slow.
+            Defaults to DEFAULT_SLOW_STATEMENT_S.
+
+    Returns:
+        None
+    """
+    _settings["enabled"] = True
+    _settings["slow_statement_s"] = slow_statement_s
+
+
+def disable():
+    """Stops recording metrics; recorded metrics are kept until reset."""
+    _settings["enabled"] = False
+
+
+def is_enabled():
+    """Returns whether metrics are being recorded.
+
+    Returns:
+        bool: True when enabled.
+    """
+    return _settings["enabled"]
+
+
+def reset():
+    """Discards every recorded metric."""
+    with _lock:
+        _histograms.clear()
+        _slow_statements.clear()
+
+
+def fingerprint(statement):
+    """Normalizes a SQL statement so that executions differing only in their values are grouped.
+
+    Literals (including strings with escaped quotes and numbers with exponents) and placeholders
+    become ?, and repeated value lists (IN lists, multi-row VALUES) collapse.
+
+    Args:
+        statement (str): SQL statement.
+
+    Returns:
+        str: Normalized statement.
+    """
+    statement = re.sub(r"'(?:[^'\\]|\\.|'')*'", "?", statement)
+    statement = re.sub(r"%\(\w+\)s|%s|(?<![:\w]):\w+|\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b", "?", statement)
+    statement = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(?)", statement)
+    statement = re.sub(r"(\(\?\))(?:\s*,\s*\(\?\))+", r"\1", statement)
+    return re.sub(r"\s+", " ", statement).strip()
+
+
+def _new_histogram():
+    return {"buckets": [0] * (len(LATENCY_BUCKETS_S) + 1), "count": 0, "sum_s": 0.0, "max_s": 0.0, "rows": 0,
+            "bytes": 0}
+
+
+def record(kind, name, seconds, rows=0, bytes_sent=0, table=""):
+    """Adds one observation to the latency histogram of a statement or stage.
+
+    Args:
+        kind (str): "statement" or "stage".
+        name (str): Statement fingerprint or stage name, e.g. "loader.read".
+        seconds (float): Latency.
+        rows (int, optional): Rows processed. Defaults to 0.
+        bytes_sent (int, optional): Bytes sent to the server. Defaults to 0.
+        table (str, optional): Table the observation belongs to. Defaults to "".
+
+    Returns:
+        None
+    """
+    if not _settings["enabled"]:
+        return
+    bucket = next((index for index, bound in enumerate(LATENCY_BUCKETS_S) if seconds <= bound), len(LATENCY_BUCKETS_S))
+    with _lock:
+        histogram = _histograms.setdefault((kind, name, table), _new_histogram())
+        histogram["buckets"][bucket] += 1
+        histogram["count"] += 1
+        histogram["sum_s"] += seconds
+        histogram["max_s"] = max(histogram["max_s"], seconds)
+        histogram["rows"] += max(int(rows or 0), 0)
+        histogram["bytes"] += int(bytes_sent or 0)
+
+
+def record_statement(statement, seconds, rows=0, bytes_sent=None, params=None, table=""):
+    """Records the execution of a statement, keeping it with its parameters when it is slow.
+
+    Used by the engine event listeners (see instrument_engine) and by the raw cursor paths of the
+    loaders, which do not go through SQLAlchemy.
+
+    Args:
+        statement (str): SQL statement as sent to the driver.
+        seconds (float): Client-side latency, from sending the statement to the end of its execution.
+        rows (int, optional): Rows affected or returned. Defaults to 0.
+        bytes_sent (int, optional): Bytes sent. Defaults to the size of the statement and parameters.
+        params (optional): Driver parameters; for executemany, the list of parameter sets.
+        table (str, optional): Target table. Defaults to "".
+
+    Returns:
+        None
+    """
+    if not _settings["enabled"]:
+        return
+    if bytes_sent is None:
+        bytes_sent = len(statement.encode()) + (len(repr(params).encode()) if params is not None else 0)
+    name = fingerprint(statement)
+    record("statement", name, seconds, rows, bytes_sent, table)
+
+    if seconds >= _settings["slow_statement_s"]:
+        # Parameters of the first row of an executemany are enough to EXPLAIN it
+        if isinstance(params, (list, tuple)) and len(params) > 0 and isinstance(params[0], (list, tuple, dict)):
+            params = params[0]
+        entry = {"fingerprint": name, "statement": statement, "params": params, "seconds": seconds, "rows": rows,
+                 "table": table, "recorded_at": time.time(), "plan": None}
+        with _lock:
+            _slow_statements.append(entry)
+            _slow_statements.sort(key=lambda item: item["seconds"], reverse=True)
+            del _slow_statements[MAX_SLOW_STATEMENTS:]
+
+
+@contextmanager
+def stage(name, table=""):
+    """Times a stage of a loader or query, e.g. CSV parsing or DataFrame conversion.
+
+    The yielded dict can be given the rows and bytes processed by the stage.
+
+    Args:
+        name (str): Stage name, e.g. "loader.read".
+        table (str, optional): Table the stage works on. Defaults to "".
+
+    Yields:
+        dict: Counters "rows" and "bytes" to fill in.
+    """
+    counters = {"rows": 0, "bytes": 0}
+    if not _settings["enabled"]:
+        yield counters
+        return
+    start_time = time.perf_counter()
+    try:
+        yield counters
+    finally:
+        record("stage", name, time.perf_counter() - start_time, counters["rows"], counters["bytes"], table)
+
+
+def timed_iter(iterable, name, table="", rows=len):
+    """Times every step of an iterator as a stage, e.g. the parsing of each CSV chunk.
+
+    Args:
+        iterable (iterable): Iterator to time.
+        name (str): Stage name.
+        table (str, optional): Table the stage works on. Defaults to "".
+        rows (callable, optional): Number of rows of an item. Defaults to len.
+
+    Yields:
+        The items of the iterator.
+    """
+    iterator = iter(iterable)
+    while True:
+        start_time = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        if _settings["enabled"]:
+            record("stage", name, time.perf_counter() - start_time, rows(item), 0, table)
+        yield item
+
+
+def instrument_engine(engine):
+    """Records the latency, rows and bytes of every statement executed through an engine.
+
+    The listeners are cheap when instrumentation is disabled, so engines can always be instrumented
+    (see database.create_db_engine) and recording turned on with enable() or ENABLE_ENV.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine to instrument.
+
+    Returns:
+        sqlalchemy.engine.Engine: The same engine.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        if _settings["enabled"]:
+            connection.info.setdefault("instrumentation_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        starts = connection.info.get("instrumentation_start")
+        if not starts:
+            return
+        seconds = time.perf_counter() - starts.pop()
+        if not connection.info.get("instrumentation_skip"):
+            rows = cursor.rowcount if cursor.rowcount is not None else 0
+            record_statement(statement, seconds, rows, params=parameters)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("instrumentation_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    return engine
+
+
+def explain_slow_statements(engine):
+    """Adds the EXPLAIN plan of every slow statement that does not have one yet.
+
+    Plans are read on a separate connection after the fact, since the statement's own connection may
+    still be reading its results.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+
+    Returns:
+        list: The slow statements (see snapshot).
+    """
+    with _lock:
+        pending = [entry for entry in _slow_statements if entry["plan"] is None]
+    with engine.connect() as connection:
+        connection.info["instrumentation_skip"] = True
+        try:
+            for entry in pending:
+                if not EXPLAINABLE.match(entry["statement"]):
+                    entry["plan"] = []
+                    continue
+                try:
+                    result = connection.exec_driver_sql(f"EXPLAIN {entry['statement']}", entry["params"] or ())
+                    entry["plan"] = [dict(row._mapping) for row in result]
+                except Exception as e:
+                    entry["plan"] = [{"error": str(e)}]
+                connection.rollback()
+        finally:
+            connection.info.pop("instrumentation_skip", None)
+    with _lock:
+        return list(_slow_statements)
+
+
+def snapshot():
+    """Returns a copy of the recorded metrics.
+
+    Returns:
+        dict: "buckets_s" (bucket upper bounds), "statements" and "stages" (histograms with name,
+            table, count, sum, max, rows, bytes and per-bucket counts, slowest total first), and
+            "slow_statements".
+    """
+    with _lock:
+        entries = [{"kind": kind, "name": name, "table": table, **histogram, "buckets": list(histogram["buckets"])}
+                   for (kind, name, table), histogram in _histograms.items()]
+        slow = [dict(entry) for entry in _slow_statements]
+    entries = sorted(entries, key=lambda entry: entry["sum_s"], reverse=True)
+    return {
+        "buckets_s": list(LATENCY_BUCKETS_S),
+        "statements": [entry for entry in entries if entry["kind"] == "statement"],
+        "stages": [entry for entry in entries if entry["kind"] == "stage"],
+        "slow_statements": slow,
+    }
+
+
+def merge(metrics):
+    """Adds metrics recorded in another process (e.g. a pipeline worker) to this process.
+
+    Args:
+        metrics (dict): Output of snapshot in the other process.
+
+    Returns:
+        None
+    """
+    with _lock:
+        for entry in metrics["statements"] + metrics["stages"]:
+            histogram = _histograms.setdefault((entry["kind"], entry["name"], entry["table"]), _new_histogram())
+            histogram["buckets"] = [own + other for own, other in zip(histogram["buckets"], entry["buckets"])]
+            for key in ["count", "sum_s", "rows", "bytes"]:
+                histogram[key] += entry[key]
+            histogram["max_s"] = max(histogram["max_s"], entry["max_s"])
+        _slow_statements.extend(metrics["slow_statements"])
+        _slow_statements.sort(key=lambda item: item["seconds"], reverse=True)
+        del _slow_statements[MAX_SLOW_STATEMENTS:]
+
+
+def to_json(filepath=None, engine=None):
+    """Exports the recorded metrics as JSON.
+
+    Args:
+        filepath (str, optional): File to write. Defaults to returning the JSON text only.
+        engine (sqlalchemy.engine.Engine, optional): When given, slow statements are explained first.
+
+    Returns:
+        str: JSON document (see snapshot).
+    """
+    if engine is not None:
+        explain_slow_statements(engine)
+    document = json.dumps(snapshot(), indent=2, default=str)
+    if filepath is not None:
+        with open(filepath, "w") as file:
+            file.write(document)
+    return document
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", " ").replace('"', '\\"')
+
+
+def to_prometheus():
+    """Exports the recorded metrics in the Prometheus text exposition format.
+
+    Statements are labelled with their fingerprint, stages with their name; both carry the table.
+
+    Returns:
+        str: Metrics text, e.g. for a node_exporter textfile collector or a /metrics endpoint.
+    """
+    metrics = snapshot()
+    lines = []
+    for kind, label in [("statement", "statement"), ("stage", "stage")]:
+        entries = metrics[f"{kind}s"]
+        prefix = f"{METRIC_PREFIX}_{kind}"
+        lines += [f"# HELP {prefix}_seconds Latency of each {kind}.", f"# TYPE {prefix}_seconds histogram"]
+        for entry in entries:
+            labels = f'{label}="{_label(entry["name"])}",table="{_label(entry["table"])}"'
+            cumulative = 0
+            for bound, count in zip(list(LATENCY_BUCKETS_S) + ["+Inf"], entry["buckets"]):
+                cumulative += count
+                lines.append(f'{prefix}_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{prefix}_seconds_sum{{{labels}}} {entry['sum_s']}")
+            lines.append(f"{prefix}_seconds_count{{{labels}}} {entry['count']}")
+        for counter, help_text in [("rows", "Rows processed"), ("bytes", "Bytes sent to the server")]:
+            lines += [f"# HELP {prefix}_{counter}_total {help_text} by each {kind}.",
+                      f"# TYPE {prefix}_{counter}_total counter"]
+            for entry in entries:
+                labels = f'{label}="{_label(entry["name"])}",table="{_label(entry["table"])}"'
+                lines.append(f"{prefix}_{counter}_total{{{labels}}} {entry[counter]}")
+    lines += [f"# HELP {METRIC_PREFIX}_slow_statements Slow statements kept for profiling.",
+              f"# TYPE {METRIC_PREFIX}_slow_statements gauge", f"{METRIC_PREFIX}_slow_statements {len(metrics['slow_statements'])}"]
+    return "\n".join(lines) + "\n"
+
+
+def print_report(top=10):
+    """Prints the statements and stages with the largest total time.
+
+    Args:
+        top (int, optional): Number of entries of each kind. Defaults to 10.
+
+    Returns:
+        None
+    """
+    metrics = snapshot()
+    for kind in ["stages", "statements"]:
+        print(f"Top {kind} by total time:")
+        for entry in metrics[kind][:top]:
+            table = f" [{entry['table']}]" if entry["table"] else ""
+            print(f"  {entry['sum_s']:9.3f}s  {entry['count']:7d}x  max {entry['max_s']:.3f}s  "
+                  f"{entry['rows']:10d} rows  {entry['name'][:100]}{table}")
+    for entry in metrics["slow_statements"][:top]:
+        print(f"Slow statement ({entry['seconds']:.2f}s): {entry['fingerprint'][:200]}")
+        for row in entry["plan"] or []:
+            print(f"    {row}")
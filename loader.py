@@ -0,0 +1,363 @@
+# Import packages
+import os
+import csv
+import uuid
+import time
+import tempfile
+from contextlib import nullcontext
+import pandas as pd
+from sqlalchemy import Integer, String, inspect, text
+import versions
+import instrumentation
+import rollup
+
+
+# Default number of CSV rows streamed and written per batch
+DEFAULT_BATCH_SIZE = 50000
+
+# Bulk-load methods supported by load_csv
+LOAD_METHODS = ("auto", "load_data", "executemany")
+
+# MySQL errors meaning LOAD DATA LOCAL INFILE is disabled on the client or server, the only ones
+# the "auto" method falls back to executemany on
+LOCAL_INFILE_ERRORS = (1148, 2068, 3948)
+
+
+# Define functions to stream CSV files into the database
+
+
+def analysis_id_from_path(filepath):
+    """Derives the analysis identifier from an output file name.
+
+    Args:
+        filepath (str): Path such as .../ESP-1714391188-zq9z-cost-results-poi-info.csv.
+
+    Returns:
+        str: Analysis identifier, e.g. ESP-1714391188-zq9z.
+    """
+    return "-".join(os.path.basename(filepath).split("-")[:3])
+
+
+def result_id(analysis_id, poi_id):
+    """Returns the deterministic id of a per-POI result row of an analysis.
+
+    Args:
+        analysis_id (str): Analysis identifier.
+        poi_id (str): POI identifier.
+
+    Returns:
+        str: UUID string, stable across reloads.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{analysis_id}/{poi_id}"))
+
+
+def iter_csv_chunks(filepath, batch_size=DEFAULT_BATCH_SIZE, columns=None):
+    """Streams a CSV file as pandas DataFrames of bounded size.
+
+    Args:
+        filepath (str): Path to the CSV file.
+        batch_size (int, optional): Maximum number of rows per chunk. Defaults to DEFAULT_BATCH_SIZE.
+        columns (list, optional): Subset of columns to read. Defaults to all columns.
+
+    Yields:
+        pandas.DataFrame: The next chunk of rows from the file.
+    """
+    for chunk in pd.read_csv(filepath, chunksize=batch_size, usecols=columns):
+        yield chunk
+
+
+def get_table_columns(engine, table_name):
+    """Returns the columns of a database table and their SQLAlchemy types.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Name of the table.
+
+    Returns:
+        dict: Mapping of column name to SQLAlchemy type, in table order.
+    """
+    return {column["name"]: column["type"] for column in inspect(engine).get_columns(table_name)}
+
+
+def coerce_chunk(chunk, column_types):
+    """Restricts a chunk to the table columns and converts values to database-friendly types.
+
+    Boolean values (read by pandas as bool or as objects when the column has blanks) are
+    converted to 1/0, or back to their "True"/"False" CSV text for string columns, and floats destined
+    for integer columns are converted to nullable integers, so that both bulk-load methods send the
+    same values.
+
+    Args:
+        chunk (pandas.DataFrame): Chunk of rows read from a CSV file.
+        column_types (dict): Mapping of table column name to SQLAlchemy type.
+
+    Returns:
+        pandas.DataFrame: Chunk with only the table columns, ready to be written.
+    """
+    columns = [column for column in chunk.columns if column in column_types]
+    chunk = chunk[columns].copy()
+
+    for column in columns:
+        series = chunk[column]
+
+        # Booleans are stored as TINYINT(1) in MySQL, and as their CSV text in string columns
+        is_bool = series.dtype == bool
+        if not is_bool and series.dtype == object:
+            values = series.dropna()
+            is_bool = len(values) > 0 and values.map(type).eq(bool).all()
+        if is_bool and isinstance(column_types[column], String):
+            series = series.map({True: "True", False: "False"})
+        elif is_bool:
+            series = series.map({True: 1, False: 0}).astype("Int8")
+
+        # Integer columns with blanks are read by pandas as floats
+        if isinstance(column_types[column], Integer) and series.dtype.kind == "f":
+            series = series.round().astype("Int64")
+
+        chunk[column] = series
+
+    return chunk
+
+
+def quote_columns(columns):
+    """Returns a comma-separated list of backtick-quoted MySQL column names.
+
+    Args:
+        columns (iterable): Column names.
+
+    Returns:
+        str: Quoted column list, e.g. "`a`, `b`".
+    """
+    return ", ".join(f"`{column}`" for column in columns)
+
+
+def to_rows(chunk):
+    """Converts a DataFrame to a list of row lists with missing values as None.
+
+    Args:
+        chunk (pandas.DataFrame): Chunk of rows.
+
+    Returns:
+        list: Rows ready to be passed to cursor.executemany.
+    """
+    return chunk.astype(object).where(chunk.notna(), None).values.tolist()
+
+
+def _load_data_chunk(cursor, table_name, chunk):
+    # Write the chunk to a temporary file in the format expected by LOAD DATA (NULL as \N)
+    with instrumentation.stage("loader.convert", table_name) as counters:
+        chunk = chunk.copy()
+        for column in chunk.columns:
+            if not pd.api.types.is_numeric_dtype(chunk[column]):
+                chunk[column] = chunk[column].map(
+                    lambda value: value.replace("\\", "\\\\") if isinstance(value, str) else value)
+
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="") as temp_file:
+            chunk.to_csv(temp_file, index=False, header=False, na_rep="\\N", quoting=csv.QUOTE_MINIMAL)
+            temp_path = temp_file.name
+        counters["rows"] = len(chunk)
+
+    try:
+        command = (
+            f"LOAD DATA LOCAL INFILE '{temp_path}' INTO TABLE `{table_name}` "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '\\\\' "
+            "LINES TERMINATED BY '\\n' "
+            f"({quote_columns(chunk.columns)})"
+        )
+        start_time = time.perf_counter()
+        cursor.execute(command)
+        instrumentation.record_statement(command, time.perf_counter() - start_time, len(chunk),
+                                         os.path.getsize(temp_path), table=table_name)
+    finally:
+        os.remove(temp_path)
+
+    # LOAD DATA LOCAL skips rows with duplicate keys with a warning instead of failing, so the
+    # skipped rows are turned into an error, as an INSERT of the same rows would raise one
+    skipped = len(chunk) - cursor.rowcount
+    if skipped > 0:
+        cursor.execute("SHOW WARNINGS LIMIT 3")
+        warnings = "; ".join(str(row[2]) for row in cursor.fetchall())
+        raise ValueError(f"{table_name}: {skipped} of {len(chunk)} rows were not loaded ({warnings})")
+
+
+def _executemany_chunk(cursor, table_name, chunk):
+    # mysql.connector rewrites INSERT ... VALUES into a single multi-row INSERT
+    placeholders = ", ".join(["%s"] * len(chunk.columns))
+    command = f"INSERT INTO `{table_name}` ({quote_columns(chunk.columns)}) VALUES ({placeholders})"
+    with instrumentation.stage("loader.convert", table_name) as counters:
+        rows = to_rows(chunk)
+        counters["rows"] = len(rows)
+    start_time = time.perf_counter()
+    cursor.executemany(command, rows)
+    if instrumentation.is_enabled():
+        # The statement actually sent is the rewritten multi-row INSERT
+        sent = getattr(cursor, "statement", None) or command
+        instrumentation.record_statement(command, time.perf_counter() - start_time, len(rows),
+                                         len(sent.encode()) if isinstance(sent, str) else len(sent), rows, table_name)
+
+
+def write_chunk(connection, table_name, chunk, method):
+    """Writes a single chunk to a table with the given bulk-load method and commits it.
+
+    Args:
+        connection: Raw DBAPI connection (see sqlalchemy.engine.Engine.raw_connection).
+        table_name (str): Name of the target table.
+        chunk (pandas.DataFrame): Coerced chunk of rows (see coerce_chunk).
+        method (str): Either "load_data" or "executemany".
+
+    Returns:
+        None
+    """
+    # The rows may belong to POIs already counted (results of existing POIs, rows skipped as
+    # duplicates), so the aggregates of the POIs are captured before and after the write
+    tracked = table_name in rollup.ROLLUP_TABLES and "poi_id" in chunk.columns
+    cursor = connection.cursor()
+    try:
+        with rollup.track(cursor, chunk["poi_id"]) if tracked else nullcontext():
+            if method == "load_data":
+                _load_data_chunk(cursor, table_name, chunk)
+            else:
+                _executemany_chunk(cursor, table_name, chunk)
+        with instrumentation.stage("loader.commit", table_name):
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def load_chunks(engine, table_name, chunks, method="auto"):
+    """Bulk-loads an iterable of DataFrame chunks into a table, committing after each chunk.
+
+    With method "auto", LOAD DATA LOCAL INFILE is tried first and the loader falls back to
+    multi-row executemany batches if the client or server does not allow local infile
+    (LOCAL_INFILE_ERRORS); other errors are raised. Both methods fail on rows with duplicate keys.
+    For LOAD DATA, the engine must be created with connect_args={"allow_local_infile": True}.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Name of the target table.
+        chunks (iterable): Iterable of pandas DataFrames.
+        method (str, optional): One of "auto", "load_data" or "executemany". Defaults to "auto".
+
+    Returns:
+        dict: Load statistics with the table name, rows, seconds, rows per second and method used.
+    """
+    if method not in LOAD_METHODS:
+        raise ValueError(f"Unknown load method '{method}', expected one of {LOAD_METHODS}")
+
+    column_types = get_table_columns(engine, table_name)
+    total_rows = 0
+    start_time = time.perf_counter()
+
+    connection = engine.raw_connection()
+    try:
+        for chunk in chunks:
+            with instrumentation.stage("loader.coerce", table_name) as counters:
+                chunk = coerce_chunk(chunk, column_types)
+                counters["rows"] = len(chunk)
+            if len(chunk) == 0:
+                continue
+
+            if method == "auto":
+                try:
+                    write_chunk(connection, table_name, chunk, "load_data")
+                    method = "load_data"
+                except Exception as e:
+                    if getattr(e, "errno", None) not in LOCAL_INFILE_ERRORS:
+                        raise
+                    print(f"LOAD DATA LOCAL INFILE unavailable for {table_name} ({e}), using executemany.")
+                    method = "executemany"
+                    write_chunk(connection, table_name, chunk, method)
+            else:
+                write_chunk(connection, table_name, chunk, method)
+
+            total_rows += len(chunk)
+            elapsed = time.perf_counter() - start_time
+            print(f"{table_name}: {total_rows} rows loaded ({total_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    finally:
+        connection.close()
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        "table": table_name,
+        "rows": total_rows,
+        "seconds": elapsed,
+        "rows_per_second": total_rows / max(elapsed, 1e-9),
+        "method": method,
+    }
+
+
+def load_csv(engine, table_name, filepath, batch_size=DEFAULT_BATCH_SIZE, method="auto"):
+    """Streams a CSV file into a table in bounded chunks using the fastest available bulk-load path.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Name of the target table.
+        filepath (str): Path to the CSV file.
+        batch_size (int, optional): Number of rows per chunk and commit. Defaults to DEFAULT_BATCH_SIZE.
+        method (str, optional): One of "auto", "load_data" or "executemany". Defaults to "auto".
+
+    Returns:
+        dict: Load statistics (see load_chunks).
+    """
+    scopes = {}
+    chunks = versions.track_scopes(
+        instrumentation.timed_iter(iter_csv_chunks(filepath, batch_size), "loader.read", table_name), scopes)
+    try:
+        stats = load_chunks(engine, table_name, chunks, method=method)
+    finally:
+        # Invalidate cached queries, also when the load stopped part way after committing chunks
+        versions.bump_versions(engine, dataset_ids=scopes.get("dataset_id", ()),
+                               country_codes=scopes.get("country_code", ()))
+    print(f"{table_name}: {stats['rows']} rows in {stats['seconds']:.1f}s "
+          f"({stats['rows_per_second']:,.0f} rows/s, {stats['method']})")
+    return stats
+
+
+# Define functions to read tables back in bounded chunks
+
+
+def iter_table_chunks(engine, table_name, columns, key_column, where="", params=None,
+                      batch_size=DEFAULT_BATCH_SIZE):
+    """Reads a table as DataFrame chunks using keyset pagination on an indexed key.
+
+    Each chunk is a separate "WHERE key > last_key ORDER BY key LIMIT n" range scan of the key index,
+    so memory stays bounded on drivers without server-side cursors and no long-running read holds
+    a snapshot open.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Name of the table.
+        columns (list): Columns to read; the key column is added if missing.
+        key_column (str): Unique indexed column used to page through the table.
+        where (str, optional): Extra SQL condition with named parameters. Defaults to no condition.
+        params (dict, optional): Parameters of the extra condition. Defaults to None.
+        batch_size (int, optional): Maximum number of rows per chunk. Defaults to DEFAULT_BATCH_SIZE.
+
+    Yields:
+        pandas.DataFrame: The next chunk of rows, ordered by key.
+    """
+    if key_column not in columns:
+        columns = [key_column] + list(columns)
+    condition = f" AND ({where})" if where else ""
+    first_query = text(
+        f"SELECT {quote_columns(columns)} FROM `{table_name}` WHERE 1 = 1{condition} "
+        f"ORDER BY `{key_column}` LIMIT {int(batch_size)}")
+    next_query = text(
+        f"SELECT {quote_columns(columns)} FROM `{table_name}` WHERE `{key_column}` > :last_key{condition} "
+        f"ORDER BY `{key_column}` LIMIT {int(batch_size)}")
+
+    params = dict(params or {})
+    query = first_query
+    while True:
+        with engine.connect() as connection:
+            chunk = pd.read_sql(query, connection, params=params)
+        if len(chunk) == 0:
+            return
+        yield chunk
+        if len(chunk) < batch_size:
+            return
+        params["last_key"] = chunk[key_column].iloc[-1]
+        query = next_query
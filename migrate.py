@@ -0,0 +1,397 @@
+# Import packages
+import re
+import hashlib
+import time
+from datetime import datetime, timezone
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateTable, CreateIndex, CreateColumn, AddConstraint
+import datamodel
+import partition
+import loader
+import incremental
+import rollup
+import versions
+import cost_results
+import visibility
+import fiberpath
+
+
+# MySQL errors raised when an ALGORITHM/LOCK clause is not supported by an operation
+ONLINE_DDL_ERRORS = (1845, 1846)
+
+# Online DDL clauses tried in order for each kind of statement (the last one is plain DDL)
+ALTER_CLAUSES = [", ALGORITHM=INSTANT", ", ALGORITHM=INPLACE, LOCK=NONE", ""]
+INDEX_CLAUSES = [" ALGORITHM=INPLACE LOCK=NONE", " ALGORITHM=INPLACE", ""]
+
+# Columns whose type changed in the data model, altered with MODIFY COLUMN when the live column
+# still has a type of another kind or a different length
+COLUMN_TYPE_CHANGES = {
+    "cost_result": ["estimate"],  # Float to String(50), to hold estimates and scenario ids such as "central"
+    "cell_coverage": ["path"],  # String(50) to String(255), to hold full coverage file paths
+}
+
+# Columns of the first data model whose values moved to long tables, matched by name in the live
+# tables: the per-distance cost columns (cost_result_poi_distance), the numbered visible cell sites
+# (visibility_link) and the stringified fiber paths (fiber_path_result_path)
+LEGACY_COLUMNS = {
+    "cost_result_poi": cost_results.WIDE_COLUMN,
+    "visibility_result": visibility.SLOT_COLUMN,
+    "fiber_path_result_poi": re.compile(r"^fiber_path$"),
+}
+
+
+# Define functions to migrate the database schema without dropping data
+
+
+def _type_changed(live_type, model_type):
+    """Tells whether a live column type differs in kind or length from the type of its model column.
+
+    Args:
+        live_type (sqlalchemy.types.TypeEngine): Type reflected from the database.
+        model_type (sqlalchemy.types.TypeEngine): Type declared in the data model.
+
+    Returns:
+        bool: True when the column has to be altered.
+    """
+    if live_type._type_affinity is not model_type._type_affinity:
+        return True
+    return getattr(live_type, "length", None) != getattr(model_type, "length", None)
+
+
+def schema_hash(engine, metadata=datamodel.Base.metadata):
+    """Hashes the DDL of the declarative models, identifying a schema version.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine whose dialect compiles the DDL.
+        metadata (sqlalchemy.MetaData, optional): Models to hash. Defaults to datamodel.Base.metadata.
+
+    Returns:
+        str: SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    for table in metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=engine.dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=engine.dialect)).encode())
+    return digest.hexdigest()
+
+
+def _check_not_null_column(engine, table, column):
+    # A NOT NULL column without a default or generated value cannot be added to a table with rows
+    if column.nullable or column.server_default is not None or column.computed is not None:
+        return
+    with engine.connect() as connection:
+        populated = connection.execute(text(f"SELECT 1 FROM {table.name} LIMIT 1")).first() is not None
+    if populated:
+        raise RuntimeError(f"Cannot add the NOT NULL column {table.name}.{column.name} to a table with rows, "
+                           f"as its values cannot be derived from the existing rows. Empty {table.name} "
+                           "(and reload it once migrated) or recreate the data model.")
+
+
+def _legacy_condition(columns):
+    # Rows still holding a value in one of the legacy columns
+    return " OR ".join(f"`{column}` IS NOT NULL" for column in columns)
+
+
+def legacy_data(engine, inspector=None):
+    """Lists the legacy columns of LEGACY_COLUMNS that still hold data in the database.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        inspector (sqlalchemy.engine.reflection.Inspector, optional): Inspector of the engine.
+            Defaults to a new one.
+
+    Returns:
+        dict: Mapping of table name to its legacy columns, for the tables with rows to move.
+    """
+    inspector = inspector or inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    tables = {}
+    with engine.connect() as connection:
+        for table_name, pattern in LEGACY_COLUMNS.items():
+            if table_name not in existing_tables:
+                continue
+            columns = [column["name"] for column in inspector.get_columns(table_name) if pattern.match(column["name"])]
+            if len(columns) > 0 and connection.execute(
+                    text(f"SELECT 1 FROM {table_name} WHERE {_legacy_condition(columns)} LIMIT 1")).first():
+                tables[table_name] = columns
+    return tables
+
+
+def plan_migration(engine, metadata=datamodel.Base.metadata, drop_extra=False):
+    """Diffs the live schema against the declarative models and lists the DDL needed to match them.
+
+    Missing tables, columns, named indexes and foreign keys are added. Columns and indexes that only
+    exist in the database are reported, and dropped only when drop_extra is set; legacy columns that
+    still hold data are always kept until migrate_legacy_data has moved it. Changes to the type
+    or length of an existing column are only detected for the columns of COLUMN_TYPE_CHANGES. Foreign keys from
+    or to partitioned tables are skipped, as MySQL does not support them (see partition.partition_by_country).
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        metadata (sqlalchemy.MetaData, optional): Target models. Defaults to datamodel.Base.metadata.
+        drop_extra (bool, optional): Drop columns and indexes missing from the models. Defaults to False.
+
+    Returns:
+        list: (kind, statement) tuples in execution order, kind being "create", "alter", "index"
+            or "foreign_key".
+
+    Raises:
+        RuntimeError: A missing NOT NULL column without a default cannot be added to a table with rows,
+            e.g. cell_coverage.geom, which only a reload of the coverage files can fill.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    dialect = engine.dialect
+    partitioned = partition.partitioned_tables(engine) if dialect.name == "mysql" else set()
+    legacy = legacy_data(engine, inspector)
+    statements, foreign_keys = [], []
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            statements.append(("create", str(CreateTable(table).compile(dialect=dialect)).strip()))
+            for index in table.indexes:
+                statements.append(("index", str(CreateIndex(index).compile(dialect=dialect))))
+            continue
+
+        # Columns
+        live_types = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+        live_columns = set(live_types)
+        for column in table.columns:
+            if column.name not in live_columns:
+                _check_not_null_column(engine, table, column)
+                definition = str(CreateColumn(column).compile(dialect=dialect))
+                statements.append(("alter", f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+        for name in COLUMN_TYPE_CHANGES.get(table.name, []):
+            column = table.columns[name]
+            if name in live_types and _type_changed(live_types[name], column.type):
+                definition = str(CreateColumn(column).compile(dialect=dialect))
+                statements.append(("alter", f"ALTER TABLE {table.name} MODIFY COLUMN {definition}"))
+        for name in sorted(live_columns - set(table.columns.keys())):
+            if name in legacy.get(table.name, []):
+                print(f"{table.name}: column {name} still holds data to move to the long tables (kept)")
+            elif drop_extra:
+                statements.append(("alter", f"ALTER TABLE {table.name} DROP COLUMN `{name}`"))
+            else:
+                print(f"{table.name}: column {name} is not in the data model (kept)")
+
+        # Indexes, matched by name
+        live_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        model_indexes = {index.name for index in table.indexes}
+        for index in table.indexes:
+            if index.name not in live_indexes:
+                statements.append(("index", str(CreateIndex(index).compile(dialect=dialect))))
+
+        # Foreign keys, matched by columns and referred table
+        live_fks = {(tuple(fk["constrained_columns"]), fk["referred_table"])
+                    for fk in inspector.get_foreign_keys(table.name)}
+        for constraint in table.foreign_key_constraints:
+            key = (tuple(constraint.column_keys), constraint.referred_table.name)
+            if table.name in partitioned or constraint.referred_table.name in partitioned:
+                continue
+            if key not in live_fks:
+                foreign_keys.append(("foreign_key", str(AddConstraint(constraint).compile(dialect=dialect))))
+
+        # Indexes backing foreign keys are named after their constraint and kept
+        fk_names = {fk["name"] for fk in inspector.get_foreign_keys(table.name)}
+        for name in sorted(live_indexes - model_indexes - fk_names):
+            if drop_extra:
+                statements.append(("alter", f"ALTER TABLE {table.name} DROP INDEX `{name}`"))
+            else:
+                print(f"{table.name}: index {name} is not in the data model (kept)")
+
+    # Foreign keys last, once every referred table exists
+    return statements + foreign_keys
+
+
+def _move_legacy_rows(cursor, table_name, chunk):
+    # Writes the legacy values of a chunk into the long tables, the way the loaders write them
+    if table_name == "cost_result_poi":
+        for analysis_id, rows in chunk.groupby("analysis_id"):
+            distances = cost_results.melt_distances(rows)
+            distances.insert(0, "analysis_id", analysis_id)
+            with rollup.track(cursor, rows["poi_id"]):
+                cursor.executemany(
+                    incremental.upsert_statement("cost_result_poi_distance", list(distances.columns),
+                                                 ["analysis_id", "max_dist_km", "poi_id"]),
+                    loader.to_rows(distances))
+        return
+    if table_name == "visibility_result":
+        links = visibility.melt_links(chunk)
+        visibility._delete_links(cursor, chunk["poi_id"].tolist())
+        if len(links) > 0:
+            cursor.executemany(visibility._link_statement(), loader.to_rows(links))
+        return
+    path_statement = (f"INSERT INTO fiber_path_result_path ({loader.quote_columns(fiberpath.PATH_COLUMNS)}) "
+                      "VALUES (%s, %s, %s, %s)")
+    for analysis_id, rows in chunk.groupby("analysis_id"):
+        paths = fiberpath.explode_paths(rows["poi_id"], rows["fiber_path"])
+        paths.insert(0, "analysis_id", analysis_id)
+        fiberpath._delete_paths(cursor, analysis_id, rows["poi_id"].tolist())
+        if len(paths) > 0:
+            cursor.executemany(path_statement, loader.to_rows(paths[fiberpath.PATH_COLUMNS]))
+
+
+def migrate_legacy_data(engine, batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Moves the values of the legacy wide columns into the long tables that replaced them.
+
+    The per-distance columns of cost_result_poi go to cost_result_poi_distance, the numbered cell
+    sites of visibility_result to visibility_link and the fiber_path strings of fiber_path_result_poi
+    to fiber_path_result_path, reshaped as the loaders do. Each chunk of rows is written and its
+    legacy columns cleared in one transaction, so an interrupted move can be run again. Once empty,
+    the legacy columns are dropped by a migration with drop_extra.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database, migrated to the data model.
+        batch_size (int, optional): Number of rows per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: Number of rows moved per table.
+
+    Raises:
+        RuntimeError: Legacy cost or fiber path rows have no analysis_id, which the long tables are
+            keyed by. Set the analysis of these rows (e.g. from the file they were loaded from) and
+            run the migration again.
+    """
+    stats = {}
+    analysis_ids = set()
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for table_name, columns in legacy_data(engine).items():
+            start_time = time.perf_counter()
+            condition = _legacy_condition(columns)
+            keys = ["id", "poi_id"] + (["analysis_id"] if table_name != "visibility_result" else [])
+            if "analysis_id" in keys:
+                cursor.execute(f"SELECT COUNT(*) FROM {table_name} WHERE ({condition}) AND analysis_id IS NULL")
+                orphans = cursor.fetchone()[0]
+                if orphans > 0:
+                    raise RuntimeError(f"{table_name}: {orphans} rows hold legacy data but no analysis_id. Set "
+                                       "their analysis_id and run the migration again.")
+
+            stats[table_name] = 0
+            select = (f"SELECT {loader.quote_columns(keys + columns)} FROM {table_name} "
+                      f"WHERE {condition} ORDER BY id LIMIT {batch_size}")
+            clear = ", ".join(f"`{column}` = NULL" for column in columns)
+            while True:
+                cursor.execute(select)
+                rows = cursor.fetchall()
+                if len(rows) == 0:
+                    break
+                chunk = pd.DataFrame.from_records(rows, columns=keys + columns, coerce_float=True)
+                if "analysis_id" in chunk.columns:
+                    analysis_ids.update(chunk["analysis_id"].unique())
+                    cursor.executemany("INSERT IGNORE INTO analysis (analysis_id) VALUES (%s)",
+                                       [[analysis_id] for analysis_id in chunk["analysis_id"].unique()])
+                _move_legacy_rows(cursor, table_name, chunk)
+                ids = chunk["id"].tolist()
+                cursor.execute(f"UPDATE {table_name} SET {clear} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+                connection.commit()
+                stats[table_name] += len(rows)
+            print(f"{table_name}: legacy data of {stats[table_name]} rows moved "
+                  f"in {time.perf_counter() - start_time:.1f}s")
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    if len(stats) > 0:
+        versions.bump_versions(engine, analysis_ids=analysis_ids)
+    return stats
+
+
+def _execute_online(connection, kind, statement):
+    # Runs a statement with the least blocking ALGORITHM/LOCK clause MySQL accepts for it
+    clauses = {"alter": ALTER_CLAUSES, "index": INDEX_CLAUSES}.get(kind, [""])
+    for clause in clauses:
+        try:
+            connection.execute(text(statement + clause))
+            return clause.strip(", ") or "default"
+        except DBAPIError as e:
+            errno = getattr(e.orig, "errno", None)
+            if clause == clauses[-1] or errno not in ONLINE_DDL_ERRORS:
+                raise
+
+
+def apply_migration(engine, statements, metadata=datamodel.Base.metadata):
+    """Applies migration statements and records the resulting schema version.
+
+    Each statement is tried with ALGORITHM=INSTANT or ALGORITHM=INPLACE, LOCK=NONE first and falls
+    back to a more blocking algorithm only when MySQL rejects the online clause. The
+    cost_result_poi_wide view is re-created afterwards.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        statements (list): (kind, statement) tuples from plan_migration.
+        metadata (sqlalchemy.MetaData, optional): Target models. Defaults to datamodel.Base.metadata.
+
+    Returns:
+        int: Version number recorded in schema_version, or the current one when nothing changed.
+    """
+    version_hash = schema_hash(engine, metadata)
+
+    with engine.connect() as connection:
+        for kind, statement in statements:
+            start_time = time.perf_counter()
+            algorithm = _execute_online(connection, kind, statement)
+            connection.commit()
+            print(f"{statement.splitlines()[0]} ({algorithm}, {time.perf_counter() - start_time:.1f}s)")
+
+        connection.execute(text(datamodel.cost_result_poi_wide_view_sql()))
+
+        current = connection.execute(
+            text("SELECT version, schema_hash FROM schema_version ORDER BY version DESC LIMIT 1")).first()
+        if current is not None and current.schema_hash == version_hash and len(statements) == 0:
+            connection.commit()
+            return current.version
+
+        connection.execute(
+            text("INSERT INTO schema_version (schema_hash, applied_at, statements) "
+                 "VALUES (:schema_hash, :applied_at, :statements)"),
+            {"schema_hash": version_hash, "applied_at": datetime.now(timezone.utc).replace(tzinfo=None),
+             "statements": len(statements)})
+        version = connection.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+        connection.commit()
+    return version
+
+
+def migrate_data_model(engine, dry_run=False, drop_extra=False):
+    """Brings an existing database up to the data model without dropping tables or data.
+
+    Unlike datamodel.create_data_model, only the missing tables, columns, indexes and foreign keys are
+    created, so adding an index or column leaves the loaded datasets in place. Data still held in the
+    legacy wide columns is then moved to the long tables (see migrate_legacy_data), before the
+    legacy columns are dropped when drop_extra is set.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database (see database.get_engine).
+        dry_run (bool, optional): Only print the planned statements. Defaults to False.
+        drop_extra (bool, optional): Drop columns and indexes missing from the models. Defaults to False.
+
+    Returns:
+        list: (kind, statement) tuples planned (and applied unless dry_run).
+    """
+    statements = plan_migration(engine, drop_extra=drop_extra)
+    if len(statements) == 0:
+        print("The database schema is up to date.")
+    if dry_run:
+        for _, statement in statements:
+            print(statement + ";")
+        for table_name, columns in legacy_data(engine).items():
+            print(f"{table_name}: the data of {len(columns)} legacy columns would be moved to the long tables")
+        return statements
+
+    version = apply_migration(engine, statements)
+    print(f"Database schema migrated to version {version} ({len(statements)} statements).")
+
+    # Move the legacy data, then drop the emptied legacy columns
+    if migrate_legacy_data(engine) and drop_extra:
+        drops = plan_migration(engine, drop_extra=True)
+        version = apply_migration(engine, drops)
+        print(f"Database schema migrated to version {version} ({len(drops)} legacy column drops).")
+        statements += drops
+    return statements
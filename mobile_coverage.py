@@ -0,0 +1,411 @@
+# Import packages
+import math
+import time
+import sqlite3
+import numpy as np
+import pandas as pd
+import shapely
+from sqlalchemy import text
+from datamodel import POINT_SRID
+import loader
+import query
+import nearest
+import incremental
+import versions
+import rollup
+from spatial import bbox_wkt
+
+
+# Attribute columns of cell_coverage read from the GeoPackage layers (the contour_id is generated)
+COVERAGE_COLUMNS = ["fid", "ID", "layer", "path", "coverage"]
+
+# Number of contours inserted per statement (contours are much larger than point rows)
+DEFAULT_COVERAGE_BATCH_SIZE = 500
+
+# Contours with more vertices are cut into grid tiles before indexing, so each point test stays cheap
+DEFAULT_MAX_VERTICES = 256
+
+# Bytes of the GeoPackage binary header envelope, by envelope indicator (flags bits 1-3)
+GPKG_ENVELOPE_BYTES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+# Number of POI ids per IN list when copying the flags of a batch to cost_result_poi
+UPDATE_ID_BATCH_SIZE = 5000
+
+
+# Define functions to read coverage contours from GeoPackage files
+
+
+def gpkg_layers(filepath):
+    """Lists the geometry layers of a GeoPackage file.
+
+    Args:
+        filepath (str): Path to the .gpkg file.
+
+    Returns:
+        list: (table name, geometry column, srs id) tuples.
+    """
+    with sqlite3.connect(f"file:{filepath}?mode=ro", uri=True) as connection:
+        return connection.execute(
+            "SELECT table_name, column_name, srs_id FROM gpkg_geometry_columns ORDER BY table_name").fetchall()
+
+
+def gpkg_to_wkb(blob):
+    """Strips the GeoPackage binary header from a geometry blob.
+
+    Args:
+        blob (bytes): Geometry as stored in a GeoPackage feature table.
+
+    Returns:
+        bytes: Standard WKB geometry, or None for empty or missing geometries.
+    """
+    if blob is None:
+        return None
+    if blob[:2] != b"GP":
+        raise ValueError("Not a GeoPackage geometry blob")
+    flags = blob[3]
+    if flags & 0x20:
+        return None
+    envelope = (flags >> 1) & 0x07
+    if envelope not in GPKG_ENVELOPE_BYTES:
+        raise ValueError(f"Invalid GeoPackage envelope indicator {envelope}")
+    return bytes(blob[8 + GPKG_ENVELOPE_BYTES[envelope]:])
+
+
+def to_multipolygons(geometries):
+    """Promotes polygons to single-part multipolygons, as required by the MULTIPOLYGON column.
+
+    Args:
+        geometries (numpy.ndarray): Array of non-empty Polygon and MultiPolygon geometries.
+
+    Returns:
+        numpy.ndarray: Array of MultiPolygon geometries, in the same order.
+    """
+    parts, index = shapely.get_parts(geometries, return_index=True)
+    return shapely.multipolygons(parts, indices=index)
+
+
+def iter_gpkg_chunks(filepath, layer=None, batch_size=DEFAULT_COVERAGE_BATCH_SIZE):
+    """Streams the features of a GeoPackage coverage layer as DataFrame chunks.
+
+    The file is read with sqlite3 and the geometries are decoded with shapely, so GDAL is not
+    needed and only one chunk of contours is held in memory at a time. Features without a
+    geometry or with a non-areal geometry are skipped.
+
+    Args:
+        filepath (str): Path to the .gpkg file.
+        layer (str, optional): Feature table to read. Defaults to the first geometry layer.
+        batch_size (int, optional): Number of features per chunk. Defaults to DEFAULT_COVERAGE_BATCH_SIZE.
+
+    Yields:
+        pandas.DataFrame: Attribute columns present in the layer and a geom column of MultiPolygons.
+    """
+    layers = {table_name: (column_name, srs_id) for table_name, column_name, srs_id in gpkg_layers(filepath)}
+    if not layers:
+        raise ValueError(f"No geometry layer in {filepath}")
+    if layer is None:
+        layer = next(iter(layers))
+    if layer not in layers:
+        raise ValueError(f"Layer '{layer}' not found in {filepath}, expected one of {list(layers)}")
+    geometry_column, srs_id = layers[layer]
+    if srs_id != POINT_SRID:
+        raise ValueError(f"Layer '{layer}' uses SRS {srs_id}, expected EPSG:{POINT_SRID}")
+
+    connection = sqlite3.connect(f"file:{filepath}?mode=ro", uri=True)
+    try:
+        available = [row[1] for row in connection.execute(f"PRAGMA table_info('{layer}')")]
+        columns = [column for column in COVERAGE_COLUMNS if column in available]
+        selected = ", ".join(f'"{column}"' for column in columns + [geometry_column])
+        cursor = connection.execute(f'SELECT {selected} FROM "{layer}"')
+        for rows in iter(lambda: cursor.fetchmany(batch_size), []):
+            chunk = pd.DataFrame([row[:-1] for row in rows], columns=columns)
+            geometries = shapely.from_wkb([gpkg_to_wkb(row[-1]) for row in rows])
+            keep = ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+            keep &= np.isin(shapely.get_type_id(geometries), [shapely.GeometryType.POLYGON,
+                                                              shapely.GeometryType.MULTIPOLYGON])
+            if not keep.any():
+                continue
+            chunk = chunk[keep].reset_index(drop=True)
+            chunk["geom"] = to_multipolygons(geometries[keep])
+            yield chunk
+    finally:
+        connection.close()
+
+
+# Define functions to load coverage contours into the database
+
+
+def load_coverage_gpkg(engine, filepath, layer=None, analysis_id=None, batch_size=DEFAULT_COVERAGE_BATCH_SIZE):
+    """Streams the contours of a GeoPackage coverage layer into cell_coverage.
+
+    Each chunk is written with one multi-row INSERT and committed, with the geometries sent as
+    WKB and indexed by the SPATIAL INDEX of the geom column. Contours are appended: loading the same
+    file twice stores its contours twice. Paths longer than the live cell_coverage.path column raise a
+    ValueError rather than being truncated, as the database may predate the widened column.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        filepath (str): Path to the .gpkg file.
+        layer (str, optional): Feature table to read. Defaults to the first geometry layer.
+        analysis_id (str, optional): Analysis the contours are linked to through
+            analysis_coverage_association. Defaults to no link.
+        batch_size (int, optional): Number of contours per statement and commit.
+            Defaults to DEFAULT_COVERAGE_BATCH_SIZE.
+
+    Returns:
+        int: Number of contours loaded.
+
+    Raises:
+        ValueError: If a path is longer than the cell_coverage.path column.
+    """
+    start_time = time.perf_counter()
+    column_types = loader.get_table_columns(engine, "cell_coverage")
+    path_length = getattr(column_types.get("path"), "length", None)
+    total_rows = 0
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for chunk in iter_gpkg_chunks(filepath, layer, batch_size):
+            geometries = chunk.pop("geom")
+            chunk = loader.coerce_chunk(chunk, column_types)
+            if path_length is not None and "path" in chunk.columns:
+                overlong = chunk["path"].str.len() > path_length
+                if overlong.any():
+                    raise ValueError(f"cell_coverage.path holds at most {path_length} characters, "
+                                     f"got {chunk['path'][overlong].iloc[0]!r}")
+            columns = list(chunk.columns) + ["geom"]
+            placeholder = "(" + ", ".join(["%s"] * (len(columns) - 1) +
+                                          [f"ST_GeomFromWKB(%s, {POINT_SRID}, 'axis-order=long-lat')"]) + ")"
+            rows = [row + [wkb] for row, wkb in zip(loader.to_rows(chunk), shapely.to_wkb(geometries.to_numpy()))]
+
+            cursor.execute(f"INSERT INTO cell_coverage ({loader.quote_columns(columns)}) VALUES "
+                           + ", ".join([placeholder] * len(rows)), [value for row in rows for value in row])
+            # A multi-row insert receives consecutive ids, starting at lastrowid
+            if analysis_id is not None:
+                first_id = cursor.lastrowid
+                cursor.executemany(
+                    "INSERT INTO analysis_coverage_association (analysis_id, contour_id) VALUES (%s, %s)",
+                    [(analysis_id, contour_id) for contour_id in range(first_id, first_id + len(rows))])
+            connection.commit()
+
+            total_rows += len(rows)
+            elapsed = time.perf_counter() - start_time
+            print(f"cell_coverage: {total_rows} contours loaded ({total_rows / max(elapsed, 1e-9):,.0f} contours/s)")
+        cursor.close()
+    finally:
+        connection.close()
+
+    versions.bump_versions(engine, analysis_ids=[analysis_id] if analysis_id is not None else ())
+    return total_rows
+
+
+# Define functions to classify POIs against the coverage contours in bulk
+
+
+def load_coverage_geometries(engine, bbox=None, layers=None, analysis_id=None, min_coverage=1,
+                             batch_size=DEFAULT_COVERAGE_BATCH_SIZE):
+    """Streams the covered contours from the database into a geometry array.
+
+    Only the contours whose bounding rectangle intersects bbox are read, using the SPATIAL INDEX.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        bbox (tuple, optional): (min_lon, min_lat, max_lon, max_lat) of the area of interest.
+            Defaults to every contour.
+        layers (list, optional): Only read contours of these layers. Defaults to every layer.
+        analysis_id (str, optional): Only read contours linked to this analysis. Defaults to every contour.
+        min_coverage (int, optional): Smallest coverage value counted as covered. Defaults to 1.
+        batch_size (int, optional): Number of contours fetched per round trip.
+            Defaults to DEFAULT_COVERAGE_BATCH_SIZE.
+
+    Returns:
+        numpy.ndarray: MultiPolygon geometries in lon/lat.
+    """
+    conditions, params = ["c.coverage >= %(min_coverage)s"], {"min_coverage": min_coverage}
+    join = ""
+    if bbox is not None:
+        conditions.append(f"MBRIntersects(ST_GeomFromText(%(bbox)s, {POINT_SRID}, 'axis-order=long-lat'), c.geom)")
+        params["bbox"] = bbox_wkt(*bbox)
+    if layers is not None:
+        names = [f"layer_{i}" for i in range(len(layers))]
+        conditions.append(f"c.layer IN ({', '.join(f'%({name})s' for name in names)})")
+        params.update(dict(zip(names, layers)))
+    if analysis_id is not None:
+        join = "JOIN analysis_coverage_association a ON a.contour_id = c.contour_id "
+        conditions.append("a.analysis_id = %(analysis_id)s")
+        params["analysis_id"] = analysis_id
+
+    sql_query = (f"SELECT ST_AsWKB(c.geom, 'axis-order=long-lat') FROM cell_coverage c {join}"
+                 f"WHERE {' AND '.join(conditions)}")
+    parts = [shapely.from_wkb([row[0] for row in rows])
+             for rows in query.stream_rows(engine, sql_query, params, batch_size)]
+    return np.concatenate(parts) if parts else np.empty(0, dtype=object)
+
+
+def subdivide(geometries, max_vertices=DEFAULT_MAX_VERTICES):
+    """Cuts detailed polygons into grid tiles with at most about max_vertices vertices each.
+
+    National coverage layers are often a few huge multipolygons, whose bounding boxes cover every
+    point and whose point-in-polygon tests walk thousands of edges. Tiles have small bounding boxes
+    and few edges, so the spatial index discards most candidates and each remaining test is cheap.
+    Tiles cover the same area as the original polygons.
+
+    Args:
+        geometries (numpy.ndarray): Polygonal geometries.
+        max_vertices (int, optional): Vertex count above which a geometry is cut.
+            Defaults to DEFAULT_MAX_VERTICES.
+
+    Returns:
+        numpy.ndarray: Polygonal geometries, the small ones unchanged followed by the tiles.
+    """
+    parts = shapely.get_parts(geometries)
+    n_vertices = shapely.get_num_coordinates(parts)
+    detailed = n_vertices > max_vertices
+    tiles = [parts[~detailed]]
+    for part, count in zip(parts[detailed], n_vertices[detailed]):
+        n_cells = math.ceil(math.sqrt(count / max_vertices))
+        min_x, min_y, max_x, max_y = shapely.bounds(part)
+        xs = np.linspace(min_x, max_x, n_cells + 1)
+        ys = np.linspace(min_y, max_y, n_cells + 1)
+        clipped = np.array([shapely.clip_by_rect(part, xs[i], ys[j], xs[i + 1], ys[j + 1])
+                            for i in range(n_cells) for j in range(n_cells)])
+        tiles.append(clipped[~shapely.is_empty(clipped)])
+    return np.concatenate(tiles)
+
+
+def build_coverage_index(geometries, max_vertices=DEFAULT_MAX_VERTICES):
+    """Builds the spatial index used to classify points against coverage contours.
+
+    Args:
+        geometries (numpy.ndarray): Covered contours.
+        max_vertices (int, optional): Vertex count above which a contour is cut into tiles
+            (see subdivide). None keeps the contours whole. Defaults to DEFAULT_MAX_VERTICES.
+
+    Returns:
+        shapely.STRtree: Index over the contours or their tiles.
+    """
+    if max_vertices is not None and len(geometries) > 0:
+        geometries = subdivide(geometries, max_vertices)
+    return shapely.STRtree(geometries)
+
+
+def covered_points(tree, lat, lon):
+    """Tests which points lie inside a coverage contour, in one vectorized query.
+
+    Points on a contour boundary count as covered.
+
+    Args:
+        tree (shapely.STRtree): Index built by build_coverage_index.
+        lat (numpy.ndarray): Latitudes in degrees.
+        lon (numpy.ndarray): Longitudes in degrees.
+
+    Returns:
+        numpy.ndarray: Boolean array, True for covered points.
+    """
+    covered = np.zeros(len(lat), dtype=bool)
+    if len(tree) == 0 or len(lat) == 0:
+        return covered
+    point_index, _ = tree.query(shapely.points(lon, lat), predicate="intersects")
+    covered[point_index] = True
+    return covered
+
+
+def poi_bbox(engine, country_code=None, dataset_id=None):
+    """Returns the bounding box of the POIs of a country and/or dataset.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        country_code (str, optional): Country code. Defaults to all countries.
+        dataset_id (str, optional): Dataset identifier. Defaults to all datasets.
+
+    Returns:
+        tuple: (min_lon, min_lat, max_lon, max_lat), or None when there are no POIs.
+    """
+    condition, params = nearest.scope_filter(country_code, dataset_id)
+    where = f" WHERE {condition}" if condition else ""
+    with engine.connect() as connection:
+        row = connection.execute(
+            text(f"SELECT MIN(lon), MIN(lat), MAX(lon), MAX(lat) FROM point_of_interest{where}"), params).first()
+    return None if row[0] is None else tuple(row)
+
+
+def classify_coverage(engine, country_code=None, dataset_id=None, layers=None, analysis_id=None,
+                      update_cost_results=True, max_vertices=DEFAULT_MAX_VERTICES,
+                      batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Flags the POIs inside a coverage contour and writes _4G_coverage for all of them.
+
+    The contours around the POIs are read once and indexed in memory, then POIs are read in
+    key-ordered batches and classified with one vectorized index query per batch, so the
+    database sees no per-POI query. The flags are upserted into mapping_result (whose id is the
+    POI id, see nearest.compute_mapping_results) and copied to cost_result_poi with set-based
+    UPDATEs restricted to the POI ids of each batch.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        country_code (str, optional): Only process POIs of this country. Defaults to all countries.
+        dataset_id (str, optional): Only process POIs of this dataset. Defaults to all datasets.
+        layers (list, optional): Only use contours of these layers. Defaults to every layer.
+        analysis_id (str, optional): Only use contours linked to this analysis. Defaults to every contour.
+        update_cost_results (bool, optional): Also update cost_result_poi. Defaults to True.
+        max_vertices (int, optional): Vertex count above which a contour is cut into tiles before
+            indexing (see subdivide). Defaults to DEFAULT_MAX_VERTICES.
+        batch_size (int, optional): Number of POIs per batch and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        int: Number of POIs classified.
+    """
+    start_time = time.perf_counter()
+    bbox = poi_bbox(engine, country_code, dataset_id)
+    if bbox is None:
+        return 0
+    geometries = load_coverage_geometries(engine, bbox, layers, analysis_id)
+    tree = build_coverage_index(geometries, max_vertices)
+    print(f"cell_coverage: {len(geometries)} contours indexed as {len(tree)} parts "
+          f"({time.perf_counter() - start_time:.2f}s)")
+
+    columns = ["id", "poi_id", "lat", "lon", "_4G_coverage"]
+    statement = incremental.upsert_statement("mapping_result", columns, ["id", "poi_id"])
+    condition, params = nearest.scope_filter(country_code, dataset_id)
+    pois_chunks = loader.iter_table_chunks(engine, "point_of_interest", ["poi_id", "lat", "lon"], "poi_id",
+                                           where=condition, params=params, batch_size=batch_size)
+    total_pois, total_covered, analysis_ids = 0, 0, set()
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for pois in pois_chunks:
+            covered = covered_points(tree, pois["lat"].to_numpy(), pois["lon"].to_numpy())
+            results = pois.reset_index(drop=True)
+            results.insert(0, "id", results["poi_id"])
+            results["_4G_coverage"] = covered.astype(int)
+            with rollup.track(cursor, results["poi_id"]):
+                cursor.executemany(statement, loader.to_rows(results[columns]))
+
+                # Only the POIs of the batch are copied, as the key range between them may hold POIs
+                # of other countries or datasets whose rollups are not tracked here
+                if update_cost_results:
+                    poi_ids = results["poi_id"].tolist()
+                    for start in range(0, len(poi_ids), UPDATE_ID_BATCH_SIZE):
+                        keys = poi_ids[start:start + UPDATE_ID_BATCH_SIZE]
+                        id_list = ", ".join(["%s"] * len(keys))
+                        cursor.execute("UPDATE cost_result_poi c JOIN mapping_result m ON m.id = c.poi_id "
+                                       f"SET c._4G_coverage = m._4G_coverage WHERE c.poi_id IN ({id_list})", keys)
+                        if cursor.rowcount > 0:
+                            cursor.execute(f"SELECT DISTINCT analysis_id FROM cost_result_poi WHERE poi_id IN ({id_list})",
+                                           keys)
+                            analysis_ids.update(row[0] for row in cursor.fetchall())
+            connection.commit()
+
+            total_pois += len(results)
+            total_covered += int(covered.sum())
+            elapsed = time.perf_counter() - start_time
+            print(f"_4G_coverage: {total_pois} POIs classified, {total_covered} covered "
+                  f"({total_pois / max(elapsed, 1e-9):,.0f} POIs/s)")
+        cursor.close()
+    finally:
+        connection.close()
+
+    versions.bump_versions(engine, dataset_ids=[dataset_id] if dataset_id is not None else (),
+                           analysis_ids=analysis_ids,
+                           country_codes=[country_code] if country_code is not None else ())
+    return total_pois
@@ -0,0 +1,239 @@
+# Import packages
+import time
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from sqlalchemy import text
+import loader
+import incremental
+import versions
+import rollup
+
+
+# Mean Earth radius in metres
+EARTH_RADIUS_M = 6371008.8
+
+# Distance columns of mapping_result and the infrastructure subset each one is measured to
+DISTANCE_LAYERS = {
+    "cell_site_dist": ("cell_site", None, None),
+    "_4G_cell_site_dist": ("cell_site", "radio_type", "4G"),
+    "_5G_cell_site_dist": ("cell_site", "radio_type", "5G"),
+    "transmission_node_dist": ("transmission_node", None, None),
+    "fiber_node_dist": ("transmission_node", "transmission_medium", "fiber"),
+}
+
+
+# Define functions to compute distances from POIs to the nearest infrastructure
+
+
+def scope_filter(country_code=None, dataset_id=None):
+    """Builds the SQL condition restricting a query to a country and/or dataset.
+
+    Args:
+        country_code (str, optional): Country code. Defaults to no restriction.
+        dataset_id (str, optional): Dataset identifier. Defaults to no restriction.
+
+    Returns:
+        tuple: SQL condition (empty when unrestricted) and its named parameters.
+    """
+    conditions, params = [], {}
+    if country_code is not None:
+        conditions.append("country_code = :country_code")
+        params["country_code"] = country_code
+    if dataset_id is not None:
+        conditions.append("dataset_id = :dataset_id")
+        params["dataset_id"] = dataset_id
+    return " AND ".join(conditions), params
+
+
+def load_infrastructure(engine, country_code=None):
+    """Loads the locations of cell sites and transmission nodes.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        country_code (str, optional): Only load infrastructure of this country. Defaults to all countries.
+
+    Returns:
+        dict: DataFrames of cell sites and transmission nodes, keyed by table name.
+    """
+    condition, params = scope_filter(country_code, None)
+    where = f" WHERE {condition}" if condition else ""
+    queries = {
+        "cell_site": f"SELECT ict_id, lat, lon, radio_type FROM cell_site{where}",
+        "transmission_node": f"SELECT ict_id, lat, lon, transmission_medium FROM transmission_node{where}",
+    }
+    with engine.connect() as connection:
+        return {table: pd.read_sql(text(query), connection, params=params) for table, query in queries.items()}
+
+
+def to_unit_vectors(lat, lon):
+    """Converts latitudes and longitudes to points on the unit sphere.
+
+    The straight-line (chord) distance between unit vectors grows monotonically with the
+    great-circle distance, so a Euclidean KD-tree over them returns exact great-circle neighbours.
+
+    Args:
+        lat (numpy.ndarray): Latitudes in degrees.
+        lon (numpy.ndarray): Longitudes in degrees.
+
+    Returns:
+        numpy.ndarray: Array of shape (n, 3).
+    """
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_metres(chord):
+    """Converts chord distances between unit vectors to great-circle distances in metres.
+
+    Args:
+        chord (numpy.ndarray): Chord distances on the unit sphere.
+
+    Returns:
+        numpy.ndarray: Great-circle distances in metres.
+    """
+    return 2.0 * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0)) * EARTH_RADIUS_M
+
+
+def build_indexes(infrastructure, layers=DISTANCE_LAYERS):
+    """Builds a KD-tree over unit-sphere coordinates for every distance layer.
+
+    Args:
+        infrastructure (dict): DataFrames keyed by table name (see load_infrastructure).
+        layers (dict, optional): Distance column to (table, filter column, filter value).
+            Defaults to DISTANCE_LAYERS.
+
+    Returns:
+        dict: Mapping of distance column to cKDTree, or None when the layer has no sites.
+    """
+    indexes = {}
+    for column, (table, filter_column, filter_value) in layers.items():
+        sites = infrastructure[table]
+        if filter_column is not None:
+            sites = sites[sites[filter_column] == filter_value]
+        if len(sites) == 0:
+            indexes[column] = None
+            continue
+        indexes[column] = cKDTree(to_unit_vectors(sites["lat"].to_numpy(), sites["lon"].to_numpy()))
+    return indexes
+
+
+def nearest_distances(indexes, lat, lon, n_jobs=-1):
+    """Computes the distance from every point to the nearest site of each layer.
+
+    Args:
+        indexes (dict): KD-trees keyed by distance column (see build_indexes).
+        lat (numpy.ndarray): Latitudes of the points.
+        lon (numpy.ndarray): Longitudes of the points.
+        n_jobs (int, optional): Number of worker threads used by the KD-tree queries. Defaults to -1 (all CPUs).
+
+    Returns:
+        pandas.DataFrame: One column of distances in metres per layer (NaN when the layer is empty).
+    """
+    points = to_unit_vectors(lat, lon)
+    distances = {}
+    for column, tree in indexes.items():
+        if tree is None or len(points) == 0:
+            distances[column] = np.full(len(points), np.nan)
+            continue
+        chord, _ = tree.query(points, k=1, workers=n_jobs)
+        distances[column] = chord_to_metres(chord)
+    return pd.DataFrame(distances)
+
+
+def compute_mapping_results(engine, country_code=None, dataset_id=None, batch_size=loader.DEFAULT_BATCH_SIZE,
+                            n_jobs=-1):
+    """Computes the nearest-infrastructure distances of POIs and writes them to mapping_result.
+
+    POIs are read from the database in key-ordered batches, distances are computed for each batch in one
+    vectorized pass, and the rows are upserted with one multi-row statement per batch. The mapping
+    result id is the POI id, so re-running the computation updates the distance columns in place and
+    leaves the population and coverage columns untouched.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        country_code (str, optional): Only process POIs and infrastructure of this country.
+            Defaults to all countries.
+        dataset_id (str, optional): Only process POIs of this dataset. Defaults to all datasets.
+        batch_size (int, optional): Number of POIs per batch and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+        n_jobs (int, optional): Number of worker threads used by the KD-tree queries. Defaults to -1 (all CPUs).
+
+    Returns:
+        int: Number of POIs processed.
+    """
+    start_time = time.perf_counter()
+    indexes = build_indexes(load_infrastructure(engine, country_code))
+    columns = ["id", "poi_id", "lat", "lon"] + list(DISTANCE_LAYERS)
+    statement = incremental.upsert_statement("mapping_result", columns, ["id", "poi_id"])
+
+    condition, params = scope_filter(country_code, dataset_id)
+    pois_chunks = loader.iter_table_chunks(engine, "point_of_interest", ["poi_id", "lat", "lon"], "poi_id",
+                                           where=condition, params=params, batch_size=batch_size)
+    total_pois = 0
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for pois in pois_chunks:
+            distances = nearest_distances(indexes, pois["lat"].to_numpy(), pois["lon"].to_numpy(), n_jobs)
+            results = pd.concat([pois.reset_index(drop=True), distances.round(1)], axis=1)
+            results.insert(0, "id", results["poi_id"])
+
+            with rollup.track(cursor, results["poi_id"]):
+                cursor.executemany(statement, loader.to_rows(results[columns]))
+            connection.commit()
+
+            total_pois += len(results)
+            elapsed = time.perf_counter() - start_time
+            print(f"mapping_result: {total_pois} POIs processed ({total_pois / max(elapsed, 1e-9):,.0f} POIs/s)")
+        cursor.close()
+    finally:
+        connection.close()
+
+    versions.bump_versions(engine)
+    return total_pois
+
+
+def load_mapping_results(engine, filepath, batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Loads a *-pcd.csv file of precomputed mapping results into mapping_result.
+
+    Columns starting with a digit (e.g. 4G_coverage) are stored with a leading underscore, and the
+    mapping result id is the POI id, as in compute_mapping_results. Rows are upserted, so reloading
+    a file is safe.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        filepath (str): Path to the CSV file.
+        batch_size (int, optional): Number of POIs per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: Number of rows written.
+    """
+    start_time = time.perf_counter()
+    result_types = loader.get_table_columns(engine, "mapping_result")
+    stats = {"rows": 0}
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for chunk in loader.iter_csv_chunks(filepath, batch_size):
+            chunk = chunk.rename(columns=lambda column: f"_{column}" if column[0].isdigit() else column)
+            chunk.insert(0, "id", chunk["poi_id"])
+            results = loader.coerce_chunk(chunk, result_types)
+
+            with rollup.track(cursor, results["poi_id"]):
+                cursor.executemany(incremental.upsert_statement("mapping_result", list(results.columns), ["id", "poi_id"]),
+                                   loader.to_rows(results))
+            connection.commit()
+            stats["rows"] += len(results)
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    versions.bump_versions(engine)
+    print(f"mapping_result: {stats['rows']} rows in {time.perf_counter() - start_time:.1f}s")
+    return stats
@@ -0,0 +1,321 @@
+# Import packages
+import re
+import time
+from sqlalchemy import inspect, text
+import loader
+import delete
+import incremental
+import versions
+import rollup
+from datamodel import Base
+
+
+# Tables partitioned by country (LIST COLUMNS on country_code), with one partition per country
+PARTITIONED_TABLES = ["point_of_interest", "cell_site", "transmission_node"]
+
+# Column holding the country of a row
+PARTITION_COLUMN = "country_code"
+
+# MySQL data types of spatial columns, which partitioned tables cannot hold
+SPATIAL_DATA_TYPES = ("point", "linestring", "polygon", "multipoint", "multilinestring", "multipolygon",
+                      "geometry", "geomcollection", "geometrycollection")
+
+
+# Define functions to partition tables by country and manage the country partitions
+
+
+def partition_name(country_code):
+    """Returns the name of the partition holding a country.
+
+    Args:
+        country_code (str): Country code, e.g. ESP.
+
+    Returns:
+        str: Partition name, e.g. p_esp.
+    """
+    if not re.fullmatch(r"[A-Za-z0-9_]+", country_code):
+        raise ValueError(f"Invalid country code: {country_code}")
+    return f"p_{country_code.lower()}"
+
+
+def table_partitions(connection, table_name):
+    """Lists the partitions of a table.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Connection to the database.
+        table_name (str): Table name.
+
+    Returns:
+        list: Partition names, empty when the table is not partitioned.
+    """
+    rows = connection.execute(
+        text("SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+             "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name AND PARTITION_NAME IS NOT NULL "
+             "ORDER BY PARTITION_ORDINAL_POSITION"),
+        {"table_name": table_name}).scalars().all()
+    return list(rows)
+
+
+def partitioned_tables(engine):
+    """Lists the tables of the database that are partitioned.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+
+    Returns:
+        set: Names of the partitioned tables.
+    """
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text("SELECT DISTINCT TABLE_NAME FROM information_schema.PARTITIONS "
+                 "WHERE TABLE_SCHEMA = DATABASE() AND PARTITION_NAME IS NOT NULL")).scalars().all()
+    return set(rows)
+
+
+def spatial_columns(connection, table_name):
+    """Lists the spatial columns of a table.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Connection to the database.
+        table_name (str): Table name.
+
+    Returns:
+        list: Names of the columns with a spatial data type.
+    """
+    types = ", ".join(f"'{data_type}'" for data_type in SPATIAL_DATA_TYPES)
+    return list(connection.execute(
+        text("SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() "
+             f"AND TABLE_NAME = :table_name AND DATA_TYPE IN ({types}) ORDER BY ORDINAL_POSITION"),
+        {"table_name": table_name}).scalars().all())
+
+
+def check_partitionable(connection, tables):
+    """Refuses to partition tables with spatial columns.
+
+    MySQL supports neither spatial columns nor SPATIAL indexes in partitioned tables, so the tables
+    with a generated geom column (see datamodel.point_column) cannot be partitioned by country.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Connection to the database.
+        tables (list): Tables to partition.
+
+    Raises:
+        ValueError: A table has a spatial column.
+    """
+    spatial = {table_name: spatial_columns(connection, table_name) for table_name in tables}
+    spatial = {table_name: columns for table_name, columns in spatial.items() if columns}
+    if spatial:
+        raise ValueError("MySQL does not support spatial columns in partitioned tables, so these tables cannot be "
+                         "partitioned by country: " +
+                         ", ".join(f"{table_name} ({', '.join(columns)})" for table_name, columns in spatial.items()))
+
+
+def partition_by_country(engine, tables=PARTITIONED_TABLES, metadata=Base.metadata):
+    """Converts tables to LIST COLUMNS partitioning on country_code, one partition per country.
+
+    MySQL requires every unique key of a partitioned table to contain the partitioning column and
+    does not support foreign keys on partitioned InnoDB tables. The primary keys therefore become
+    (key, country_code), and the foreign keys from and to these tables are dropped. Referential
+    integrity is kept by the loaders and by delete.delete_data, which walks the model metadata
+    rather than the database constraints. Converting a table rebuilds it once; later country
+    loads and drops only touch one partition.
+
+    MySQL does not allow spatial columns or SPATIAL indexes in partitioned tables, so country
+    partitioning cannot be combined with the generated geom columns and the spatial queries they
+    serve (see spatial.py): tables with a spatial column are refused before anything is changed.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        tables (list, optional): Tables to partition. Defaults to PARTITIONED_TABLES.
+        metadata (sqlalchemy.MetaData, optional): Table definitions. Defaults to the datamodel models.
+
+    Returns:
+        list: Country codes with a partition.
+
+    Raises:
+        ValueError: A table has a spatial column (see check_partitionable).
+    """
+    inspector = inspect(engine)
+    with engine.connect() as connection:
+        check_partitionable(connection, [table_name for table_name in tables
+                                         if len(table_partitions(connection, table_name)) == 0])
+        countries = set()
+        for table_name in tables:
+            countries |= set(connection.execute(
+                text(f"SELECT DISTINCT {PARTITION_COLUMN} FROM {table_name}")).scalars().all())
+        countries = sorted(countries)
+
+        # Drop the foreign keys referencing or defined on the partitioned tables
+        for table_name in inspector.get_table_names():
+            for fk in inspector.get_foreign_keys(table_name):
+                if table_name in tables or fk["referred_table"] in tables:
+                    connection.execute(text(f"ALTER TABLE {table_name} DROP FOREIGN KEY `{fk['name']}`"))
+                    print(f"{table_name}: foreign key {fk['name']} dropped")
+
+        for table_name in tables:
+            if len(table_partitions(connection, table_name)) > 0:
+                print(f"{table_name} is already partitioned")
+                continue
+            start_time = time.perf_counter()
+            key_columns = [column.name for column in metadata.tables[table_name].primary_key.columns]
+            key_columns += [PARTITION_COLUMN] if PARTITION_COLUMN not in key_columns else []
+            connection.execute(text(
+                f"ALTER TABLE {table_name} DROP PRIMARY KEY, ADD PRIMARY KEY ({loader.quote_columns(key_columns)})"))
+            connection.execute(text(
+                f"ALTER TABLE {table_name} PARTITION BY LIST COLUMNS({PARTITION_COLUMN}) "
+                f"({_partition_definitions(countries)})"))
+            print(f"{table_name} partitioned by country in {time.perf_counter() - start_time:.1f}s")
+        connection.commit()
+    return countries
+
+
+def _partition_definitions(countries):
+    # PARTITION p_xxx VALUES IN ('XXX') clauses; a placeholder partition keeps an empty list valid
+    if len(countries) == 0:
+        return "PARTITION p_none VALUES IN ('')"
+    return ", ".join(f"PARTITION {partition_name(country)} VALUES IN ('{country}')" for country in countries)
+
+
+def ensure_country_partitions(engine, countries, tables=PARTITIONED_TABLES):
+    """Adds a partition for every country that does not have one yet.
+
+    Rows of a country without a partition are rejected by MySQL, so loaders call this before
+    loading a new country. Tables that are not partitioned, which includes every table with a
+    spatial column (see partition_by_country), are skipped.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        countries (list): Country codes.
+        tables (list, optional): Partitioned tables. Defaults to PARTITIONED_TABLES.
+
+    Returns:
+        list: (table name, country code) pairs of the partitions added.
+    """
+    added = []
+    with engine.connect() as connection:
+        for table_name in tables:
+            partitions = table_partitions(connection, table_name)
+            if len(partitions) == 0:
+                continue
+            for country in sorted(set(countries)):
+                if partition_name(country) not in partitions:
+                    connection.execute(text(f"ALTER TABLE {table_name} ADD PARTITION "
+                                            f"(PARTITION {partition_name(country)} VALUES IN ('{country}'))"))
+                    added.append((table_name, country))
+                    print(f"{table_name}: partition {partition_name(country)} added")
+        connection.commit()
+    return added
+
+
+def drop_country_partition(engine, country_code, tables=PARTITIONED_TABLES, delete_dependents=True,
+                           batch_size=delete.DEFAULT_DELETE_BATCH_SIZE):
+    """Removes all rows of a country by dropping its partition of every partitioned table.
+
+    Dropping a partition discards its rows at once instead of deleting them one by one. Rows of
+    other tables that reference the country's rows are deleted first in chunks (see
+    delete.delete_dependents), as are the ingest fingerprints of the dropped rows.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        country_code (str): Country code.
+        tables (list, optional): Partitioned tables. Defaults to PARTITIONED_TABLES.
+        delete_dependents (bool, optional): Delete the rows referencing the country's rows first.
+            Defaults to True.
+        batch_size (int, optional): Number of dependent rows per chunk and commit.
+            Defaults to delete.DEFAULT_DELETE_BATCH_SIZE.
+
+    Returns:
+        list: Tables whose partition was dropped.
+    """
+    with engine.connect() as connection:
+        dataset_ids, analysis_ids = versions.country_scopes(connection, [country_code])
+    dropped = []
+    for table_name in reversed(tables):
+        with engine.connect() as connection:
+            if partition_name(country_code) not in table_partitions(connection, table_name):
+                continue
+        if delete_dependents:
+            delete.delete_dependents(engine, table_name, PARTITION_COLUMN, country_code, batch_size)
+        with engine.connect() as connection:
+            _forget_fingerprints(connection, table_name, f"{table_name} PARTITION ({partition_name(country_code)})")
+            connection.execute(text(f"ALTER TABLE {table_name} DROP PARTITION {partition_name(country_code)}"))
+            connection.commit()
+        dropped.append(table_name)
+        print(f"{table_name}: partition {partition_name(country_code)} dropped")
+    # Dropped partitions bypass the tracked delete path
+    if any(table_name in rollup.ROLLUP_TABLES for table_name in dropped):
+        rollup.rebuild_rollups(engine, country_code)
+    versions.bump_versions(engine, dataset_ids=dataset_ids, analysis_ids=analysis_ids, country_codes=[country_code])
+    return dropped
+
+
+def _forget_fingerprints(connection, table_name, source):
+    # Deletes the ingest fingerprints of the rows of a table or partition
+    key = [column.name for column in Base.metadata.tables[table_name].primary_key.columns][0]
+    connection.execute(
+        text(f"DELETE f FROM {incremental.FINGERPRINT_TABLE} f JOIN {source} s "
+             f"ON f.table_name = :table_name AND f.row_key = s.`{key}`"),
+        {"table_name": table_name})
+
+
+def replace_country(engine, table_name, country_code, filepath, batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Atomically replaces the rows of a country with the contents of a CSV file.
+
+    The file is loaded into an unpartitioned staging copy of the table, which is then swapped with
+    the country's partition by ALTER TABLE ... EXCHANGE PARTITION. Readers see either the old or the
+    new rows, never a partially loaded country. MySQL validates that every staged row belongs to
+    the country. The old rows end up in the staging table, which is dropped after their ingest
+    fingerprints are removed. Tables with a spatial column cannot be partitioned (see
+    partition_by_country), and are refused.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Partitioned table.
+        country_code (str): Country code of every row of the file.
+        filepath (str): Path to the CSV file.
+        batch_size (int, optional): Number of rows per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: Load statistics of the staging table.
+
+    Raises:
+        ValueError: The table is not partitioned or has a spatial column.
+    """
+    start_time = time.perf_counter()
+    with engine.connect() as connection:
+        check_partitionable(connection, [table_name])
+        if len(table_partitions(connection, table_name)) == 0:
+            raise ValueError(f"{table_name} is not partitioned by country (see partition_by_country)")
+    ensure_country_partitions(engine, [country_code], [table_name])
+    staging = f"{table_name}_{partition_name(country_code)}_staging"
+
+    with engine.connect() as connection:
+        dataset_ids, analysis_ids = versions.country_scopes(connection, [country_code], [table_name])
+        connection.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+        connection.execute(text(f"CREATE TABLE {staging} LIKE {table_name}"))
+        connection.execute(text(f"ALTER TABLE {staging} REMOVE PARTITIONING"))
+        connection.commit()
+
+    try:
+        stats = loader.load_csv(engine, staging, filepath, batch_size=batch_size)
+        with engine.connect() as connection:
+            connection.execute(text(
+                f"ALTER TABLE {table_name} EXCHANGE PARTITION {partition_name(country_code)} WITH TABLE {staging}"))
+            _forget_fingerprints(connection, table_name, staging)
+            connection.commit()
+    finally:
+        with engine.connect() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+            connection.commit()
+
+    with engine.connect() as connection:
+        dataset_ids |= set(connection.execute(
+            text(f"SELECT DISTINCT dataset_id FROM {table_name} PARTITION ({partition_name(country_code)})")
+        ).scalars().all())
+    # The exchanged rows bypass the tracked write paths
+    if table_name in rollup.ROLLUP_TABLES:
+        rollup.rebuild_rollups(engine, country_code)
+    versions.bump_versions(engine, dataset_ids=dataset_ids, analysis_ids=analysis_ids, country_codes=[country_code])
+    print(f"{table_name}: partition {partition_name(country_code)} replaced "
+          f"in {time.perf_counter() - start_time:.1f}s")
+    return stats
@@ -0,0 +1,247 @@
+# Import packages
+import os
+import glob
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from sqlalchemy.pool import NullPool
+import loader
+import incremental
+import database
+import partition
+import instrumentation
+import nearest
+import visibility
+import cost_results
+import fiberpath
+from datamodel import Base
+
+
+def _load_fiber_path_graph(engine, filepath, batch_size=loader.DEFAULT_BATCH_SIZE):
+    # The edges file sits next to the nodes file, e.g. ESP-...-nodes.csv.csv and ESP-...-edges.csv.csv
+    return fiberpath.load_fiber_path_graph(engine, filepath, filepath.replace("-nodes.csv", "-edges.csv"),
+                                           batch_size=batch_size)
+
+
+# Datasets found under data/<country>/, by data type:
+# - pattern: files of the data type, relative to the country directory
+# - tables: tables written by the load (the first one names the dataset)
+# - parents: tables the rows refer to without a foreign key, loaded first like foreign key parents
+# - loader: function(engine, filepath, batch_size=...) loading a file; None for processed datasets,
+#   which are loaded by loader.load_csv or incremental.upsert_csv depending on the ingest mode
+# - serial: files must not be loaded concurrently (e.g. surrogate ids assigned client-side)
+DATASETS = {
+    "pointofinterest": {"pattern": "processed/pointofinterest/*.csv", "tables": ["point_of_interest"]},
+    "cellsite": {"pattern": "processed/cellsite/*.csv", "tables": ["cell_site"]},
+    "transmissionnode": {"pattern": "processed/transmissionnode/*.csv", "tables": ["transmission_node"]},
+    "mapping": {"pattern": "output/pcd/*-pcd.csv", "tables": ["mapping_result"], "loader": nearest.load_mapping_results},
+    "visibility": {"pattern": "output/visibility/*-visibility.csv", "tables": ["visibility_result", "visibility_link"],
+                   "parents": ["cell_site"], "loader": visibility.load_visibility},
+    "cost": {"pattern": "output/cost/*-cost-results-poi-info.csv",
+             "tables": ["cost_result_poi", "cost_result_poi_distance"], "loader": cost_results.load_cost_results_poi},
+    "fiberpath": {"pattern": "output/fiberpath/*-results.csv*", "tables": ["fiber_path_result_poi", "fiber_path_result_path"],
+                  "parents": ["transmission_node"], "loader": fiberpath.load_fiber_path_results},
+    "fibergraph": {"pattern": "output/fiberpath/*-nodes.csv*", "tables": ["fiber_path_result_node", "fiber_path_result_edge"],
+                   "loader": _load_fiber_path_graph, "serial": True},
+}
+
+
+# Define functions to discover and load datasets in dependency order
+
+
+def discover_datasets(data_dir, countries=None, datasets=DATASETS):
+    """Finds every dataset file laid out as data/<country>/processed/<type>/*.csv or data/<country>/output/...
+
+    Args:
+        data_dir (str): Path to the data directory.
+        countries (list, optional): Country codes to include. Defaults to all countries found.
+        datasets (dict, optional): Data types to look for (see DATASETS). Defaults to DATASETS.
+
+    Returns:
+        list: One dict per file with the country code, data type, tables written (the first one as
+            "table") and file path.
+    """
+    found = []
+    for country_dir in sorted(glob.glob(os.path.join(data_dir, "*"))):
+        country_code = os.path.basename(country_dir)
+        if not os.path.isdir(country_dir) or (countries is not None and country_code not in countries):
+            continue
+        for data_type, definition in datasets.items():
+            for filepath in sorted(glob.glob(os.path.join(country_dir, definition["pattern"]))):
+                found.append({
+                    "country_code": country_code,
+                    "data_type": data_type,
+                    "table": definition["tables"][0],
+                    "tables": list(definition["tables"]),
+                    "filepath": filepath,
+                })
+    return found
+
+
+def table_dependencies(metadata=Base.metadata):
+    """Builds the foreign key dependency graph of the database tables.
+
+    Args:
+        metadata (sqlalchemy.MetaData, optional): Table definitions. Defaults to the datamodel models,
+            so no reflection of the live database is needed.
+
+    Returns:
+        dict: Mapping of table name to the set of all tables it depends on, directly or transitively.
+    """
+    parents = {
+        name: {fk.column.table.name for fk in table.foreign_keys if fk.column.table.name != name}
+        for name, table in metadata.tables.items()
+    }
+
+    # Transitive closure, so that a table waits for every table it depends on
+    ancestors = {}
+
+    def collect(name, visiting=()):
+        if name not in ancestors:
+            found = set()
+            for parent in parents.get(name, ()):
+                if parent not in visiting:
+                    found |= {parent} | collect(parent, visiting + (name,))
+            ancestors[name] = found
+        return ancestors[name]
+
+    for name in parents:
+        collect(name)
+    return ancestors
+
+
+def dataset_parents(dataset, dependencies, datasets=DATASETS):
+    """Returns the tables that must be loaded before a dataset.
+
+    Args:
+        dataset (dict): Dataset found by discover_datasets.
+        dependencies (dict): Output of table_dependencies.
+        datasets (dict, optional): Data types (see DATASETS). Defaults to DATASETS.
+
+    Returns:
+        set: Foreign key ancestors of the tables written, and the declared parents of the data type,
+            except the tables written by the dataset itself.
+    """
+    parents = set(datasets[dataset["data_type"]].get("parents", ()))
+    for table_name in dataset["tables"]:
+        parents |= dependencies.get(table_name, set())
+    return parents - set(dataset["tables"])
+
+
+def _run_load(db_url, dataset, mode, batch_size, delete_missing, instrument=False):
+    # Runs in a worker process with its own single connection to the database
+    engine = database.create_db_engine(db_url, poolclass=NullPool)
+    if instrument:
+        instrumentation.reset()
+        instrumentation.enable()
+    try:
+        load = DATASETS[dataset["data_type"]].get("loader")
+        if load is not None:
+            result = dict(load(engine, dataset["filepath"], batch_size=batch_size), table=dataset["table"])
+        elif mode == "incremental":
+            result = incremental.upsert_csv(engine, dataset["table"], dataset["filepath"],
+                                            delete_missing=delete_missing, batch_size=batch_size)
+        else:
+            result = loader.load_csv(engine, dataset["table"], dataset["filepath"], batch_size=batch_size)
+        # Metrics of the worker are returned to the parent process (see instrumentation.merge)
+        if instrument:
+            result = dict(result, metrics=instrumentation.snapshot())
+        return result
+    finally:
+        engine.dispose()
+
+
+def run_pipeline(db_url, data_dir, countries=None, max_connections=None, mode="full",
+                 batch_size=loader.DEFAULT_BATCH_SIZE, delete_missing=False):
+    """Loads every discovered dataset concurrently, respecting table dependencies within each country.
+
+    Each file is loaded in its own worker process. A file is only started once every file of its
+    country writing a table it depends on (see dataset_parents) has finished loading, so the
+    processed POIs and infrastructure of a country load before its mapping, visibility, cost and
+    fiber path results, while independent tables and countries load in parallel. The number of
+    worker processes bounds the number of open database connections.
+
+    Args:
+        db_url (str): SQLAlchemy database URL.
+        data_dir (str): Path to the data directory.
+        countries (list, optional): Country codes to load. Defaults to all countries found.
+        max_connections (int, optional): Maximum number of concurrent loads and database connections.
+            Defaults to the number of CPUs.
+        mode (str, optional): "full" (loader.load_csv) or "incremental" (incremental.upsert_csv) for the
+            processed datasets; result files are always upserted by their loaders. Defaults to "full".
+        batch_size (int, optional): Number of rows per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+        delete_missing (bool, optional): In incremental mode, delete rows absent from the files.
+            Defaults to False.
+
+    Returns:
+        list: Load statistics of every dataset, with an "error" entry for failed or skipped loads.
+    """
+    datasets = discover_datasets(data_dir, countries)
+    dependencies = table_dependencies()
+    parents = {dataset["filepath"]: dataset_parents(dataset, dependencies) for dataset in datasets}
+
+    # Country-partitioned tables need a partition before the rows of a new country arrive
+    engine = database.create_db_engine(db_url, poolclass=NullPool)
+    try:
+        partition.ensure_country_partitions(engine, [dataset["country_code"] for dataset in datasets])
+    finally:
+        engine.dispose()
+
+    # Number of files still to load per country and table
+    remaining = {}
+    for dataset in datasets:
+        for table_name in dataset["tables"]:
+            key = (dataset["country_code"], table_name)
+            remaining[key] = remaining.get(key, 0) + 1
+
+    pending = list(datasets)
+    running = {}
+    failed_tables = set()
+    results = []
+
+    def finish(dataset, result):
+        results.append(result)
+        for table_name in dataset["tables"]:
+            remaining[(dataset["country_code"], table_name)] -= 1
+
+    with ProcessPoolExecutor(max_workers=max_connections or os.cpu_count()) as executor:
+        while pending or running:
+            # Start every dataset whose parent tables are fully loaded in its country
+            progressed = False
+            for dataset in list(pending):
+                country_code = dataset["country_code"]
+                keys = {(country_code, parent) for parent in parents[dataset["filepath"]]}
+                if keys & failed_tables:
+                    pending.remove(dataset)
+                    failed_tables.update((country_code, table_name) for table_name in dataset["tables"])
+                    print(f"Skipping {dataset['filepath']}: a table it depends on failed to load.")
+                    finish(dataset, {"table": dataset["table"], "filepath": dataset["filepath"], "error": "skipped"})
+                    progressed = True
+                elif all(remaining.get(key, 0) == 0 for key in keys):
+                    if DATASETS[dataset["data_type"]].get("serial") and any(
+                            other["data_type"] == dataset["data_type"] for other in running.values()):
+                        continue
+                    pending.remove(dataset)
+                    future = executor.submit(_run_load, db_url, dataset, mode, batch_size, delete_missing,
+                                             instrumentation.is_enabled())
+                    running[future] = dataset
+                    progressed = True
+
+            if not running:
+                if pending and not progressed:
+                    raise RuntimeError("Circular dependencies between " +
+                                       ", ".join(sorted({dataset["table"] for dataset in pending})))
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                dataset = running.pop(future)
+                try:
+                    result = dict(future.result(), filepath=dataset["filepath"])
+                    if "metrics" in result:
+                        instrumentation.merge(result.pop("metrics"))
+                except Exception as e:
+                    print(f"Error loading {dataset['filepath']}:", e)
+                    failed_tables.update((dataset["country_code"], table_name) for table_name in dataset["tables"])
+                    result = {"table": dataset["table"], "filepath": dataset["filepath"], "error": str(e)}
+                finish(dataset, result)
+
+    return results
@@ -0,0 +1,181 @@
+# Import packages
+import math
+import time
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import Window
+from scipy.spatial import cKDTree
+import loader
+import incremental
+import nearest
+import versions
+
+
+# Radii (km) of the population_*km and poi_count_*km columns of mapping_result
+RADII_KM = (1, 3, 5)
+
+# Side length (pixels) of the raster tiles read at a time
+DEFAULT_TILE_SIZE = 1024
+
+
+# Define functions to aggregate population and POI counts around POIs
+
+
+def _disk_sums(prefix, rows, cols, pixel_height_m, pixel_width_m, radius_m):
+    # Sums a disk of pixels around each point from row-wise prefix sums.
+    # Each disk is a stack of horizontal spans, so the cost is O(points x disk rows).
+    totals = np.zeros(len(rows))
+    max_dy = int(radius_m // pixel_height_m)
+    n_rows, n_cols = prefix.shape[0], prefix.shape[1] - 1
+    for dy in range(-max_dy, max_dy + 1):
+        half_width_m = math.sqrt(max(radius_m ** 2 - (dy * pixel_height_m) ** 2, 0.0))
+        dx = np.floor(half_width_m / pixel_width_m).astype(np.int64)
+        span_rows = rows + dy
+        valid = (span_rows >= 0) & (span_rows < n_rows)
+        start = np.clip(cols - dx, 0, n_cols)
+        stop = np.clip(cols + dx + 1, 0, n_cols)
+        span_rows = np.clip(span_rows, 0, n_rows - 1)
+        totals += np.where(valid, prefix[span_rows, stop] - prefix[span_rows, start], 0.0)
+    return totals
+
+
+def population_within(raster_path, lat, lon, radii_km=RADII_KM, tile_size=DEFAULT_TILE_SIZE):
+    """Sums the raster population within each radius of every point.
+
+    The raster is never loaded whole: points are grouped by raster tile, and for each tile only the
+    window covering the tile plus the largest radius is read. Row-wise prefix sums of that window
+    turn every disk into a few span lookups, so the cost grows with the number of points rather than
+    with points times pixels. Pixel widths are corrected for the latitude of each point.
+
+    Args:
+        raster_path (str): Path to a population GeoTIFF in a geographic (degree) CRS.
+        lat (numpy.ndarray): Latitudes of the points.
+        lon (numpy.ndarray): Longitudes of the points.
+        radii_km (tuple, optional): Radii in kilometres. Defaults to RADII_KM.
+        tile_size (int, optional): Tile side length in pixels. Defaults to DEFAULT_TILE_SIZE.
+
+    Returns:
+        dict: Mapping of radius (km) to an array of population sums.
+    """
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    sums = {radius: np.zeros(len(lat)) for radius in radii_km}
+
+    with rasterio.open(raster_path) as dataset:
+        transform = dataset.transform
+        pixel_height_m = abs(transform.e) * nearest.EARTH_RADIUS_M * math.pi / 180.0
+        pixel_width_deg_m = abs(transform.a) * nearest.EARTH_RADIUS_M * math.pi / 180.0
+
+        # Pixel of every point and the margin needed by the largest radius
+        rows = np.floor((lat - transform.f) / transform.e).astype(np.int64)
+        cols = np.floor((lon - transform.c) / transform.a).astype(np.int64)
+        max_radius_m = max(radii_km) * 1000.0
+        min_cos = max(math.cos(math.radians(min(float(np.abs(lat).max(initial=0.0)), 89.0))), 1e-6)
+        margin_rows = int(math.ceil(max_radius_m / pixel_height_m)) + 1
+        margin_cols = int(math.ceil(max_radius_m / (pixel_width_deg_m * min_cos))) + 1
+
+        tiles = pd.DataFrame({"tile_row": rows // tile_size, "tile_col": cols // tile_size})
+        for (tile_row, tile_col), members in tiles.groupby(["tile_row", "tile_col"]).groups.items():
+            members = np.asarray(members)
+
+            # Read the tile window plus margins, clipped to the raster
+            row_start = max(tile_row * tile_size - margin_rows, 0)
+            row_stop = min((tile_row + 1) * tile_size + margin_rows, dataset.height)
+            col_start = max(tile_col * tile_size - margin_cols, 0)
+            col_stop = min((tile_col + 1) * tile_size + margin_cols, dataset.width)
+            if row_start >= row_stop or col_start >= col_stop:
+                continue
+            window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+            values = dataset.read(1, window=window, masked=True).filled(0).astype(np.float64)
+            values[~np.isfinite(values)] = 0.0
+
+            prefix = np.zeros((values.shape[0], values.shape[1] + 1))
+            np.cumsum(values, axis=1, out=prefix[:, 1:])
+
+            local_rows = rows[members] - row_start
+            local_cols = cols[members] - col_start
+            pixel_width_m = pixel_width_deg_m * np.maximum(np.cos(np.radians(lat[members])), 1e-6)
+            for radius in radii_km:
+                sums[radius][members] = _disk_sums(prefix, local_rows, local_cols, pixel_height_m,
+                                                   pixel_width_m, radius * 1000.0)
+
+    return sums
+
+
+def poi_counts_within(lat, lon, radii_km=RADII_KM, other_lat=None, other_lon=None, n_jobs=-1):
+    """Counts the POIs within each radius of every point, including the point itself.
+
+    Args:
+        lat (numpy.ndarray): Latitudes of the points.
+        lon (numpy.ndarray): Longitudes of the points.
+        radii_km (tuple, optional): Radii in kilometres. Defaults to RADII_KM.
+        other_lat (numpy.ndarray, optional): Latitudes of the POIs to count. Defaults to the points.
+        other_lon (numpy.ndarray, optional): Longitudes of the POIs to count. Defaults to the points.
+        n_jobs (int, optional): Number of worker threads. Defaults to -1 (all CPUs).
+
+    Returns:
+        dict: Mapping of radius (km) to an array of counts.
+    """
+    if other_lat is None:
+        other_lat, other_lon = lat, lon
+    tree = cKDTree(nearest.to_unit_vectors(other_lat, other_lon))
+    points = nearest.to_unit_vectors(lat, lon)
+    counts = {}
+    for radius in radii_km:
+        # Great-circle radius converted to the equivalent chord length on the unit sphere
+        chord = 2.0 * math.sin(radius * 1000.0 / nearest.EARTH_RADIUS_M / 2.0)
+        counts[radius] = tree.query_ball_point(points, chord, return_length=True, workers=n_jobs)
+    return counts
+
+
+def compute_population(engine, raster_path, country_code=None, dataset_id=None, radii_km=RADII_KM,
+                       batch_size=loader.DEFAULT_BATCH_SIZE, tile_size=DEFAULT_TILE_SIZE):
+    """Computes population_*km and poi_count_*km of POIs and writes them to mapping_result.
+
+    POI coordinates are read once in key-ordered chunks, the population of every radius is
+    aggregated in one vectorized pass over the raster tiles, and the results are upserted in
+    batches. Distance and coverage columns of existing mapping_result rows are left untouched.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        raster_path (str): Path to the population GeoTIFF.
+        country_code (str, optional): Only process POIs of this country. Defaults to all countries.
+        dataset_id (str, optional): Only process POIs of this dataset. Defaults to all datasets.
+        radii_km (tuple, optional): Radii in kilometres. Defaults to RADII_KM.
+        batch_size (int, optional): Number of rows per read and write batch. Defaults to loader.DEFAULT_BATCH_SIZE.
+        tile_size (int, optional): Raster tile side length in pixels. Defaults to DEFAULT_TILE_SIZE.
+
+    Returns:
+        int: Number of POIs processed.
+    """
+    start_time = time.perf_counter()
+    condition, params = nearest.scope_filter(country_code, dataset_id)
+    chunks = list(loader.iter_table_chunks(engine, "point_of_interest", ["poi_id", "lat", "lon"], "poi_id",
+                                           where=condition, params=params, batch_size=batch_size))
+    if len(chunks) == 0:
+        return 0
+    pois = pd.concat(chunks, ignore_index=True)
+
+    lat, lon = pois["lat"].to_numpy(), pois["lon"].to_numpy()
+    population = population_within(raster_path, lat, lon, radii_km, tile_size)
+    counts = poi_counts_within(lat, lon, radii_km)
+
+    results = pd.DataFrame({"id": pois["poi_id"], "poi_id": pois["poi_id"], "lat": lat, "lon": lon})
+    for radius in radii_km:
+        results[f"population_{radius}km"] = np.rint(population[radius]).astype(np.int64)
+        results[f"poi_count_{radius}km"] = counts[radius]
+    statement = incremental.upsert_statement("mapping_result", list(results.columns), ["id", "poi_id"])
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for start in range(0, len(results), batch_size):
+            cursor.executemany(statement, loader.to_rows(results.iloc[start:start + batch_size]))
+            connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+    versions.bump_versions(engine)
+    print(f"mapping_result: population of {len(results)} POIs computed in {time.perf_counter() - start_time:.1f}s")
+    return len(results)
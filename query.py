@@ -0,0 +1,247 @@
+# Import packages
+import time
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import Boolean, DateTime, Float, Integer
+from geoalchemy2 import Geometry
+import loader
+import instrumentation
+from datamodel import Base, POINT_SRID, SridPoint
+from spatial import bbox_wkt
+
+
+# Number of rows fetched from the server per chunk
+DEFAULT_QUERY_BATCH_SIZE = loader.DEFAULT_BATCH_SIZE
+
+
+# Define functions to stream query results in bounded chunks
+
+
+def is_geometry_column(column):
+    """Returns whether a model column holds a geometry (see datamodel.SridPoint and geoalchemy2.Geometry).
+
+    Args:
+        column (sqlalchemy.Column): Model column.
+
+    Returns:
+        bool: True for geometry columns.
+    """
+    return isinstance(column.type, (Geometry, SridPoint))
+
+
+def _model_table(table_name):
+    if table_name not in Base.metadata.tables:
+        raise ValueError(f"Unknown table '{table_name}'")
+    return Base.metadata.tables[table_name]
+
+
+def select_columns(table_name, columns=None, alias=None):
+    """Resolves a column projection against the data model.
+
+    Geometry columns are returned as lon/lat WKT text.
+
+    Args:
+        table_name (str): Table name.
+        columns (list, optional): Columns to return. Defaults to every column except the geometries.
+        alias (str, optional): Alias of the table in the query, used to qualify the columns.
+
+    Returns:
+        list: (column name, SQL select expression) tuples.
+    """
+    table = _model_table(table_name)
+    if columns is None:
+        columns = [column.name for column in table.columns if not is_geometry_column(column)]
+    prefix = f"{alias}." if alias else ""
+    expressions = []
+    for name in columns:
+        if name not in table.columns:
+            raise ValueError(f"Table '{table_name}' has no column '{name}'")
+        if is_geometry_column(table.columns[name]):
+            expressions.append((name, f"ST_AsText({prefix}`{name}`, 'axis-order=long-lat') AS `{name}`"))
+        else:
+            expressions.append((name, f"{prefix}`{name}`"))
+    return expressions
+
+
+def build_query(table_name, columns=None, country_code=None, dataset_id=None, analysis_id=None, bbox=None,
+                limit=None):
+    """Builds a projected and filtered SELECT on a table.
+
+    Args:
+        table_name (str): Table name.
+        columns (list, optional): Columns to return. Defaults to every column except the geometries.
+        country_code (str, optional): Only rows of this country.
+        dataset_id (str, optional): Only rows of this dataset.
+        analysis_id (str, optional): Only rows of this analysis.
+        bbox (tuple, optional): (min_lon, min_lat, max_lon, max_lat). Only rows inside the box, using
+            the SPATIAL INDEX on geom where the table has one.
+        limit (int, optional): Maximum number of rows. Defaults to no limit.
+
+    Returns:
+        tuple: SQL query with pyformat parameters, the parameters, and the column names.
+    """
+    table = _model_table(table_name)
+    expressions = select_columns(table_name, columns)
+    conditions, params = [], {}
+
+    for column, value in [("country_code", country_code), ("dataset_id", dataset_id), ("analysis_id", analysis_id)]:
+        if value is None:
+            continue
+        if column not in table.columns:
+            raise ValueError(f"Table '{table_name}' cannot be filtered by {column}")
+        conditions.append(f"`{column}` = %({column})s")
+        params[column] = str(value)
+
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = (float(value) for value in bbox)
+        if "geom" in table.columns:
+            conditions.append(f"MBRContains(ST_GeomFromText(%(bbox)s, {POINT_SRID}, 'axis-order=long-lat'), geom)")
+            params["bbox"] = bbox_wkt(min_lon, min_lat, max_lon, max_lat)
+        elif "lat" in table.columns and "lon" in table.columns:
+            conditions.append("lat BETWEEN %(min_lat)s AND %(max_lat)s AND lon BETWEEN %(min_lon)s AND %(max_lon)s")
+            params.update({"min_lon": min_lon, "min_lat": min_lat, "max_lon": max_lon, "max_lat": max_lat})
+        else:
+            raise ValueError(f"Table '{table_name}' cannot be filtered by bbox")
+
+    sql_query = f"SELECT {', '.join(expression for _, expression in expressions)} FROM `{table_name}`"
+    if conditions:
+        sql_query += " WHERE " + " AND ".join(conditions)
+    if limit is not None:
+        sql_query += f" LIMIT {int(limit)}"
+    return sql_query, params, [name for name, _ in expressions]
+
+
+def stream_rows(engine, sql_query, params=None, batch_size=DEFAULT_QUERY_BATCH_SIZE):
+    """Runs a query on an unbuffered cursor and yields its rows in bounded batches.
+
+    Rows are read from the server as they are fetched instead of being buffered client-side, so
+    memory use depends on batch_size only. The connection is busy until the result is exhausted;
+    when iteration stops early, the connection is discarded rather than returned to the pool with
+    unread rows.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        sql_query (str): SQL query with pyformat parameters.
+        params (dict, optional): Query parameters. Defaults to None.
+        batch_size (int, optional): Maximum number of rows per batch. Defaults to DEFAULT_QUERY_BATCH_SIZE.
+
+    Yields:
+        list: The next batch of row tuples.
+    """
+    connection = engine.raw_connection()
+    finished = False
+    try:
+        cursor = connection.cursor(buffered=False)
+        start_time = time.perf_counter()
+        cursor.execute(sql_query, params or {})
+        instrumentation.record_statement(sql_query, time.perf_counter() - start_time, params=params)
+        for rows in instrumentation.timed_iter(iter(lambda: cursor.fetchmany(batch_size), []), "query.fetch"):
+            yield rows
+        cursor.close()
+        finished = True
+    finally:
+        if not finished:
+            connection.invalidate()
+        connection.close()
+
+
+def iter_query(engine, table_name, columns=None, country_code=None, dataset_id=None, analysis_id=None, bbox=None,
+               limit=None, batch_size=DEFAULT_QUERY_BATCH_SIZE):
+    """Streams a projected and filtered table as pandas DataFrame chunks.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Table name.
+        columns (list, optional): Columns to return. Defaults to every column except the geometries.
+        country_code (str, optional): Only rows of this country.
+        dataset_id (str, optional): Only rows of this dataset.
+        analysis_id (str, optional): Only rows of this analysis.
+        bbox (tuple, optional): (min_lon, min_lat, max_lon, max_lat) bounding box.
+        limit (int, optional): Maximum number of rows. Defaults to no limit.
+        batch_size (int, optional): Maximum number of rows per chunk. Defaults to DEFAULT_QUERY_BATCH_SIZE.
+
+    Yields:
+        pandas.DataFrame: The next chunk of rows.
+    """
+    sql_query, params, names = build_query(table_name, columns, country_code, dataset_id, analysis_id, bbox, limit)
+    table = _model_table(table_name)
+    booleans = [name for name in names if isinstance(table.columns[name].type, Boolean)]
+    for rows in stream_rows(engine, sql_query, params, batch_size):
+        chunk = pd.DataFrame.from_records(rows, columns=names)
+        for name in booleans:
+            chunk[name] = chunk[name].astype("boolean")
+        yield chunk
+
+
+def arrow_schema(table_name, columns=None):
+    """Returns the Arrow schema of a projection, derived from the column types of the data model.
+
+    Args:
+        table_name (str): Table name.
+        columns (list, optional): Columns to return. Defaults to every column except the geometries.
+
+    Returns:
+        pyarrow.Schema: One field per column; geometries are WKT strings.
+    """
+    table = _model_table(table_name)
+    fields = []
+    for name, _ in select_columns(table_name, columns):
+        column_type = table.columns[name].type
+        if isinstance(column_type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column_type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column_type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column_type, DateTime):
+            arrow_type = pa.timestamp("us")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type, nullable=table.columns[name].nullable))
+    return pa.schema(fields)
+
+
+def to_record_batch(rows, schema):
+    """Converts row tuples to an Arrow record batch of a fixed schema.
+
+    Args:
+        rows (list): Row tuples in schema order.
+        schema (pyarrow.Schema): Target schema (see arrow_schema).
+
+    Returns:
+        pyarrow.RecordBatch: Record batch with exactly the schema's types.
+    """
+    arrays = []
+    for i, field in enumerate(schema):
+        values = [row[i] for row in rows]
+        if pa.types.is_boolean(field.type):
+            values = [None if value is None else bool(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_arrow(engine, table_name, columns=None, country_code=None, dataset_id=None, analysis_id=None, bbox=None,
+               limit=None, batch_size=DEFAULT_QUERY_BATCH_SIZE):
+    """Streams a projected and filtered table as Arrow record batches with a fixed schema.
+
+    Every batch has the schema of arrow_schema, also when a batch only holds missing values in a
+    column, so the batches can be written to one Parquet file or Arrow stream.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): Table name.
+        columns (list, optional): Columns to return. Defaults to every column except the geometries.
+        country_code (str, optional): Only rows of this country.
+        dataset_id (str, optional): Only rows of this dataset.
+        analysis_id (str, optional): Only rows of this analysis.
+        bbox (tuple, optional): (min_lon, min_lat, max_lon, max_lat) bounding box.
+        limit (int, optional): Maximum number of rows. Defaults to no limit.
+        batch_size (int, optional): Maximum number of rows per batch. Defaults to DEFAULT_QUERY_BATCH_SIZE.
+
+    Yields:
+        pyarrow.RecordBatch: The next batch of rows.
+    """
+    sql_query, params, _ = build_query(table_name, columns, country_code, dataset_id, analysis_id, bbox, limit)
+    schema = arrow_schema(table_name, columns)
+    for rows in stream_rows(engine, sql_query, params, batch_size):
+        yield to_record_batch(rows, schema)
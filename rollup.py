@@ -0,0 +1,322 @@
+# Import packages
+from contextlib import contextmanager
+import pandas as pd
+from sqlalchemy import text
+
+
+# Tables whose rows feed the rollups, all keyed to a POI by their poi_id column
+ROLLUP_TABLES = ("point_of_interest", "mapping_result", "cost_result_poi", "cost_result_poi_distance")
+
+# Key and summed columns of each rollup table
+ROLLUP_KEYS = {
+    "admin_rollup": ["country_code", "admin1", "admin2", "analysis_id"],
+    "admin_technology_rollup": ["country_code", "admin1", "admin2", "analysis_id", "max_dist_km", "technology"],
+}
+ROLLUP_VALUES = {
+    "admin_rollup": ["number_poi", "number_connected", "number_unconnected", "number_4G_coverage",
+                     "number_cell_site_dist", "sum_cell_site_dist"],
+    "admin_technology_rollup": ["number_poi", "fiber_length"],
+}
+
+# Region of a POI, with missing admin names stored as empty strings
+REGION_COLUMNS = "p.country_code, COALESCE(p.admin1, ''), COALESCE(p.admin2, '')"
+
+# Aggregates of a set of POIs (condition on the alias p of point_of_interest) as (analysis column, SELECT)
+# pairs. POIs count once without an analysis (analysis_id '') with their mapping results, and once per
+# analysis they have cost results in.
+ROLLUP_SELECTS = {
+    "admin_rollup": [
+        (None,
+         f"SELECT {REGION_COLUMNS}, '', COUNT(*), COUNT(CASE WHEN p.is_connected = 1 THEN 1 END), "
+         "COUNT(CASE WHEN p.is_connected = 0 THEN 1 END), COUNT(CASE WHEN m._4G_coverage = 1 THEN 1 END), "
+         "COUNT(m.cell_site_dist), COALESCE(SUM(m.cell_site_dist), 0) "
+         "FROM point_of_interest p LEFT JOIN mapping_result m ON m.poi_id = p.poi_id "
+         "WHERE {condition} GROUP BY 1, 2, 3"),
+        ("c.analysis_id",
+         f"SELECT {REGION_COLUMNS}, c.analysis_id, COUNT(*), COUNT(CASE WHEN c.is_connected = 1 THEN 1 END), "
+         "COUNT(CASE WHEN c.is_connected = 0 THEN 1 END), COUNT(CASE WHEN c._4G_coverage = 1 THEN 1 END), "
+         "COUNT(c.cell_site_dist), COALESCE(SUM(c.cell_site_dist), 0) "
+         "FROM cost_result_poi c JOIN point_of_interest p ON p.poi_id = c.poi_id "
+         "WHERE {condition} AND c.analysis_id IS NOT NULL GROUP BY 1, 2, 3, 4"),
+    ],
+    "admin_technology_rollup": [
+        ("d.analysis_id",
+         f"SELECT {REGION_COLUMNS}, d.analysis_id, d.max_dist_km, COALESCE(d.technology, ''), COUNT(*), "
+         "COALESCE(SUM(d.fiber_length), 0) "
+         "FROM cost_result_poi_distance d JOIN point_of_interest p ON p.poi_id = d.poi_id "
+         "WHERE {condition} GROUP BY 1, 2, 3, 4, 5, 6"),
+    ],
+}
+
+# Number of POI ids per IN list when capturing the aggregates of a batch
+CAPTURE_BATCH_SIZE = 5000
+
+# Region levels of the read API and their key columns
+REGION_LEVELS = {
+    "country": ["country_code"],
+    "admin1": ["country_code", "admin1"],
+    "admin2": ["country_code", "admin1", "admin2"],
+}
+
+
+# Define functions to maintain the rollups with delta merges
+
+
+def capture(cursor, poi_ids):
+    """Aggregates the current rows of a set of POIs per region, analysis and technology.
+
+    Args:
+        cursor: Cursor of a raw DBAPI connection, in the transaction of the write being tracked.
+        poi_ids (iterable): POI identifiers.
+
+    Returns:
+        dict: One DataFrame per rollup table, with its key and value columns.
+    """
+    poi_ids = list(dict.fromkeys(str(poi_id) for poi_id in poi_ids))
+    rows = {table_name: [] for table_name in ROLLUP_SELECTS}
+    for start in range(0, len(poi_ids), CAPTURE_BATCH_SIZE):
+        keys = poi_ids[start:start + CAPTURE_BATCH_SIZE]
+        condition = f"p.poi_id IN ({', '.join(['%s'] * len(keys))})"
+        for table_name, selects in ROLLUP_SELECTS.items():
+            for _, select in selects:
+                cursor.execute(select.format(condition=condition), keys)
+                rows[table_name] += cursor.fetchall()
+    return {table_name: pd.DataFrame(rows[table_name], columns=ROLLUP_KEYS[table_name] + ROLLUP_VALUES[table_name])
+            for table_name in ROLLUP_SELECTS}
+
+
+def deltas(before, after):
+    """Computes the changes of the rollups between two captures of the same POIs.
+
+    Args:
+        before (dict): Capture taken before a write (see capture), or None when the POIs are new.
+        after (dict): Capture taken after the write, or None when the POIs were deleted.
+
+    Returns:
+        dict: One DataFrame of non-zero changes per rollup table.
+    """
+    changes = {}
+    for table_name in ROLLUP_SELECTS:
+        keys, values = ROLLUP_KEYS[table_name], ROLLUP_VALUES[table_name]
+        frames = []
+        if before is not None:
+            frames.append(before[table_name].assign(**{value: -before[table_name][value] for value in values}))
+        if after is not None:
+            frames.append(after[table_name])
+        frames = [frame for frame in frames if len(frame) > 0]
+        if not frames:
+            changes[table_name] = pd.DataFrame(columns=keys + values)
+            continue
+        change = pd.concat(frames).groupby(keys, as_index=False)[values].sum()
+        changes[table_name] = change[(change[values] != 0).any(axis=1)]
+    return changes
+
+
+def merge_deltas(cursor, changes):
+    """Adds rollup changes to the rollup tables, deleting the rows left without POIs.
+
+    Each change is added with INSERT ... ON DUPLICATE KEY UPDATE column = column + change, so
+    concurrent writers touching the same region do not overwrite each other's totals.
+
+    Args:
+        cursor: Cursor of a raw DBAPI connection, in the transaction of the write being tracked.
+        changes (dict): Changes per rollup table (see deltas).
+
+    Returns:
+        int: Number of rollup rows changed.
+    """
+    total_rows = 0
+    for table_name, change in changes.items():
+        if len(change) == 0:
+            continue
+        keys, values = ROLLUP_KEYS[table_name], ROLLUP_VALUES[table_name]
+        columns = keys + values
+        placeholders = ", ".join(["%s"] * len(columns))
+        updates = ", ".join(f"`{value}` = `{value}` + VALUES(`{value}`)" for value in values)
+        cursor.executemany(
+            f"INSERT INTO {table_name} ({', '.join(f'`{column}`' for column in columns)}) VALUES ({placeholders}) "
+            f"ON DUPLICATE KEY UPDATE {updates}",
+            change[columns].astype(object).values.tolist())
+
+        countries = sorted(change["country_code"].unique())
+        cursor.execute(f"DELETE FROM {table_name} WHERE number_poi <= 0 "
+                       f"AND country_code IN ({', '.join(['%s'] * len(countries))})", countries)
+        total_rows += len(change)
+    return total_rows
+
+
+def poi_ids_of(cursor, table_name, key_column, keys):
+    """Returns the POIs of rows of a rollup source table, given their primary keys.
+
+    Args:
+        cursor: Cursor of a raw DBAPI connection.
+        table_name (str): One of ROLLUP_TABLES.
+        key_column (str): Primary key column of the table.
+        keys (list): Primary keys of the rows.
+
+    Returns:
+        list: POI identifiers.
+    """
+    if key_column == "poi_id" or len(keys) == 0:
+        return list(keys)
+    cursor.execute(f"SELECT DISTINCT poi_id FROM `{table_name}` WHERE `{key_column}` IN "
+                   f"({', '.join(['%s'] * len(keys))})", list(keys))
+    return [row[0] for row in cursor.fetchall()]
+
+
+@contextmanager
+def track(cursor, poi_ids, before=True, after=True):
+    """Keeps the rollups in step with a write to the rows of a set of POIs.
+
+    The aggregates of the POIs are captured before and after the write, and their difference is
+    merged into the rollup tables on the same cursor. The caller commits the write and the rollup
+    changes together. The cost grows with the number of POIs written, not with the table size.
+
+    Args:
+        cursor: Cursor of a raw DBAPI connection.
+        poi_ids (iterable): POIs whose point_of_interest, mapping or cost result rows are written.
+        before (bool, optional): Capture the rows before the write; False when the POIs are new.
+            Defaults to True.
+        after (bool, optional): Capture the rows after the write; False when the POIs are deleted.
+            Defaults to True.
+
+    Yields:
+        None
+    """
+    poi_ids = list(poi_ids)
+    captured = capture(cursor, poi_ids) if before else None
+    yield
+    merge_deltas(cursor, deltas(captured, capture(cursor, poi_ids) if after else None))
+
+
+def rebuild_rollups(engine, country_code=None, analysis_id=None):
+    """Recomputes the rollups from the source tables.
+
+    Used to fill the rollups of existing data, after bulk operations that bypass the tracked write
+    paths (e.g. dropping or exchanging a country partition), and to repair them after an
+    interrupted write. The rows of the scope are replaced in one transaction.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        country_code (str, optional): Only rebuild this country. Defaults to all countries.
+        analysis_id (str, optional): Only rebuild the rows of this analysis. Defaults to the POI-level
+            rows and every analysis.
+
+    Returns:
+        dict: Number of rollup rows written per table.
+    """
+    conditions, params = [], {}
+    if country_code is not None:
+        conditions.append("country_code = :country_code")
+        params["country_code"] = country_code
+    if analysis_id is not None:
+        conditions.append("analysis_id = :analysis_id")
+        params["analysis_id"] = analysis_id
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    stats = {}
+    with engine.begin() as connection:
+        for table_name, selects in ROLLUP_SELECTS.items():
+            connection.execute(text(f"DELETE FROM {table_name}{where}"), params)
+            columns = ", ".join(f"`{column}`" for column in ROLLUP_KEYS[table_name] + ROLLUP_VALUES[table_name])
+            stats[table_name] = 0
+            for analysis_column, select in selects:
+                conditions = ["p.country_code = :country_code"] if country_code is not None else ["1 = 1"]
+                if analysis_id is not None:
+                    # POI-level rows belong to no analysis
+                    if analysis_column is None:
+                        continue
+                    conditions.append(f"{analysis_column} = :analysis_id")
+                select = select.format(condition=" AND ".join(conditions))
+                stats[table_name] += connection.execute(
+                    text(f"INSERT INTO {table_name} ({columns}) {select}"), params).rowcount
+    print(f"Rollups rebuilt: {stats}")
+    return stats
+
+
+def delete_analysis_rollups(connection, analysis_id):
+    """Deletes the rollup rows of an analysis.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Connection to the database.
+        analysis_id (str): Analysis identifier.
+
+    Returns:
+        None
+    """
+    for table_name in ROLLUP_SELECTS:
+        connection.execute(text(f"DELETE FROM {table_name} WHERE analysis_id = :analysis_id"),
+                           {"analysis_id": analysis_id})
+    connection.commit()
+
+
+# Define functions to read the rollups
+
+
+def read_rollup(engine, country_code=None, analysis_id=None, level="admin2"):
+    """Reads POI totals per region, e.g. connected and unconnected POIs per admin1.
+
+    The totals are summed from the rollup rows, so the query reads one row per region and
+    analysis instead of the POIs.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        country_code (str, optional): Only read this country. Defaults to all countries.
+        analysis_id (str, optional): Read the totals of the cost results of this analysis.
+            Defaults to the totals of the POIs and their mapping results.
+        level (str, optional): "country", "admin1" or "admin2" (see REGION_LEVELS). Defaults to "admin2".
+
+    Returns:
+        pandas.DataFrame: One row per region with the summed values, connected_share and
+            mean_cell_site_dist.
+    """
+    if level not in REGION_LEVELS:
+        raise ValueError(f"Unknown level '{level}', expected one of {list(REGION_LEVELS)}")
+    regions = REGION_LEVELS[level]
+    params = {"analysis_id": analysis_id or ""}
+    sql_query = (f"SELECT {', '.join(regions)}, "
+                 + ", ".join(f"SUM(`{value}`) AS `{value}`" for value in ROLLUP_VALUES["admin_rollup"])
+                 + " FROM admin_rollup WHERE analysis_id = :analysis_id")
+    if country_code is not None:
+        sql_query += " AND country_code = :country_code"
+        params["country_code"] = country_code
+    sql_query += f" GROUP BY {', '.join(regions)} ORDER BY {', '.join(regions)}"
+
+    with engine.connect() as connection:
+        totals = pd.read_sql(text(sql_query), connection, params=params)
+    known = totals["number_connected"] + totals["number_unconnected"]
+    totals["connected_share"] = totals["number_connected"] / known.where(known > 0)
+    totals["mean_cell_site_dist"] = (totals["sum_cell_site_dist"]
+                                     / totals["number_cell_site_dist"].where(totals["number_cell_site_dist"] > 0))
+    return totals
+
+
+def read_technology_rollup(engine, analysis_id, max_dist_km=None, country_code=None, level="admin2"):
+    """Reads the POIs and fiber length per region and technology of an analysis.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_id (str): Analysis identifier.
+        max_dist_km (int, optional): Only read this maximum connection distance. Defaults to every distance.
+        country_code (str, optional): Only read this country. Defaults to all countries.
+        level (str, optional): "country", "admin1" or "admin2" (see REGION_LEVELS). Defaults to "admin2".
+
+    Returns:
+        pandas.DataFrame: Region columns, max_dist_km, technology, number_poi and fiber_length.
+    """
+    if level not in REGION_LEVELS:
+        raise ValueError(f"Unknown level '{level}', expected one of {list(REGION_LEVELS)}")
+    groups = REGION_LEVELS[level] + ["max_dist_km", "technology"]
+    params = {"analysis_id": analysis_id}
+    sql_query = (f"SELECT {', '.join(groups)}, SUM(number_poi) AS number_poi, SUM(fiber_length) AS fiber_length "
+                 "FROM admin_technology_rollup WHERE analysis_id = :analysis_id")
+    if max_dist_km is not None:
+        sql_query += " AND max_dist_km = :max_dist_km"
+        params["max_dist_km"] = max_dist_km
+    if country_code is not None:
+        sql_query += " AND country_code = :country_code"
+        params["country_code"] = country_code
+    sql_query += f" GROUP BY {', '.join(groups)} ORDER BY {', '.join(groups)}"
+
+    with engine.connect() as connection:
+        return pd.read_sql(text(sql_query), connection, params=params)
@@ -0,0 +1,269 @@
+# Import packages
+import os
+import json
+import time
+from datetime import datetime, timezone
+import pyarrow.parquet as pq
+import loader
+import query
+import partition
+import versions
+import fiberpath
+from datamodel import Base, POINT_SRID
+
+
+# Tables of an analysis snapshot in load order, and how their rows are tied to the analysis:
+# "cost_parameter" (the analysis' cost parameters), "analysis" (analysis_id column),
+# "country" (country of the analysis), "poi" (results of the POIs of that country) or
+# "coverage" (coverage contours linked to the analysis)
+SNAPSHOT_TABLES = {
+    "cost_parameter": "cost_parameter",
+    "analysis": "analysis",
+    "point_of_interest": "country",
+    "cell_site": "country",
+    "transmission_node": "country",
+    "cell_coverage": "coverage",
+    "analysis_poi_association": "analysis",
+    "analysis_cellsite_association": "analysis",
+    "analysis_transmissionnode_association": "analysis",
+    "analysis_coverage_association": "analysis",
+    "mapping_result": "poi",
+    "visibility_result": "poi",
+    "visibility_link": "poi",
+    "fiber_path_result_poi": "analysis",
+    "fiber_path_result_path": "analysis",
+    "fiber_path_result_node": "analysis",
+    "fiber_path_result_edge": "analysis",
+    "cost_result_poi": "analysis",
+    "cost_result_poi_distance": "analysis",
+    "cost_result": "analysis",
+}
+
+# Surrogate ids local to each database: imported rows receive new ids instead of overwriting
+# the rows that hold the same ids in the target database
+SURROGATE_IDS = {
+    "cell_coverage": "contour_id",
+    "fiber_path_result_node": "node_id",
+    "fiber_path_result_edge": "edge_id",
+}
+
+# Columns holding surrogate ids of another table, remapped to the ids given on import
+SURROGATE_REFERENCES = {
+    "analysis_coverage_association": {"contour_id": "cell_coverage"},
+    "fiber_path_result_edge": {"u": "fiber_path_result_node", "v": "fiber_path_result_node"},
+}
+
+# Parquet settings: rows per row group (the unit of predicate pushdown) and compression codec
+ROW_GROUP_SIZE = 100000
+COMPRESSION = "zstd"
+
+# File listing the contents of a snapshot
+MANIFEST_FILE = "manifest.json"
+
+
+# Define functions to export and import analysis snapshots as Parquet files
+
+
+def _snapshot_columns(table):
+    # Every stored column; generated columns are recomputed by MySQL on import
+    return [column.name for column in table.columns if column.computed is None]
+
+
+def _snapshot_query(table_name, scope):
+    # SELECT of the rows of a table tied to an analysis, ordered by primary key so that the
+    # row group statistics of the key columns are tight
+    table = Base.metadata.tables[table_name]
+    expressions = query.select_columns(table_name, _snapshot_columns(table), alias="t")
+    order = ", ".join(f"t.`{column.name}`" for column in (list(table.primary_key.columns) or list(table.columns)))
+    sql_query = f"SELECT {', '.join(expression for _, expression in expressions)} FROM `{table_name}` t"
+    if scope == "cost_parameter":
+        sql_query += (" WHERE t.cost_id = (SELECT cost_parameter_id FROM analysis "
+                      "WHERE analysis_id = %(analysis_id)s)")
+    elif scope == "analysis":
+        sql_query += " WHERE t.analysis_id = %(analysis_id)s"
+    elif scope == "country":
+        sql_query += " WHERE t.country_code = %(country_code)s"
+    elif scope == "poi":
+        sql_query += " JOIN point_of_interest p ON p.poi_id = t.poi_id WHERE p.country_code = %(country_code)s"
+    elif scope == "coverage":
+        sql_query += (" WHERE t.contour_id IN (SELECT contour_id FROM analysis_coverage_association "
+                      "WHERE analysis_id = %(analysis_id)s)")
+    return f"{sql_query} ORDER BY {order}"
+
+
+def export_analysis(engine, analysis_id, output_dir, country_code=None, batch_size=query.DEFAULT_QUERY_BATCH_SIZE,
+                    row_group_size=ROW_GROUP_SIZE, compression=COMPRESSION):
+    """Exports every table tied to an analysis as typed, compressed Parquet files.
+
+    Rows are streamed from the database (see query.stream_rows) and written batch by batch, so
+    memory use does not depend on the size of the analysis. Column types come from the data model,
+    geometries are stored as lon/lat WKT, and every row group carries min/max statistics. Readers can
+    therefore load only the columns and row groups they need (see read_snapshot_table).
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        analysis_id (str): Analysis identifier.
+        output_dir (str): Directory receiving one <table>.parquet file per table and a manifest.
+        country_code (str, optional): Country of the POIs, cell sites and transmission nodes to include.
+            Defaults to the prefix of the analysis identifier.
+        batch_size (int, optional): Number of rows fetched per batch. Defaults to query.DEFAULT_QUERY_BATCH_SIZE.
+        row_group_size (int, optional): Maximum number of rows per row group. Defaults to ROW_GROUP_SIZE.
+        compression (str, optional): Parquet compression codec. Defaults to COMPRESSION.
+
+    Returns:
+        dict: Snapshot manifest with the number of rows of every table.
+    """
+    if country_code is None:
+        country_code = analysis_id.split("-")[0]
+    os.makedirs(output_dir, exist_ok=True)
+    start_time = time.perf_counter()
+    params = {"analysis_id": analysis_id, "country_code": country_code}
+    manifest = {"analysis_id": analysis_id, "country_code": country_code,
+                "created_at": datetime.now(timezone.utc).isoformat(), "tables": {}}
+
+    for table_name, scope in SNAPSHOT_TABLES.items():
+        table_start = time.perf_counter()
+        schema = query.arrow_schema(table_name, _snapshot_columns(Base.metadata.tables[table_name]))
+        filepath = os.path.join(output_dir, f"{table_name}.parquet")
+        rows = 0
+        with pq.ParquetWriter(filepath, schema, compression=compression, write_statistics=True) as writer:
+            for batch in query.stream_rows(engine, _snapshot_query(table_name, scope), params, batch_size):
+                writer.write_batch(query.to_record_batch(batch, schema), row_group_size=row_group_size)
+                rows += len(batch)
+        manifest["tables"][table_name] = rows
+        print(f"{table_name}: {rows} rows exported in {time.perf_counter() - table_start:.1f}s")
+
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2)
+    print(f"Analysis {analysis_id} exported to {output_dir} in {time.perf_counter() - start_time:.1f}s")
+    return manifest
+
+
+def _import_statement(table, columns):
+    # Upsert with geometry columns parsed from lon/lat WKT
+    geometry = f"ST_GeomFromText(%s, {POINT_SRID}, 'axis-order=long-lat')"
+    values = ", ".join(geometry if query.is_geometry_column(table.columns[column]) else "%s" for column in columns)
+    key_columns = [column.name for column in table.primary_key.columns] or columns
+    updates = ", ".join(f"`{column}` = VALUES(`{column}`)" for column in columns if column not in key_columns)
+    statement = f"INSERT INTO `{table.name}` ({loader.quote_columns(columns)}) VALUES ({values})"
+    if updates:
+        return f"{statement} ON DUPLICATE KEY UPDATE {updates}"
+    # Association tables have no key to update, so existing rows are kept
+    return statement.replace("INSERT INTO", "INSERT IGNORE INTO", 1)
+
+
+def _delete_surrogate_rows(cursor, analysis_id, batch_size=loader.DEFAULT_BATCH_SIZE):
+    # Rows with surrogate ids cannot be upserted, so the graph and coverage contours of the analysis
+    # are replaced; contours still linked to other analyses are kept
+    cursor.execute("DELETE FROM fiber_path_result_edge WHERE analysis_id = %s", [analysis_id])
+    cursor.execute("DELETE FROM fiber_path_result_node WHERE analysis_id = %s", [analysis_id])
+    cursor.execute("SELECT contour_id FROM analysis_coverage_association WHERE analysis_id = %s", [analysis_id])
+    contour_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("DELETE FROM analysis_coverage_association WHERE analysis_id = %s", [analysis_id])
+    for start in range(0, len(contour_ids), batch_size):
+        batch = contour_ids[start:start + batch_size]
+        cursor.execute(f"DELETE FROM cell_coverage WHERE contour_id IN ({', '.join(['%s'] * len(batch))}) "
+                       "AND NOT EXISTS (SELECT 1 FROM analysis_coverage_association a "
+                       "WHERE a.contour_id = cell_coverage.contour_id)", batch)
+
+
+def _remap_surrogate_ids(cursor, table_name, columns, rows, id_maps):
+    # Gives the rows of a table new surrogate ids after the current maximum and rewrites their
+    # references to the surrogate ids already remapped, recording the new ids in id_maps
+    rows = [list(row) for row in rows]
+    id_column = SURROGATE_IDS.get(table_name)
+    if id_column in columns:
+        index = columns.index(id_column)
+        next_id = fiberpath._next_id(cursor, table_name, id_column)
+        id_map = id_maps.setdefault(table_name, {})
+        for offset, row in enumerate(rows):
+            id_map[row[index]] = row[index] = next_id + offset
+    for column, referenced in SURROGATE_REFERENCES.get(table_name, {}).items():
+        if column in columns:
+            index = columns.index(column)
+            id_map = id_maps.get(referenced, {})
+            for row in rows:
+                row[index] = id_map.get(row[index])
+    return rows
+
+
+def import_analysis(engine, snapshot_dir, batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Bulk-loads an analysis snapshot written by export_analysis.
+
+    Tables are loaded in foreign key order. Record batches are read from the Parquet files and
+    upserted with multi-row statements, one commit per batch, so importing a snapshot twice is safe.
+    The surrogate ids of SURROGATE_IDS are local to the exporting database: the analysis' fiber path
+    graph and coverage contours are deleted first, and the imported rows receive new ids, with the
+    u/v node ids of the edges and the contour ids of the coverage links remapped to them.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        snapshot_dir (str): Directory of the snapshot.
+        batch_size (int, optional): Number of rows per statement and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: Number of rows imported per table.
+    """
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE)) as file:
+        manifest = json.load(file)
+    start_time = time.perf_counter()
+    stats = {}
+
+    # Country-partitioned tables need the partition of the snapshot's country
+    partition.ensure_country_partitions(engine, [manifest["country_code"]])
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        _delete_surrogate_rows(cursor, manifest["analysis_id"])
+        id_maps = {}
+        for table_name in SNAPSHOT_TABLES:
+            filepath = os.path.join(snapshot_dir, f"{table_name}.parquet")
+            if table_name not in manifest["tables"] or not os.path.exists(filepath):
+                continue
+            table_start = time.perf_counter()
+            parquet_file = pq.ParquetFile(filepath)
+            columns = parquet_file.schema_arrow.names
+            statement = _import_statement(Base.metadata.tables[table_name], columns)
+            stats[table_name] = 0
+            for batch in parquet_file.iter_batches(batch_size=batch_size):
+                rows = list(zip(*(batch.column(column).to_pylist() for column in columns)))
+                if table_name in SURROGATE_IDS or table_name in SURROGATE_REFERENCES:
+                    rows = _remap_surrogate_ids(cursor, table_name, columns, rows, id_maps)
+                cursor.executemany(statement, rows)
+                connection.commit()
+                stats[table_name] += len(rows)
+            print(f"{table_name}: {stats[table_name]} rows imported in {time.perf_counter() - table_start:.1f}s")
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    dataset_ids = set()
+    for table_name in ["point_of_interest", "cell_site", "transmission_node"]:
+        filepath = os.path.join(snapshot_dir, f"{table_name}.parquet")
+        if os.path.exists(filepath):
+            dataset_ids.update(pq.read_table(filepath, columns=["dataset_id"]).column(0).unique().to_pylist())
+    versions.bump_versions(engine, dataset_ids=dataset_ids, analysis_ids=[manifest["analysis_id"]],
+                           country_codes=[manifest["country_code"]])
+    print(f"Analysis {manifest['analysis_id']} imported in {time.perf_counter() - start_time:.1f}s")
+    return stats
+
+
+def read_snapshot_table(snapshot_dir, table_name, columns=None, filters=None):
+    """Reads one table of a snapshot, loading only the requested columns and matching row groups.
+
+    Args:
+        snapshot_dir (str): Directory of the snapshot.
+        table_name (str): Table name.
+        columns (list, optional): Columns to read. Defaults to all columns.
+        filters (list, optional): pyarrow predicates, e.g. [("max_dist_km", "=", 10)], used to skip
+            row groups by their statistics. Defaults to no filter.
+
+    Returns:
+        pandas.DataFrame: Matching rows.
+    """
+    return pq.read_table(os.path.join(snapshot_dir, f"{table_name}.parquet"), columns=columns,
+                         filters=filters).to_pandas()
@@ -0,0 +1,152 @@
+# Import packages
+import math
+import pandas as pd
+from sqlalchemy import inspect, text
+from datamodel import POINT_SRID
+
+
+# Tables with a generated geom column and a SPATIAL INDEX (see datamodel.point_column)
+SPATIAL_TABLES = ("point_of_interest", "cell_site", "transmission_node")
+
+# Metres per degree of latitude, used to turn a radius into a bounding box
+METRES_PER_DEGREE = 111320.0
+
+
+# Define functions for index-backed spatial queries
+
+
+def _check_table(table_name):
+    if table_name not in SPATIAL_TABLES:
+        raise ValueError(f"Table '{table_name}' has no spatial index, expected one of {SPATIAL_TABLES}")
+
+
+def _select_columns(engine, table_name, columns):
+    # Default to every column except the binary geometry
+    if columns is None:
+        columns = [column["name"] for column in inspect(engine).get_columns(table_name) if column["name"] != "geom"]
+    return ", ".join(f"t.`{column}`" for column in columns)
+
+
+def bbox_wkt(min_lon, min_lat, max_lon, max_lat):
+    """Returns the WKT polygon of a bounding box in lon/lat order.
+
+    Args:
+        min_lon (float): Western longitude.
+        min_lat (float): Southern latitude.
+        max_lon (float): Eastern longitude.
+        max_lat (float): Northern latitude.
+
+    Returns:
+        str: WKT POLYGON string.
+    """
+    return (f"POLYGON(({min_lon} {min_lat}, {max_lon} {min_lat}, {max_lon} {max_lat}, "
+            f"{min_lon} {max_lat}, {min_lon} {min_lat}))")
+
+
+def radius_bbox(lon, lat, radius_m):
+    """Returns a bounding box that encloses a circle around a point.
+
+    Args:
+        lon (float): Longitude of the centre.
+        lat (float): Latitude of the centre.
+        radius_m (float): Radius in metres.
+
+    Returns:
+        tuple: (min_lon, min_lat, max_lon, max_lat), clamped to valid coordinates.
+    """
+    dlat = radius_m / METRES_PER_DEGREE
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180.0 if cos_lat < 1e-6 else min(radius_m / (METRES_PER_DEGREE * cos_lat), 180.0)
+    return (max(lon - dlon, -180.0), max(lat - dlat, -90.0), min(lon + dlon, 180.0), min(lat + dlat, 90.0))
+
+
+def query_bbox(engine, table_name, min_lon, min_lat, max_lon, max_lat, columns=None, limit=None):
+    """Returns the rows of a table located inside a bounding box, using its SPATIAL INDEX.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): One of SPATIAL_TABLES.
+        min_lon (float): Western longitude.
+        min_lat (float): Southern latitude.
+        max_lon (float): Eastern longitude.
+        max_lat (float): Northern latitude.
+        columns (list, optional): Columns to return. Defaults to all columns except geom.
+        limit (int, optional): Maximum number of rows. Defaults to no limit.
+
+    Returns:
+        pandas.DataFrame: Rows inside the bounding box.
+    """
+    _check_table(table_name)
+    sql_query = (
+        f"SELECT {_select_columns(engine, table_name, columns)} FROM `{table_name}` t "
+        f"WHERE MBRContains(ST_GeomFromText(:bbox, {POINT_SRID}, 'axis-order=long-lat'), t.geom)"
+    )
+    if limit is not None:
+        sql_query += f" LIMIT {int(limit)}"
+
+    with engine.connect() as connection:
+        return pd.read_sql(text(sql_query), connection,
+                           params={"bbox": bbox_wkt(min_lon, min_lat, max_lon, max_lat)})
+
+
+def query_radius(engine, table_name, lon, lat, radius_m, columns=None, limit=None):
+    """Returns the rows of a table within a distance of a point, nearest first.
+
+    Candidates are selected from the SPATIAL INDEX with the bounding box of the circle,
+    then filtered and ordered by their great-circle distance.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): One of SPATIAL_TABLES.
+        lon (float): Longitude of the centre.
+        lat (float): Latitude of the centre.
+        radius_m (float): Radius in metres.
+        columns (list, optional): Columns to return. Defaults to all columns except geom.
+        limit (int, optional): Maximum number of rows. Defaults to no limit.
+
+    Returns:
+        pandas.DataFrame: Rows within the radius with an extra distance_m column.
+    """
+    _check_table(table_name)
+    centre = f"ST_SRID(POINT(:lon, :lat), {POINT_SRID})"
+    sql_query = (
+        f"SELECT {_select_columns(engine, table_name, columns)}, "
+        f"ST_Distance_Sphere(t.geom, {centre}) AS distance_m FROM `{table_name}` t "
+        f"WHERE MBRContains(ST_GeomFromText(:bbox, {POINT_SRID}, 'axis-order=long-lat'), t.geom) "
+        f"AND ST_Distance_Sphere(t.geom, {centre}) <= :radius_m "
+        "ORDER BY distance_m"
+    )
+    if limit is not None:
+        sql_query += f" LIMIT {int(limit)}"
+
+    params = {"lon": lon, "lat": lat, "radius_m": radius_m, "bbox": bbox_wkt(*radius_bbox(lon, lat, radius_m))}
+    with engine.connect() as connection:
+        return pd.read_sql(text(sql_query), connection, params=params)
+
+
+def query_nearest(engine, table_name, lon, lat, k=1, columns=None, initial_radius_m=1000.0,
+                  max_radius_m=2000000.0):
+    """Returns the k rows of a table nearest to a point.
+
+    MySQL has no index-backed nearest-neighbour operator, so radius queries are repeated with a
+    doubling radius until k rows are found. Each step only reads the index entries of its bounding box.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        table_name (str): One of SPATIAL_TABLES.
+        lon (float): Longitude of the query point.
+        lat (float): Latitude of the query point.
+        k (int, optional): Number of neighbours. Defaults to 1.
+        columns (list, optional): Columns to return. Defaults to all columns except geom.
+        initial_radius_m (float, optional): First search radius in metres. Defaults to 1000.
+        max_radius_m (float, optional): Largest search radius in metres. Defaults to 2000000.
+
+    Returns:
+        pandas.DataFrame: Up to k rows, nearest first, with a distance_m column.
+    """
+    radius_m = initial_radius_m
+    while True:
+        nearest = query_radius(engine, table_name, lon, lat, radius_m, columns=columns, limit=k)
+        if len(nearest) >= k or radius_m >= max_radius_m:
+            return nearest
+        radius_m = min(radius_m * 2, max_radius_m)
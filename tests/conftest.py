@@ -0,0 +1,6 @@
+# Import packages
+import os
+import sys
+
+# The modules live at the repository root, next to the numbered scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
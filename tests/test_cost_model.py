@@ -0,0 +1,65 @@
+# Import packages
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import cost_model
+import cost_results
+
+
+# Sample analysis whose cost results were produced from the test cost inputs
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "ESP")
+COST_INPUTS = os.path.join(DATA_DIR, "costinputs", "esp_costs_test.xlsx")
+POI_RESULTS = os.path.join(DATA_DIR, "output", "cost", "ESP-1714391188-zq9z-cost-results-poi-info.csv")
+COST_RESULTS = os.path.join(DATA_DIR, "output", "cost", "ESP-1714391188-zq9z-cost-results.csv")
+
+# Estimate of the cost results and the cost input column it was computed from
+ESTIMATES = {"central": "Value", "lower bound": "Lower bound", "upper bound": "Upper bound"}
+
+
+def _scenarios():
+    # One cost_parameter row per estimate; the bounds vary the costs only, the planning and
+    # reinvestment periods keep their central values
+    pytest.importorskip("openpyxl")
+    inputs = pd.concat(pd.read_excel(COST_INPUTS, sheet_name=None).values()).set_index("Variable name")
+    scenarios = pd.DataFrame([inputs[column] for column in ESTIMATES.values()]).reset_index(drop=True)
+    periods = [name for name in scenarios.columns if name.startswith(("pp_", "reinv_period_"))]
+    scenarios[periods] = inputs.loc[periods, "Value"].to_numpy()
+    return scenarios
+
+
+def test_compute_costs_rebuilds_sample_cost_results():
+    totals = (cost_results.melt_distances(pd.read_csv(POI_RESULTS))
+              .groupby(["max_dist_km", "technology"])
+              .agg(number_poi=("poi_id", "size"), fiber_length=("fiber_length", "sum"))
+              .reset_index()
+              .assign(analysis_id="ESP-1714391188-zq9z"))
+    inputs = cost_model.poi_inputs(totals)
+    results = cost_model.compute_costs(inputs["counts"], inputs["fiber_length"],
+                                       cost_model.parameter_matrix(_scenarios()))
+    computed = cost_model.results_frame(inputs, list(ESTIMATES), results)
+
+    expected = pd.read_csv(COST_RESULTS)
+    merged = expected.merge(computed, on=["estimate", "max_dist_km", "technology"], suffixes=("", "_computed"))
+    assert len(merged) == len(expected) == len(computed)
+    assert (merged["basket_name"] == merged["basket_name_computed"]).all()
+    assert (merged["number_poi"] == merged["number_poi_computed"]).all()
+    fiber = merged["technology"] == "fiber"
+    np.testing.assert_allclose(merged.loc[fiber, "fiber_length_computed"], merged.loc[fiber, "fiber_length"],
+                               rtol=1e-9)
+    for metric in cost_model.COST_METRICS:
+        np.testing.assert_allclose(merged[f"{metric}_computed"], merged[metric], rtol=1e-9, err_msg=metric)
+
+
+def test_poi_inputs_pivots_technologies():
+    totals = pd.DataFrame({
+        "analysis_id": ["A", "A", "A"],
+        "max_dist_km": [1, 1, 2],
+        "technology": ["Fiber", "Satellite", "Unknown"],
+        "number_poi": [3, 2, 5],
+        "fiber_length": [4.5, 0.0, 0.0],
+    })
+    inputs = cost_model.poi_inputs(totals)
+    assert inputs["keys"].to_dict("records") == [{"analysis_id": "A", "max_dist_km": 1}]
+    np.testing.assert_array_equal(inputs["counts"], [[3, 0, 0, 2]])
+    np.testing.assert_array_equal(inputs["fiber_length"], [4.5])
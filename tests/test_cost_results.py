@@ -0,0 +1,26 @@
+# Import packages
+import pandas as pd
+from cost_results import melt_distances
+
+
+def test_melt_distances_drops_empty_distances():
+    chunk = pd.DataFrame({
+        "poi_id": ["p1", "p2"],
+        "fiber_length_1km": [1.5, None],
+        "mst_solution_1km": [1.0, None],
+        "technology_1km": ["Fiber", None],
+        "fiber_length_2km": [2.0, None],
+        "mst_solution_2km": [None, 0.0],
+        "technology_2km": ["Fiber", "Satellite"],
+    })
+    long = melt_distances(chunk)
+    assert long[["poi_id", "max_dist_km"]].values.tolist() == [["p1", 1], ["p1", 2], ["p2", 2]]
+    assert long["technology"].tolist() == ["Fiber", "Fiber", "Satellite"]
+    assert long["mst_solution"].tolist() == [1, pd.NA, 0]
+    assert str(long["mst_solution"].dtype) == "Int64"
+
+
+def test_melt_distances_without_distance_columns():
+    long = melt_distances(pd.DataFrame({"poi_id": ["p1"]}))
+    assert len(long) == 0
+    assert list(long.columns) == ["poi_id", "max_dist_km", "fiber_length", "mst_solution", "technology"]
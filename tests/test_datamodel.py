@@ -0,0 +1,21 @@
+# Import packages
+from sqlalchemy.dialects import mysql
+from sqlalchemy.schema import CreateTable
+from datamodel import Base, SridPoint, POINT_SRID
+
+
+def test_generated_point_columns_compile_to_stored_srid_points():
+    # geoalchemy2 compiles Computed as "AS (...)" without STORED, which MySQL rejects for a
+    # POINT column under a SPATIAL INDEX (see datamodel.generated_point_ddl)
+    checked = 0
+    for table in Base.metadata.sorted_tables:
+        points = [column for column in table.columns if isinstance(column.type, SridPoint) and column.computed is not None]
+        if not points:
+            continue
+        ddl = str(CreateTable(table).compile(dialect=mysql.dialect()))
+        for column in points:
+            expected = (f"{column.name} POINT GENERATED ALWAYS AS ({column.computed.sqltext}) STORED NOT NULL "
+                        f"SRID {POINT_SRID}")
+            assert expected in ddl
+            checked += 1
+    assert checked == 3
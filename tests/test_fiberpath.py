@@ -0,0 +1,14 @@
+# Import packages
+import pandas as pd
+from fiberpath import explode_paths
+
+
+def test_explode_paths_numbers_nodes_per_poi():
+    paths = explode_paths(pd.Series(["p1", "p2", "p3"]), pd.Series(["['a', 'b', \"c\"]", "[]", None]))
+    assert paths.values.tolist() == [["p1", 0, "a"], ["p1", 1, "b"], ["p1", 2, "c"]]
+
+
+def test_explode_paths_keeps_numeric_node_ids_as_strings():
+    paths = explode_paths(pd.Series(["p1"]), pd.Series(["[12, 7]"]))
+    assert paths["node_id"].tolist() == ["12", "7"]
+    assert paths["seq"].tolist() == [0, 1]
@@ -0,0 +1,18 @@
+# Import packages
+from instrumentation import fingerprint
+
+
+def test_fingerprint_replaces_literals_and_placeholders():
+    assert (fingerprint("SELECT * FROM poi WHERE name = 'O\\'Brien' AND x > 1.5e-3 AND y = %s")
+            == "SELECT * FROM poi WHERE name = ? AND x > ? AND y = ?")
+    assert fingerprint("SELECT 'it''s' FROM t WHERE id = :poi_id") == "SELECT ? FROM t WHERE id = ?"
+
+
+def test_fingerprint_collapses_value_lists():
+    assert (fingerprint("INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y'),\n (3, 'z')")
+            == "INSERT INTO t (a, b) VALUES (?)")
+    assert fingerprint("DELETE FROM t WHERE id IN (%s, %s, %s)") == "DELETE FROM t WHERE id IN (?)"
+
+
+def test_fingerprint_keeps_identifiers_with_digits():
+    assert fingerprint("SELECT fiber_length_10km FROM t2") == "SELECT fiber_length_10km FROM t2"
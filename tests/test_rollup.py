@@ -0,0 +1,31 @@
+# Import packages
+import pandas as pd
+import rollup
+
+
+def _capture(admin_rows, technology_rows):
+    # Capture in the shape returned by rollup.capture
+    return {
+        "admin_rollup": pd.DataFrame(
+            admin_rows, columns=rollup.ROLLUP_KEYS["admin_rollup"] + rollup.ROLLUP_VALUES["admin_rollup"]),
+        "admin_technology_rollup": pd.DataFrame(
+            technology_rows,
+            columns=rollup.ROLLUP_KEYS["admin_technology_rollup"] + rollup.ROLLUP_VALUES["admin_technology_rollup"]),
+    }
+
+
+def test_deltas_keep_only_changed_regions():
+    before = _capture([["ESP", "A", "X", "", 2, 1, 1, 0, 2, 30.0], ["ESP", "B", "Y", "", 1, 1, 0, 1, 1, 5.0]],
+                      [["ESP", "A", "X", "an", 1, "Fiber", 2, 3.5]])
+    after = _capture([["ESP", "A", "X", "", 3, 2, 1, 0, 3, 40.0], ["ESP", "B", "Y", "", 1, 1, 0, 1, 1, 5.0]],
+                     [["ESP", "A", "X", "an", 1, "Fiber", 2, 3.5]])
+    changes = rollup.deltas(before, after)
+    assert changes["admin_rollup"].values.tolist() == [["ESP", "A", "X", "", 1, 1, 0, 0, 1, 10.0]]
+    assert len(changes["admin_technology_rollup"]) == 0
+
+
+def test_deltas_of_deleted_pois_are_negative():
+    before = _capture([], [["ESP", "A", "X", "an", 5, "Satellite", 2, 0.0]])
+    changes = rollup.deltas(before, None)
+    assert changes["admin_technology_rollup"].values.tolist() == [["ESP", "A", "X", "an", 5, "Satellite", -2, -0.0]]
+    assert len(changes["admin_rollup"]) == 0
@@ -0,0 +1,53 @@
+# Import packages
+import struct
+import pandas as pd
+from tiles import encode_layer
+
+
+def _read_varint(data, offset):
+    value, shift = 0, 0
+    while True:
+        byte = data[offset]
+        value |= (byte & 0x7F) << shift
+        offset, shift = offset + 1, shift + 7
+        if byte < 0x80:
+            return value, offset
+
+
+def _fields(data):
+    # Decodes one protobuf message into (field number, value) pairs, keeping nested messages as bytes
+    fields, offset = [], 0
+    while offset < len(data):
+        key, offset = _read_varint(data, offset)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, offset = _read_varint(data, offset)
+        elif wire_type == 1:
+            value, offset = struct.unpack("<d", data[offset:offset + 8])[0], offset + 8
+        else:
+            length, offset = _read_varint(data, offset)
+            value, offset = data[offset:offset + length], offset + length
+        fields.append((number, value))
+    return fields
+
+
+def test_encode_layer_writes_points_and_shared_values():
+    features = pd.DataFrame({"px": [1, 4095], "py": [2, 0], "poi_type": ["school", "school"],
+                             "score": [0.5, float("nan")], "count": [-3, 7]})
+    layer = _fields(encode_layer("poi", features, extent=4096))
+
+    assert [value for number, value in layer if number == 15] == [2]
+    assert [value for number, value in layer if number == 1] == [b"poi"]
+    assert [value for number, value in layer if number == 5] == [4096]
+    assert [value for number, value in layer if number == 3] == [b"poi_type", b"score", b"count"]
+    values = [dict(_fields(value)) for number, value in layer if number == 4]
+    assert values == [{1: b"school"}, {3: 0.5}, {6: 5}, {5: 7}]
+
+    features = [dict(_fields(value)) for number, value in layer if number == 2]
+    assert [feature[3] for feature in features] == [1, 1]
+    # MoveTo(1) with zigzag-encoded coordinates
+    assert features[0][4] == bytes([9, 2, 4])
+    assert features[1][4] == bytes([9]) + bytes([0xFE, 0x3F]) + bytes([0])
+    # The missing score of the second feature is left out, the repeated poi_type reuses its value
+    assert list(features[0][2]) == [0, 0, 1, 1, 2, 2]
+    assert list(features[1][2]) == [0, 0, 2, 3]
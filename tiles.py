@@ -0,0 +1,503 @@
+# Import packages
+import os
+import glob
+import json
+import gzip
+import time
+import sqlite3
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+import bundle
+import versions
+
+
+# Layers of the tiles: source table, id column and the columns kept as feature properties.
+# The layer names are also the bundle parts joining each table to an analysis (see bundle.BUNDLE_PARTS).
+TILE_LAYERS = {
+    "pointsofinterest": ("point_of_interest", "poi_id", ["poi_type", "connectivity_type", "is_connected"]),
+    "cellsites": ("cell_site", "ict_id", ["radio_type", "operator_name"]),
+    "transmissionnodes": ("transmission_node", "ict_id", ["transmission_medium", "node_status"]),
+}
+
+# Zoom levels of the pyramid; up to CLUSTER_MAX_ZOOM points are merged into grid clusters
+MIN_ZOOM = 0
+MAX_ZOOM = 14
+CLUSTER_MAX_ZOOM = 10
+
+# Tile coordinate extent and size of the clustering grid cells, both in tile pixels (a 64 x 64 grid per tile)
+TILE_EXTENT = 4096
+CLUSTER_CELL_PX = 64
+
+# Latitude limit of the Web Mercator projection
+MAX_LATITUDE = 85.0511287798
+
+# Directory of the MBTiles files, one per dataset or analysis
+DEFAULT_TILES_DIR = "tiles"
+
+# Geometry command (MoveTo, count 1) and type of point features in Mapbox Vector Tiles
+MVT_MOVE_TO_ONE = 9
+MVT_POINT = 1
+
+
+# Define functions to read the points of a dataset or analysis
+
+
+def tiles_path(tiles_dir=DEFAULT_TILES_DIR, dataset_id=None, analysis_id=None):
+    """Returns the MBTiles file of a dataset or analysis.
+
+    Args:
+        tiles_dir (str, optional): Directory of the MBTiles files. Defaults to DEFAULT_TILES_DIR.
+        dataset_id (str, optional): Dataset identifier.
+        analysis_id (str, optional): Analysis identifier.
+
+    Returns:
+        str: Path of the file.
+    """
+    if (dataset_id is None) == (analysis_id is None):
+        raise ValueError("Exactly one of dataset_id or analysis_id must be given")
+    name = f"dataset-{dataset_id}" if dataset_id is not None else f"analysis-{analysis_id}"
+    return os.path.join(tiles_dir, f"{name}.mbtiles")
+
+
+def to_mercator(lon, lat):
+    """Projects longitudes and latitudes to normalized Web Mercator coordinates.
+
+    Args:
+        lon (numpy.ndarray): Longitudes in degrees.
+        lat (numpy.ndarray): Latitudes in degrees.
+
+    Returns:
+        tuple: x and y arrays in [0, 1), with y growing southwards as in tile coordinates.
+    """
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return np.clip(x, 0.0, np.nextafter(1.0, 0.0)), np.clip(y, 0.0, np.nextafter(1.0, 0.0))
+
+
+def load_layer_points(engine, layer, dataset_id=None, analysis_id=None, layers=TILE_LAYERS):
+    """Reads the locations and properties of the rows of a tile layer.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        layer (str): Layer name (see TILE_LAYERS).
+        dataset_id (str, optional): Only read the rows of this dataset.
+        analysis_id (str, optional): Only read the rows associated with this analysis.
+        layers (dict, optional): Layer definitions. Defaults to TILE_LAYERS.
+
+    Returns:
+        pandas.DataFrame: id, lon, lat and property columns.
+    """
+    table_name, id_column, properties = layers[layer]
+    columns = ", ".join([f"t.`{id_column}` AS id", "t.lon", "t.lat"] + [f"t.`{column}`" for column in properties])
+    if dataset_id is not None:
+        sql_query, params = (f"SELECT {columns} FROM `{table_name}` t WHERE t.dataset_id = :dataset_id",
+                             {"dataset_id": dataset_id})
+    else:
+        sql_query, params = (f"SELECT {columns} FROM `{table_name}` t {bundle.BUNDLE_PARTS[layer][1]}",
+                             {"analysis_id": analysis_id})
+    with engine.connect() as connection:
+        return pd.read_sql(text(sql_query), connection, params=params)
+
+
+def scope_version(engine, dataset_id=None, analysis_id=None, layers=TILE_LAYERS):
+    """Returns the data version of the points of a dataset or analysis.
+
+    The points of an analysis are rows of datasets, which ingests and deletes version as datasets
+    and countries without touching the analysis. The version of an analysis therefore combines its
+    own counter with the counters of every dataset its points come from.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        dataset_id (str, optional): Dataset identifier.
+        analysis_id (str, optional): Analysis identifier.
+        layers (dict, optional): Layer definitions. Defaults to TILE_LAYERS.
+
+    Returns:
+        str: Version, which changes whenever a version counter the points depend on changes.
+    """
+    counters = versions.read_versions(engine)
+    if dataset_id is not None:
+        return str(counters.get(("dataset", dataset_id), 0))
+
+    dataset_ids = set()
+    with engine.connect() as connection:
+        for layer, (table_name, _, _) in layers.items():
+            sql_query = f"SELECT DISTINCT t.dataset_id FROM `{table_name}` t {bundle.BUNDLE_PARTS[layer][1]}"
+            dataset_ids.update(connection.execute(text(sql_query), {"analysis_id": analysis_id}).scalars())
+    scopes = [("analysis", analysis_id)] + [("dataset", str(value)) for value in sorted(dataset_ids)]
+    return json.dumps({f"{scope}:{scope_id}": counters.get((scope, scope_id), 0) for scope, scope_id in scopes})
+
+
+# Define functions to cluster and place points on the tiles of a zoom level
+
+
+def layer_features(points, zoom, cluster_max_zoom=CLUSTER_MAX_ZOOM):
+    """Places the points of a layer on the tiles of a zoom level.
+
+    Up to cluster_max_zoom, the points falling in the same CLUSTER_CELL_PX grid cell are merged
+    into one feature at their centroid, with a point_count property; a cell holding a single point
+    keeps its id and properties. Above it, every point is a feature.
+
+    Args:
+        points (pandas.DataFrame): Points with id, x, y (see to_mercator) and property columns.
+        zoom (int): Zoom level.
+        cluster_max_zoom (int, optional): Highest clustered zoom level. Defaults to CLUSTER_MAX_ZOOM.
+
+    Returns:
+        pandas.DataFrame: tile_x, tile_y, px, py (tile pixels), point_count and property columns.
+    """
+    scale = TILE_EXTENT * 2 ** zoom
+    gx = np.floor(points["x"].to_numpy() * scale).astype(np.int64)
+    gy = np.floor(points["y"].to_numpy() * scale).astype(np.int64)
+    properties = [column for column in points.columns if column not in ("x", "y")]
+
+    if zoom <= cluster_max_zoom:
+        frame = points[properties].assign(gx=gx, gy=gy, cell_x=gx // CLUSTER_CELL_PX, cell_y=gy // CLUSTER_CELL_PX)
+        grouped = frame.groupby(["cell_x", "cell_y"], sort=False)
+        features = grouped[properties].first()
+        features["point_count"] = grouped.size()
+        features["gx"] = np.floor(grouped["gx"].mean()).astype(np.int64)
+        features["gy"] = np.floor(grouped["gy"].mean()).astype(np.int64)
+        features = features.reset_index(drop=True)
+        features.loc[features["point_count"] > 1, properties] = None
+        gx, gy = features.pop("gx").to_numpy(), features.pop("gy").to_numpy()
+    else:
+        features = points[properties].reset_index(drop=True)
+        features["point_count"] = 1
+
+    features.insert(0, "tile_x", gx // TILE_EXTENT)
+    features.insert(1, "tile_y", gy // TILE_EXTENT)
+    features.insert(2, "px", gx % TILE_EXTENT)
+    features.insert(3, "py", gy % TILE_EXTENT)
+    return features
+
+
+def tile_keys(tile_x, tile_y):
+    """Packs tile columns and rows into single integer keys.
+
+    Args:
+        tile_x (numpy.ndarray): Tile columns.
+        tile_y (numpy.ndarray): Tile rows, counted from the north.
+
+    Returns:
+        numpy.ndarray: int64 keys.
+    """
+    return (np.asarray(tile_x, dtype=np.int64) << 32) | np.asarray(tile_y, dtype=np.int64)
+
+
+def tile_hashes(keys, row_hashes):
+    """Combines the hashes of the features of each tile into one hash per tile.
+
+    Args:
+        keys (numpy.ndarray): Tile key of every feature.
+        row_hashes (numpy.ndarray): int64 hash of every feature.
+
+    Returns:
+        dict: Tile key to int64 hash, which only changes when a feature of the tile changes.
+    """
+    if len(keys) == 0:
+        return {}
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    combined = np.bitwise_xor.reduceat(row_hashes[order], starts)
+    return dict(zip(sorted_keys[starts].tolist(), combined.tolist()))
+
+
+# Define functions to encode Mapbox Vector Tiles
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+
+def _length_delimited(number, data):
+    return _field(number, 2) + _varint(len(data)) + data
+
+
+def _encode_value(value):
+    # Value message: string (1), double (3), uint (5), sint (6) or bool (7)
+    if isinstance(value, (bool, np.bool_)):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, (int, np.integer)):
+        value = int(value)
+        return _field(5, 0) + _varint(value) if value >= 0 else _field(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, (float, np.floating)):
+        return _field(3, 1) + np.float64(value).tobytes()
+    return _length_delimited(1, str(value).encode("utf-8"))
+
+
+def encode_layer(name, features, extent=TILE_EXTENT):
+    """Encodes the point features of one tile layer as a vector tile Layer message.
+
+    Args:
+        name (str): Layer name.
+        features (pandas.DataFrame): px, py and property columns; missing properties are left out.
+        extent (int, optional): Tile coordinate extent. Defaults to TILE_EXTENT.
+
+    Returns:
+        bytes: Encoded Layer message.
+    """
+    properties = [column for column in features.columns if column not in ("tile_x", "tile_y", "px", "py")]
+    key_index = {key: i for i, key in enumerate(properties)}
+    values, value_index = [], {}
+    encoded = []
+    for row in zip(features["px"].tolist(), features["py"].tolist(), *[features[key].tolist() for key in properties]):
+        tags = []
+        for key, value in zip(properties, row[2:]):
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                continue
+            value_key = (type(value).__name__, value)
+            if value_key not in value_index:
+                value_index[value_key] = len(values)
+                values.append(_encode_value(value))
+            tags += [key_index[key], value_index[value_key]]
+        geometry = [MVT_MOVE_TO_ONE, _zigzag(int(row[0])), _zigzag(int(row[1]))]
+        feature = (_length_delimited(2, b"".join(_varint(tag) for tag in tags)) + _field(3, 0) + _varint(MVT_POINT)
+                   + _length_delimited(4, b"".join(_varint(command) for command in geometry)))
+        encoded.append(_length_delimited(2, feature))
+
+    return (_field(15, 0) + _varint(2) + _length_delimited(1, name.encode("utf-8")) + b"".join(encoded)
+            + b"".join(_length_delimited(3, key.encode("utf-8")) for key in properties)
+            + b"".join(_length_delimited(4, value) for value in values)
+            + _field(5, 0) + _varint(extent))
+
+
+def encode_tile(layers):
+    """Encodes the layers of a tile as a gzip-compressed Mapbox Vector Tile.
+
+    Args:
+        layers (dict): Layer name to features (see encode_layer); empty layers are left out.
+
+    Returns:
+        bytes: Compressed tile, as stored in MBTiles files.
+    """
+    tile = b"".join(_length_delimited(3, encode_layer(name, features))
+                    for name, features in layers.items() if len(features) > 0)
+    return gzip.compress(tile, mtime=0)
+
+
+# Define functions to build, update and read MBTiles pyramids
+
+
+def open_mbtiles(filepath):
+    """Opens an MBTiles file, creating its tables when needed.
+
+    Besides the standard metadata and tiles tables, the file keeps a hash of the features of
+    every tile, used to rewrite only the tiles whose content changed.
+
+    Args:
+        filepath (str): Path of the .mbtiles file.
+
+    Returns:
+        sqlite3.Connection: Connection to the file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    connection = sqlite3.connect(filepath)
+    connection.executescript(
+        "CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);"
+        "CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,"
+        " PRIMARY KEY (zoom_level, tile_column, tile_row));"
+        "CREATE TABLE IF NOT EXISTS tile_hash (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, hash INTEGER,"
+        " PRIMARY KEY (zoom_level, tile_column, tile_row));")
+    return connection
+
+
+def read_metadata(connection):
+    """Reads the metadata of an MBTiles file.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the file (see open_mbtiles).
+
+    Returns:
+        dict: Metadata names and values.
+    """
+    return dict(connection.execute("SELECT name, value FROM metadata").fetchall())
+
+
+def read_tile(connection, zoom, x, y):
+    """Returns a tile of a pyramid, addressed like web map tile URLs ({z}/{x}/{y}).
+
+    Tiles are stored with TMS rows (counted from the south), as in the MBTiles specification.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the file (see open_mbtiles).
+        zoom (int): Zoom level.
+        x (int): Tile column.
+        y (int): Tile row, counted from the north.
+
+    Returns:
+        bytes: Gzip-compressed vector tile, or None when the tile holds no feature.
+    """
+    row = connection.execute("SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                             (zoom, x, 2 ** zoom - 1 - y)).fetchone()
+    return None if row is None else row[0]
+
+
+def _write_zoom(connection, zoom, features, changed, removed):
+    # Encodes the changed tiles of a zoom level from the features of every layer, sorted by tile key
+    n_tiles = 2 ** zoom
+    sorted_layers = {}
+    for name, frame in features.items():
+        keys = tile_keys(frame["tile_x"], frame["tile_y"])
+        order = np.argsort(keys, kind="stable")
+        sorted_layers[name] = (keys[order], frame.iloc[order].reset_index(drop=True))
+
+    rows = []
+    for key in changed:
+        layers = {}
+        for name, (keys, frame) in sorted_layers.items():
+            start, end = np.searchsorted(keys, key, side="left"), np.searchsorted(keys, key, side="right")
+            layers[name] = frame.iloc[start:end]
+        rows.append((zoom, key >> 32, n_tiles - 1 - (key & 0xFFFFFFFF), encode_tile(layers), changed[key]))
+
+    connection.executemany("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", [row[:4] for row in rows])
+    connection.executemany("INSERT OR REPLACE INTO tile_hash VALUES (?, ?, ?, ?)",
+                           [row[:3] + row[4:] for row in rows])
+    removed_rows = [(zoom, key >> 32, n_tiles - 1 - (key & 0xFFFFFFFF)) for key in removed]
+    for table_name in ("tiles", "tile_hash"):
+        connection.executemany(f"DELETE FROM {table_name} WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                               removed_rows)
+    connection.commit()
+
+
+def build_tiles(engine, filepath, dataset_id=None, analysis_id=None, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM,
+                cluster_max_zoom=CLUSTER_MAX_ZOOM, layers=TILE_LAYERS, force=False):
+    """Builds or updates the vector tile pyramid of a dataset or analysis in an MBTiles file.
+
+    The file records the data version of its scope (see scope_version), so the points are not read
+    when no ingest or delete changed the scope since the last build. Otherwise the points are read
+    once, placed on the tiles of every zoom level (clustered on a grid up to cluster_max_zoom), and a
+    hash of the features of each tile is compared with the stored one: only the tiles whose features
+    changed are encoded and written, and the tiles left empty are deleted.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        filepath (str): Path of the .mbtiles file (see tiles_path).
+        dataset_id (str, optional): Build the tiles of this dataset.
+        analysis_id (str, optional): Build the tiles of the POIs and infrastructure of this analysis.
+        min_zoom (int, optional): Lowest zoom level. Defaults to MIN_ZOOM.
+        max_zoom (int, optional): Highest zoom level. Defaults to MAX_ZOOM.
+        cluster_max_zoom (int, optional): Highest clustered zoom level. Defaults to CLUSTER_MAX_ZOOM.
+        layers (dict, optional): Layer definitions. Defaults to TILE_LAYERS.
+        force (bool, optional): Rebuild every tile, even when the data version did not change. Defaults to False.
+
+    Returns:
+        dict: Number of tiles written, deleted and unchanged.
+    """
+    if (dataset_id is None) == (analysis_id is None):
+        raise ValueError("Exactly one of dataset_id or analysis_id must be given")
+    scope = ("dataset", dataset_id) if dataset_id is not None else ("analysis", analysis_id)
+    settings = json.dumps({"min_zoom": min_zoom, "max_zoom": max_zoom, "cluster_max_zoom": cluster_max_zoom,
+                           "extent": TILE_EXTENT, "cell_px": CLUSTER_CELL_PX, "layers": layers}, sort_keys=True)
+    stats = {"written": 0, "deleted": 0, "unchanged": 0}
+    start_time = time.perf_counter()
+
+    connection = open_mbtiles(filepath)
+    try:
+        metadata = read_metadata(connection)
+        # The version is read before the data, so a concurrent change is picked up by the next build
+        data_version = scope_version(engine, dataset_id, analysis_id, layers)
+        if metadata.get("settings") != settings:
+            force = True
+            connection.execute("DELETE FROM tiles")
+            connection.execute("DELETE FROM tile_hash")
+        elif not force and metadata.get("data_version") == data_version:
+            print(f"{filepath}: up to date (version {data_version})")
+            return stats
+
+        points = {}
+        for layer_index, name in enumerate(layers):
+            frame = load_layer_points(engine, name, dataset_id, analysis_id, layers)
+            frame["x"], frame["y"] = to_mercator(frame.pop("lon").to_numpy(), frame.pop("lat").to_numpy())
+            points[name] = frame
+
+        for zoom in range(min_zoom, max_zoom + 1):
+            features = {name: layer_features(frame, zoom, cluster_max_zoom) for name, frame in points.items()}
+            keys = np.concatenate([tile_keys(frame["tile_x"], frame["tile_y"]) for frame in features.values()])
+            # The layer index is part of each feature hash, so the same feature in two layers does not cancel out
+            row_hashes = np.concatenate([
+                pd.util.hash_pandas_object(frame.assign(layer=layer_index), index=False).to_numpy().view(np.int64)
+                for layer_index, frame in enumerate(features.values())])
+            hashes = tile_hashes(keys, row_hashes)
+
+            n_tiles = 2 ** zoom
+            stored = {(x << 32) | (n_tiles - 1 - row): value for x, row, value in connection.execute(
+                "SELECT tile_column, tile_row, hash FROM tile_hash WHERE zoom_level = ?", (zoom,))}
+            changed = {key: value for key, value in hashes.items() if force or stored.get(key) != value}
+            removed = [key for key in stored if key not in hashes]
+            _write_zoom(connection, zoom, features, changed, removed)
+
+            stats["written"] += len(changed)
+            stats["deleted"] += len(removed)
+            stats["unchanged"] += len(hashes) - len(changed)
+            print(f"{filepath}: zoom {zoom}, {len(changed)} tiles written, {len(removed)} deleted "
+                  f"({time.perf_counter() - start_time:.1f}s)")
+
+        all_points = pd.concat([frame[["x", "y"]] for frame in points.values()])
+        bounds = [-180.0, -MAX_LATITUDE, 180.0, MAX_LATITUDE]
+        if len(all_points) > 0:
+            lon = all_points["x"].to_numpy() * 360.0 - 180.0
+            lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * all_points["y"].to_numpy()))))
+            bounds = [float(lon.min()), float(lat.min()), float(lon.max()), float(lat.max())]
+        vector_layers = [{"id": name, "fields": dict({column: "String" for column in ["id"] + properties},
+                                                     point_count="Number"),
+                          "minzoom": min_zoom, "maxzoom": max_zoom} for name, (_, _, properties) in layers.items()]
+        metadata = {
+            "name": os.path.splitext(os.path.basename(filepath))[0], "format": "pbf", "type": "overlay",
+            "minzoom": str(min_zoom), "maxzoom": str(max_zoom), "bounds": ",".join(f"{value:.6f}" for value in bounds),
+            "json": json.dumps({"vector_layers": vector_layers}), "scope": scope[0], "scope_id": scope[1],
+            "data_version": data_version, "settings": settings,
+        }
+        connection.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)", list(metadata.items()))
+        connection.commit()
+    finally:
+        connection.close()
+    return stats
+
+
+def update_tiles(engine, tiles_dir=DEFAULT_TILES_DIR):
+    """Updates every pyramid of a directory after an ingest or delete.
+
+    Pyramids whose dataset or analysis did not change are skipped after a version lookup (see scope_version).
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        tiles_dir (str, optional): Directory of the MBTiles files. Defaults to DEFAULT_TILES_DIR.
+
+    Returns:
+        dict: Statistics of build_tiles per file.
+    """
+    results = {}
+    for filepath in sorted(glob.glob(os.path.join(tiles_dir, "*.mbtiles"))):
+        connection = sqlite3.connect(filepath)
+        try:
+            metadata = read_metadata(connection)
+        finally:
+            connection.close()
+        scope = {"dataset": "dataset_id", "analysis": "analysis_id"}.get(metadata.get("scope"))
+        if scope is None:
+            continue
+        settings = json.loads(metadata["settings"])
+        results[filepath] = build_tiles(engine, filepath, min_zoom=settings["min_zoom"], max_zoom=settings["max_zoom"],
+                                        cluster_max_zoom=settings["cluster_max_zoom"],
+                                        **{scope: metadata["scope_id"]})
+    return results
@@ -0,0 +1,133 @@
+# Import packages
+import threading
+from datetime import datetime, timezone
+from sqlalchemy import text
+
+
+# Table holding the version counters (see datamodel.DataVersion)
+VERSION_TABLE = "data_version"
+
+# Scope bumped by every write, used by queries that are not restricted to a dataset, analysis or country
+GLOBAL_SCOPE = ("all", "")
+
+# Columns naming a scope, and the scope they map to
+SCOPE_COLUMNS = {"dataset_id": "dataset", "analysis_id": "analysis", "country_code": "country"}
+
+# Number of bumps made by this process; caches compare it to refresh their versions immediately
+_local_generation = 0
+_local_lock = threading.Lock()
+
+
+# Define functions to track data versions per dataset, analysis and country
+
+
+def local_generation():
+    """Returns the number of version bumps made by this process.
+
+    Returns:
+        int: Bump counter.
+    """
+    return _local_generation
+
+
+def collect_scopes(chunk, scopes):
+    """Adds the datasets and countries of a chunk of rows to a scope collection.
+
+    Args:
+        chunk (pandas.DataFrame): Rows being written.
+        scopes (dict): Mapping of scope column (see SCOPE_COLUMNS) to a set of values, updated in place.
+
+    Returns:
+        dict: The updated scopes.
+    """
+    for column in SCOPE_COLUMNS:
+        if column in chunk.columns:
+            scopes.setdefault(column, set()).update(chunk[column].dropna().astype(str).unique())
+    return scopes
+
+
+def track_scopes(chunks, scopes):
+    """Passes chunks through unchanged while collecting their datasets and countries.
+
+    Args:
+        chunks (iterable): DataFrame chunks being written.
+        scopes (dict): Scope collection updated in place (see collect_scopes).
+
+    Yields:
+        pandas.DataFrame: The same chunks.
+    """
+    for chunk in chunks:
+        collect_scopes(chunk, scopes)
+        yield chunk
+
+
+def bump_versions(engine, dataset_ids=(), analysis_ids=(), country_codes=()):
+    """Increments the version counters of the scopes whose data changed, and the global counter.
+
+    Called by the ingest and delete paths after they commit, so that cached query results keyed on
+    older versions are no longer used.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        dataset_ids (iterable, optional): Datasets that changed.
+        analysis_ids (iterable, optional): Analyses that changed.
+        country_codes (iterable, optional): Countries that changed.
+
+    Returns:
+        list: (scope, scope id) pairs bumped.
+    """
+    global _local_generation
+    keys = [GLOBAL_SCOPE]
+    for scope, values in [("dataset", dataset_ids), ("analysis", analysis_ids), ("country", country_codes)]:
+        keys += [(scope, str(value)) for value in sorted(set(values)) if value is not None]
+
+    updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    with engine.begin() as connection:
+        connection.execute(
+            text(f"INSERT INTO {VERSION_TABLE} (scope, scope_id, version, updated_at) "
+                 "VALUES (:scope, :scope_id, 1, :updated_at) "
+                 "ON DUPLICATE KEY UPDATE version = version + 1, updated_at = VALUES(updated_at)"),
+            [{"scope": scope, "scope_id": scope_id, "updated_at": updated_at} for scope, scope_id in keys])
+
+    with _local_lock:
+        _local_generation += 1
+    return keys
+
+
+def read_versions(engine):
+    """Reads every version counter.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+
+    Returns:
+        dict: Mapping of (scope, scope id) to version.
+    """
+    with engine.connect() as connection:
+        rows = connection.execute(text(f"SELECT scope, scope_id, version FROM {VERSION_TABLE}")).all()
+    return {(row.scope, row.scope_id): row.version for row in rows}
+
+
+def country_scopes(connection, country_codes, tables=("point_of_interest", "cell_site", "transmission_node")):
+    """Finds the datasets and analyses that belong to countries.
+
+    Analyses are matched by the country prefix of their identifier (e.g. ESP-1714391188-zq9z).
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Connection to the database.
+        country_codes (iterable): Country codes.
+        tables (tuple, optional): Tables holding dataset_id and country_code columns.
+
+    Returns:
+        tuple: Sets of dataset identifiers and analysis identifiers.
+    """
+    dataset_ids, analysis_ids = set(), set()
+    for country_code in set(country_codes):
+        params = {"country_code": country_code, "prefix": f"{country_code}-%"}
+        for table_name in tables:
+            dataset_ids.update(connection.execute(
+                text(f"SELECT DISTINCT dataset_id FROM {table_name} WHERE country_code = :country_code"),
+                params).scalars().all())
+        analysis_ids.update(connection.execute(
+            text("SELECT analysis_id FROM analysis WHERE analysis_id LIKE :prefix"), params).scalars().all())
+    return dataset_ids, analysis_ids
@@ -0,0 +1,151 @@
+# Import packages
+import re
+import time
+import pandas as pd
+from sqlalchemy import text
+import loader
+import incremental
+import versions
+from datamodel import POINT_SRID
+
+
+# Per-site columns of the *-visibility.csv files, e.g. cellsite_2 or los_geometry_3
+SLOT_COLUMN = re.compile(
+    r"^(cellsite|lat|lon|radio_type|ground_distance|antenna_los_distance|azimuth_angle|los_geometry)_(\d+)$")
+
+# Columns of visibility_link, in insert order
+LINK_COLUMNS = ["poi_id", "rank", "ict_id", "lat", "lon", "radio_type", "ground_distance",
+                "antenna_los_distance", "azimuth_angle", "los_geometry"]
+
+
+# Define functions to load and query POI to cell site visibility links
+
+
+def melt_links(chunk):
+    """Converts the numbered per-site columns of a visibility chunk into one row per visible site.
+
+    Args:
+        chunk (pandas.DataFrame): Rows of a *-visibility.csv file.
+
+    Returns:
+        pandas.DataFrame: LINK_COLUMNS rows, without empty slots.
+    """
+    ranks = sorted({int(match.group(2)) for match in map(SLOT_COLUMN.match, chunk.columns) if match})
+    parts = []
+    for rank in ranks:
+        part = pd.DataFrame({"poi_id": chunk["poi_id"].to_numpy(), "rank": rank})
+        for column in LINK_COLUMNS[2:]:
+            source = f"cellsite_{rank}" if column == "ict_id" else f"{column}_{rank}"
+            part[column] = chunk[source].to_numpy() if source in chunk.columns else None
+        parts.append(part)
+    if len(parts) == 0:
+        return pd.DataFrame(columns=LINK_COLUMNS)
+
+    links = pd.concat(parts, ignore_index=True)
+    return links[links["ict_id"].notna()].reset_index(drop=True)
+
+
+def _link_statement():
+    # Multi-row insert, with the line of sight parsed from WKT in lon/lat order
+    values = ", ".join(
+        f"ST_GeomFromText(%s, {POINT_SRID}, 'axis-order=long-lat')" if column == "los_geometry" else "%s"
+        for column in LINK_COLUMNS)
+    return f"INSERT INTO visibility_link ({loader.quote_columns(LINK_COLUMNS)}) VALUES ({values})"
+
+
+def _delete_links(cursor, poi_ids, batch_size=1000):
+    # Remove the existing links of POIs in bounded IN lists
+    for start in range(0, len(poi_ids), batch_size):
+        batch = poi_ids[start:start + batch_size]
+        cursor.execute(f"DELETE FROM visibility_link WHERE poi_id IN ({', '.join(['%s'] * len(batch))})", batch)
+
+
+def load_visibility(engine, filepath, batch_size=loader.DEFAULT_BATCH_SIZE):
+    """Loads a *-visibility.csv file into visibility_result and visibility_link in one streaming pass.
+
+    Each chunk writes one summary row per POI (id is the POI id) and one link row per visible
+    cell site, with the line of sight stored as a LINESTRING. The links of the POIs in a chunk are
+    replaced in the same transaction, so reloading a file is safe.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        filepath (str): Path to the CSV file.
+        batch_size (int, optional): Number of POIs per chunk and commit. Defaults to loader.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        dict: Number of POI rows and link rows written.
+    """
+    start_time = time.perf_counter()
+    result_types = loader.get_table_columns(engine, "visibility_result")
+    link_statement = _link_statement()
+    stats = {"poi_rows": 0, "link_rows": 0}
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for chunk in loader.iter_csv_chunks(filepath, batch_size):
+            chunk["id"] = chunk["poi_id"]
+            results = loader.coerce_chunk(chunk, result_types)
+            links = melt_links(chunk)
+
+            cursor.executemany(incremental.upsert_statement("visibility_result", list(results.columns), ["id"]),
+                               loader.to_rows(results))
+            _delete_links(cursor, chunk["poi_id"].tolist())
+            if len(links) > 0:
+                cursor.executemany(link_statement, loader.to_rows(links))
+            connection.commit()
+
+            stats["poi_rows"] += len(results)
+            stats["link_rows"] += len(links)
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    versions.bump_versions(engine)
+    print(f"visibility: {stats['poi_rows']} POIs, {stats['link_rows']} links "
+          f"in {time.perf_counter() - start_time:.1f}s")
+    return stats
+
+
+def visible_sites(engine, poi_ids):
+    """Returns the cell sites visible from POIs (primary key lookups).
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        poi_ids (list): POI identifiers.
+
+    Returns:
+        pandas.DataFrame: Link rows ordered by POI and rank, with the line of sight as WKT.
+    """
+    return _read_links(engine, "poi_id", poi_ids)
+
+
+def pois_seeing(engine, ict_ids):
+    """Returns the POIs that see given cell sites (ix_visibility_link_ict lookups).
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine connected to the database.
+        ict_ids (list): Cell site identifiers.
+
+    Returns:
+        pandas.DataFrame: Link rows ordered by cell site and POI, with the line of sight as WKT.
+    """
+    return _read_links(engine, "ict_id", ict_ids)
+
+
+def _read_links(engine, key_column, keys):
+    # Read links for a list of keys, with the LINESTRING converted back to lon/lat WKT
+    keys = list(keys)
+    if len(keys) == 0:
+        return pd.DataFrame(columns=LINK_COLUMNS)
+    columns = ", ".join(
+        "ST_AsText(los_geometry, 'axis-order=long-lat') AS los_geometry" if column == "los_geometry"
+        else f"`{column}`" for column in LINK_COLUMNS)
+    order = "poi_id, `rank`" if key_column == "poi_id" else "ict_id, poi_id"
+    placeholders = ", ".join(f":key_{i}" for i in range(len(keys)))
+    query = text(f"SELECT {columns} FROM visibility_link WHERE {key_column} IN ({placeholders}) ORDER BY {order}")
+    with engine.connect() as connection:
+        return pd.read_sql(query, connection, params={f"key_{i}": key for i, key in enumerate(keys)})